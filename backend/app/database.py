@@ -1,13 +1,18 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from app.config import settings
+from app.utils.metrics import metered_pool
 
 engine = create_engine(
     settings.DATABASE_URL,
     pool_pre_ping=True,
     pool_size=10,
-    max_overflow=20
+    max_overflow=20,
+    poolclass=metered_pool(QueuePool, "sync"),
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -15,6 +20,31 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+def _async_database_url(url: str) -> str:
+    """Same database as DATABASE_URL, through the asyncpg driver."""
+    parsed = make_url(url).set(drivername="postgresql+asyncpg")
+    # asyncpg takes "ssl" instead of libpq's "sslmode"
+    if "sslmode" in parsed.query:
+        query = dict(parsed.query)
+        query["ssl"] = query.pop("sslmode")
+        parsed = parsed.set(query=query)
+    return parsed.render_as_string(hide_password=False)
+
+
+# Async engine for the non-blocking routes (punch, listings, stats). Face recognition and
+# export still use the sync engine above, from worker threads.
+async_engine = create_async_engine(
+    settings.ASYNC_DATABASE_URL or _async_database_url(settings.DATABASE_URL),
+    pool_pre_ping=True,
+    pool_size=10,
+    max_overflow=20,
+    poolclass=metered_pool(AsyncAdaptedQueuePool, "async"),
+)
+
+# expire_on_commit=False: attributes stay readable after commit without implicit (blocking) IO
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
 def get_db():
     """Dependency for getting database session"""
     db = SessionLocal()
@@ -22,3 +52,9 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    """Dependency for getting an async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,27 +1,38 @@
-from fastapi import FastAPI
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import text
 from app.config import settings
-from app.database import engine, Base
+from app.database import engine, async_engine
 from app.routes import api_router
+from app.startup import on_startup
+from app.utils.admission import AdmissionMiddleware
+from app.utils.metrics import MetricsMiddleware, instrument_engine, metrics_payload, METRICS_CONTENT_TYPE
+from app.utils.profiling import ProfilingMiddleware
+
+# Schema changes are not applied here: run `python -m scripts.migrate` before starting workers.
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
 
-# Ensure user_number column exists (for DBs created before it was added)
-try:
-    with engine.begin() as conn:
-        conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS user_number INTEGER UNIQUE"))
-except Exception:
-    pass  # Column may already exist or table not created yet
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    on_startup(_IMPORT_SECONDS, _IMPORT_STARTED)
+    yield
+
 
 # Create FastAPI app
 app = FastAPI(
     title="Face Authentication Attendance System",
     description="A production-ready face authentication based attendance system",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
+# Per-class concurrency/queue limits with fast 503s (innermost, so 503s get CORS headers and metrics)
+app.add_middleware(AdmissionMiddleware)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -29,8 +40,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After", "Idempotent-Replayed"],  # read by the frontend (shed / replayed requests)
 )
 
+# Per-stage timings -> Prometheus histograms + Server-Timing header (outside CORS, so it sees CORS
+# too; only ProfilingMiddleware, added below, wraps it)
+app.add_middleware(MetricsMiddleware)
+instrument_engine(engine, "sync")
+instrument_engine(async_engine.sync_engine, "async")
+
+# Opt-in request profiling (X-Profile + admin token, or PROFILING_SAMPLE_RATE)
+app.add_middleware(ProfilingMiddleware)
+
 # Include routers
 app.include_router(api_router, prefix=settings.API_V1_PREFIX)
 
@@ -44,6 +65,15 @@ def root():
     }
 
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus metrics (stage latencies, match outcomes, DB pool, gallery size)"""
+    return Response(content=metrics_payload(), media_type=METRICS_CONTENT_TYPE)
+
+
 @app.get("/health")
 def health_check():
     return {"status": "healthy"}
+
+
+_IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
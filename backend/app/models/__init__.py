@@ -1,4 +1,7 @@
 from app.models.user import User
 from app.models.attendance import Attendance
+from app.models.attendance_daily import AttendanceDaily
+from app.models.idempotency_key import IdempotencyKey
+from app.models.registration_job import RegistrationJob
 
-__all__ = ["User", "Attendance"]
+__all__ = ["User", "Attendance", "AttendanceDaily", "IdempotencyKey", "RegistrationJob"]
@@ -0,0 +1,24 @@
+from sqlalchemy import Column, DateTime, String, ForeignKey, Integer
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class AttendanceDaily(Base):
+    """
+    Per-user, per-day rollup of completed attendance sessions.
+    Maintained by AttendanceService.punch_out in the same transaction; rebuild with
+    scripts/rebuild_attendance_daily.py.
+    """
+    __tablename__ = "attendance_daily"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("app_users.user_id"), primary_key=True)
+    date = Column(String(10), primary_key=True, index=True)  # "YYYY-MM-DD", same as Attendance.date
+    session_count = Column(Integer, nullable=False, default=0)
+    total_seconds = Column(Integer, nullable=False, default=0)
+    first_in = Column(DateTime(timezone=True), nullable=True)
+    last_out = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<AttendanceDaily(user_id={self.user_id}, date={self.date}, total_seconds={self.total_seconds})>"
@@ -0,0 +1,21 @@
+from sqlalchemy import Column, DateTime, Integer, String, Text
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class IdempotencyKey(Base):
+    """
+    Outcome of a request sent with an Idempotency-Key header (punch, authenticate), so a
+    retry gets the same response from any worker. status_code is NULL while the first request
+    is still running. Rows expire after IDEMPOTENCY_TTL_SECONDS; see IdempotencyService.
+    """
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String(300), primary_key=True)  # "<endpoint>:<client key>"
+    request_hash = Column(String(64), nullable=False)  # sha256 of the request body
+    status_code = Column(Integer, nullable=True)
+    response_body = Column(Text, nullable=True)  # JSON
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<IdempotencyKey(key={self.key}, status_code={self.status_code})>"
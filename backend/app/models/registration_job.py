@@ -0,0 +1,26 @@
+from sqlalchemy import Column, DateTime, Integer, String, Text
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+import uuid
+from app.database import Base
+
+
+class RegistrationJob(Base):
+    """
+    A registration accepted with 202 and processed in the background (encoding, duplicate
+    check, insert); polled by any worker through GET /auth/register/jobs/{job_id}.
+    status: queued -> running -> succeeded | failed. See RegistrationJobService.
+    """
+    __tablename__ = "registration_jobs"
+
+    job_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    status = Column(String(20), nullable=False, default="queued")
+    username = Column(String(100), nullable=False)
+    message = Column(Text, nullable=True)  # outcome, or why it failed
+    user_id = Column(UUID(as_uuid=True), nullable=True)  # the registered user once succeeded
+    user_number = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<RegistrationJob(job_id={self.job_id}, status={self.status})>"
@@ -1,9 +1,15 @@
-from sqlalchemy import Column, String, DateTime, Text, Integer
+from sqlalchemy import BigInteger, Column, String, DateTime, Text, Integer, Sequence
 from sqlalchemy.dialects.postgresql import UUID, ARRAY
 from sqlalchemy.sql import func
+from sqlalchemy.orm import deferred
 import uuid
 from app.database import Base
 
+template_version_seq = Sequence("template_version_seq", metadata=Base.metadata)
+# Transaction advisory lock held from taking a templates_version until commit, so versions
+# become visible in order (see FaceService.adapt_templates)
+TEMPLATE_VERSION_LOCK = 0x7465_6D70
+
 
 class User(Base):
     # Use a non-reserved table name to avoid conflicts with
@@ -13,7 +19,14 @@ class User(Base):
     user_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
     user_number = Column(Integer, unique=True, nullable=True, index=True)  # Small ID 1, 2, 3... (order of registration)
     username = Column(String(100), nullable=False, index=True)  # No longer unique: same name allowed
-    face_encodings = Column(ARRAY(Text), nullable=False)  # Store multiple encodings as JSON strings
+    # Store multiple encodings as JSON strings (~10 KB per user). Deferred: only the recognition
+    # and registration paths load it, via undefer() or by selecting the column directly.
+    face_encodings = deferred(Column(ARRAY(Text), nullable=False))
+    # Encodings learned from confident, liveness-checked authentications (oldest first), bounded
+    # by FACE_MAX_TEMPLATES_PER_USER together with face_encodings. Registration encodings are never evicted.
+    adapted_encodings = deferred(Column(ARRAY(Text), nullable=False, default=list, server_default="{}"))
+    # Set from template_version_seq whenever adapted_encodings changes, so workers can pick up changes
+    templates_version = Column(BigInteger, nullable=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
     def __repr__(self):
@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from app.routes import auth, attendance, users, export
+from app.routes import auth, attendance, users, export, stats, profiles
 
 api_router = APIRouter()
 
@@ -7,3 +7,5 @@ api_router.include_router(auth.router, prefix="/auth", tags=["authentication"])
 api_router.include_router(users.router, prefix="/users", tags=["users"])
 api_router.include_router(attendance.router, prefix="/attendance", tags=["attendance"])
 api_router.include_router(export.router, prefix="/export", tags=["export"])
+api_router.include_router(stats.router, prefix="/stats", tags=["stats"])
+api_router.include_router(profiles.router, prefix="/admin/profiles", tags=["admin"])
@@ -1,8 +1,13 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import contains_eager
 from typing import List, Optional
-from app.database import get_db
+from datetime import date as date_type
+from app.database import get_async_db
 from app.services.attendance_service import AttendanceService
+from app.services.data_version_service import DataVersionService
+from app.utils.conditional import not_modified
 from app.schemas.attendance import AttendanceResponse
 from app.models.user import User
 from app.models.attendance import Attendance
@@ -11,9 +16,9 @@ router = APIRouter()
 
 
 @router.get("/", response_model=List[AttendanceResponse])
-def get_all_attendance(limit: int = 100, db: Session = Depends(get_db)):
+async def get_all_attendance(limit: int = 100, db: AsyncSession = Depends(get_async_db)):
     """Get all attendance records"""
-    records = AttendanceService.get_all_attendance(db, limit)
+    records = await AttendanceService.get_all_attendance(db, limit)
     # Convert to response format with username
     result = []
     for record in records:
@@ -31,9 +36,14 @@ def get_all_attendance(limit: int = 100, db: Session = Depends(get_db)):
 
 
 @router.get("/today", response_model=List[AttendanceResponse])
-def get_today_attendance(db: Session = Depends(get_db)):
-    """Get today's attendance records"""
-    records = AttendanceService.get_today_attendance(db)
+async def get_today_attendance(request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+    """Get today's attendance records. Supports If-None-Match."""
+    cached = not_modified(
+        request, response, await DataVersionService.etag(db, "attendance-today", date_type.today().isoformat())
+    )
+    if cached:
+        return cached
+    records = await AttendanceService.get_today_attendance(db)
     result = []
     for record in records:
         result.append({
@@ -50,15 +60,15 @@ def get_today_attendance(db: Session = Depends(get_db)):
 
 
 @router.get("/by-date", response_model=List[AttendanceResponse])
-def get_attendance_by_date(date: str, limit: int = 500, db: Session = Depends(get_db)):
+async def get_attendance_by_date(date: str, limit: int = 500, db: AsyncSession = Depends(get_async_db)):
     """Get all attendance records for a specific date (YYYY-MM-DD)."""
-    records = (
-        db.query(Attendance)
-        .join(User)
-        .filter(Attendance.date == date)
+    records = await db.scalars(
+        select(Attendance)
+        .join(Attendance.user)
+        .options(contains_eager(Attendance.user))
+        .where(Attendance.date == date)
         .order_by(Attendance.created_at.desc())
         .limit(limit)
-        .all()
     )
 
     result = []
@@ -77,7 +87,7 @@ def get_attendance_by_date(date: str, limit: int = 500, db: Session = Depends(ge
 
 
 @router.get("/user/{user_id}", response_model=List[AttendanceResponse])
-def get_user_attendance(user_id: str, limit: int = 100, db: Session = Depends(get_db)):
+async def get_user_attendance(user_id: str, limit: int = 100, db: AsyncSession = Depends(get_async_db)):
     """Get attendance records for a specific user"""
     from uuid import UUID
     try:
@@ -85,11 +95,13 @@ def get_user_attendance(user_id: str, limit: int = 100, db: Session = Depends(ge
     except ValueError:
         return []
     
-    records = AttendanceService.get_user_attendance(db, user_uuid, limit)
-    # Load user for each record
+    records = await AttendanceService.get_user_attendance(db, user_uuid, limit)
+    # All records belong to the same user: load it once
+    user = (await db.execute(
+        select(User.user_number, User.username).where(User.user_id == user_uuid)
+    )).first()
     result = []
     for record in records:
-        user = db.query(User).filter(User.user_id == record.user_id).first()
         result.append({
             "attendance_id": record.attendance_id,
             "user_id": record.user_id,
@@ -104,35 +116,48 @@ def get_user_attendance(user_id: str, limit: int = 100, db: Session = Depends(ge
 
 
 @router.get("/daily-summary")
-def get_daily_summary(date: str, db: Session = Depends(get_db)):
-    """Get per-user daily summary for a date (YYYY-MM-DD): sessions and total active duration."""
+async def get_daily_summary(date: str, request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+    """Get per-user daily summary for a date (YYYY-MM-DD): sessions and total active duration. Supports If-None-Match."""
     if not date or len(date) != 10:
         return {"date": date, "summaries": []}
-    summaries = AttendanceService.get_daily_summary(db, date)
+    cached = not_modified(request, response, await DataVersionService.etag(db, "daily-summary", date))
+    if cached:
+        return cached
+    summaries = await AttendanceService.get_daily_summary(db, date)
     return {"date": date, "summaries": summaries}
 
 
+@router.get("/report")
+async def get_range_report(start_date: str, end_date: str, db: AsyncSession = Depends(get_async_db)):
+    """
+    Per-user attendance between start_date and end_date (YYYY-MM-DD, inclusive), for monthly / payroll reports.
+    Read from the attendance_daily rollup, so cost grows with users x days, not with raw punches.
+    """
+    if len(start_date) != 10 or len(end_date) != 10:
+        return {"start_date": start_date, "end_date": end_date, "users": []}
+    users = await AttendanceService.get_range_report(db, start_date, end_date)
+    return {"start_date": start_date, "end_date": end_date, "users": users}
+
+
 @router.get("/user-number/{user_number}", response_model=List[AttendanceResponse])
-def get_user_attendance_by_number(
+async def get_user_attendance_by_number(
     user_number: int,
     limit: int = 200,
     date: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Get attendance records for a user by small User ID (user_number). Optionally filter by date (YYYY-MM-DD)."""
-    user = db.query(User).filter(User.user_number == user_number).first()
+    user = (await db.execute(
+        select(User.user_id, User.user_number, User.username).where(User.user_number == user_number)
+    )).first()
     if not user:
         return []
 
-    q = (
-        db.query(Attendance)
-        .join(User)
-        .filter(Attendance.user_id == user.user_id)
-    )
+    q = select(Attendance).where(Attendance.user_id == user.user_id)
     if date:
-        q = q.filter(Attendance.date == date)
+        q = q.where(Attendance.date == date)
 
-    records = q.order_by(Attendance.created_at.desc()).limit(limit).all()
+    records = await db.scalars(q.order_by(Attendance.created_at.desc()).limit(limit))
 
     result = []
     for record in records:
@@ -1,15 +1,78 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+import asyncio
+import hashlib
+import json
+import time
+from uuid import UUID
+from fastapi import APIRouter, Depends, Header, HTTPException, UploadFile, File, Form, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.database import get_db
-from app.services.face_service import FaceService
+from app.config import settings
+from app.database import get_db, get_async_db
 from app.services.attendance_service import AttendanceService
+from app.services.idempotency_service import IdempotencyService
+from app.services.punch_batch_service import PunchBatchService
+from app.services.registration_job_service import FINISHED, RegistrationJobService
+from app.models.registration_job import RegistrationJob
 from app.schemas.auth import FaceAuthResponse
 from app.schemas.attendance import AttendancePunch
-from typing import Tuple, Optional
+from app.utils.metrics import IDEMPOTENCY_REQUESTS, record_authentication, record_match_outcome
+from app.utils.profiling import profiled_call, profiled_thread
+from app.utils.quality import QualityController, QualityLevel
+from typing import Any, Awaitable, Callable, Tuple, Optional
 
 router = APIRouter()
 
 
+async def _idempotent(
+    endpoint: str, client_key: Optional[str], request_hash: str, handler: Callable[[], Awaitable[Any]]
+) -> Any:
+    """
+    Run handler at most once per Idempotency-Key (kiosks retry on flaky networks). A replay
+    of the same request gets the stored response with an Idempotent-Replayed header, from any
+    worker; a replay while the first is still running gets 409. 4xx outcomes are stored too;
+    5xx, unexpected errors and cancellation (client hung up) release the key so the retry
+    executes again.
+    """
+    if not client_key:
+        return await handler()
+    if len(client_key) > 255:
+        raise HTTPException(status_code=400, detail="Idempotency-Key must be at most 255 characters")
+
+    key = f"{endpoint}:{client_key}"
+    stored = await IdempotencyService.claim(key, request_hash)
+    if stored is not None:
+        stored_hash, status_code, body = stored
+        if stored_hash != request_hash:
+            IDEMPOTENCY_REQUESTS.labels(endpoint=endpoint, result="mismatch").inc()
+            raise HTTPException(status_code=422, detail="This Idempotency-Key was already used for a different request")
+        if status_code is None:
+            IDEMPOTENCY_REQUESTS.labels(endpoint=endpoint, result="in_progress").inc()
+            raise HTTPException(
+                status_code=409, detail="A request with this Idempotency-Key is still in progress", headers={"Retry-After": "1"}
+            )
+        IDEMPOTENCY_REQUESTS.labels(endpoint=endpoint, result="replayed").inc()
+        return JSONResponse(content=body, status_code=status_code, headers={"Idempotent-Replayed": "true"})
+
+    IDEMPOTENCY_REQUESTS.labels(endpoint=endpoint, result="executed").inc()
+    try:
+        result = await handler()
+    except HTTPException as e:
+        if e.status_code < 500:
+            await IdempotencyService.complete(key, request_hash, e.status_code, {"detail": e.detail})
+        else:
+            await IdempotencyService.release(key)
+        raise
+    except BaseException:
+        # Shielded: on cancellation the release must still run
+        await asyncio.shield(IdempotencyService.release(key))
+        raise
+    await IdempotencyService.complete(key, request_hash, 200, jsonable_encoder(result))
+    return result
+
+
 @router.post("/register", response_model=dict)
 async def register_user(
     username: str = Form(...),
@@ -21,6 +84,8 @@ async def register_user(
     Register a new user with face images.
     Requires 3-4 face images from different angles.
     Optional: user_id (unique UUID) - if not provided, one is auto-generated.
+    With REGISTRATION_ASYNC (default) answers 202 with a job id at once; the faces are encoded
+    in the background and the outcome is read from GET /auth/register/jobs/{job_id}.
     """
     if len(files) < 3 or len(files) > 4:
         raise HTTPException(
@@ -43,7 +108,6 @@ async def register_user(
         face_images.append(image_bytes)
     
     # Parse optional user_id (UUID string)
-    from uuid import UUID
     parsed_user_id = None
     if user_id and user_id.strip():
         try:
@@ -51,9 +115,28 @@ async def register_user(
         except ValueError:
             raise HTTPException(status_code=400, detail="user_id must be a valid UUID")
     
-    # Register user
-    success, message, user = FaceService.register_user_faces(
-        db, username, face_images, user_id=parsed_user_id
+    if settings.REGISTRATION_ASYNC:
+        job = await RegistrationJobService.submit(username, face_images, user_id=parsed_user_id)
+        if job is None:
+            retry_after = RegistrationJobService.retry_after()
+            raise HTTPException(
+                status_code=503,
+                detail=f"Too many registrations in progress, please retry in {retry_after} s.",
+                headers={"Retry-After": str(retry_after)},
+            )
+        status_url = f"{settings.API_V1_PREFIX}/auth/register/jobs/{job.job_id}"
+        return JSONResponse(
+            status_code=202,
+            content={"job_id": str(job.job_id), "status": job.status, "status_url": status_url},
+            headers={"Location": status_url},
+        )
+
+    # Register user (CPU-bound encoding + sync DB: run off the event loop).
+    # Imported here so workers only load face_recognition/dlib when they recognize faces.
+    from app.services.face_service import FaceService
+
+    success, message, user = await run_in_threadpool(
+        profiled_call, FaceService.register_user_faces, db, username, face_images, user_id=parsed_user_id
     )
     
     if not success:
@@ -68,59 +151,238 @@ async def register_user(
     }
 
 
+def _job_response(job: RegistrationJob) -> dict:
+    """Job state; once finished, success/message/user fields as the synchronous register response."""
+    return {
+        "job_id": str(job.job_id),
+        "status": job.status,
+        "success": None if job.status not in FINISHED else job.status == "succeeded",
+        "message": job.message,
+        "user_id": str(job.user_id) if job.user_id else None,
+        "user_number": job.user_number,
+        "username": job.username,
+    }
+
+
+@router.get("/register/jobs/{job_id}", response_model=dict)
+async def get_registration_job(job_id: UUID):
+    """
+    State of a registration accepted with 202: queued, running, succeeded or failed.
+    Poll until it is finished (or use the WebSocket below).
+    """
+    job = await RegistrationJobService.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Registration job not found")
+    return _job_response(job)
+
+
+@router.websocket("/register/jobs/{job_id}/ws")
+async def registration_job_updates(websocket: WebSocket, job_id: UUID):
+    """Push the job state whenever it changes; closes once the job is finished."""
+    await websocket.accept()
+    last = None
+    try:
+        while True:
+            job = await RegistrationJobService.get(job_id)
+            if job is None:
+                await websocket.send_json({"detail": "Registration job not found"})
+                break
+            if job.status != last:
+                await websocket.send_json(_job_response(job))
+                last = job.status
+            if job.status in FINISHED:
+                break
+            await asyncio.sleep(settings.REGISTRATION_JOB_PUSH_INTERVAL_SECONDS)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
+
+@router.get("/capture-profile", response_model=dict)
+async def capture_profile():
+    """
+    Upload modes accepted by /authenticate and the capture parameters of the roi mode
+    (downscaled frames + face crops), so clients capture at the resolution the server uses.
+    """
+    return {
+        "modes": ["full", "roi"] if settings.CAPTURE_ROI_ENABLED else ["full"],
+        "frame_max_side": settings.CAPTURE_FRAME_MAX_SIDE,
+        "roi_size": settings.CAPTURE_ROI_SIZE,
+        "roi_margin": settings.CAPTURE_ROI_MARGIN,
+        "jpeg_quality": settings.CAPTURE_JPEG_QUALITY,
+    }
+
+
+async def _read_images(files: list[UploadFile]) -> list[bytes]:
+    """Bytes of uploaded images; 400 for non-images or empty files."""
+    images = []
+    for f in files:
+        ct = getattr(f, "content_type", None) or ""
+        if ct and not ct.startswith("image/"):
+            raise HTTPException(status_code=400, detail="All files must be images")
+        b = await f.read()
+        if not b:
+            raise HTTPException(status_code=400, detail="One or more image files are empty")
+        images.append(b)
+    return images
+
+
+def _parse_boxes(boxes: Optional[str], count: int) -> list[Tuple[int, int, int, int]]:
+    """roi mode boxes: JSON list of [x, y, width, height] (frame pixels), one per frame."""
+    try:
+        parsed = [tuple(int(v) for v in box) for box in json.loads(boxes or "")]
+    except (ValueError, TypeError):
+        parsed = None
+    if parsed is None or len(parsed) != count or any(len(box) != 4 for box in parsed):
+        raise HTTPException(
+            status_code=400, detail="boxes must be a JSON list of [x, y, width, height], one per frame"
+        )
+    return parsed
+
+
 @router.post("/authenticate", response_model=FaceAuthResponse)
 async def authenticate_face(
     files: list[UploadFile] = File(...),
-    db: Session = Depends(get_db)
+    faces: list[UploadFile] = File([]),
+    boxes: Optional[str] = Form(None),
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None),
+    x_auth_attempt: Optional[int] = Header(None),
 ):
     """
     Authenticate a face and return user information.
     - Single image: face match only (no spoof check).
-    - 3+ images: spoof prevention (liveness) is run first; then face match on last frame.
+    - 3+ images: spoof prevention (liveness) is run first; then face match on the best-quality
+      frame (or the fused best AUTH_FUSION_FRAMES frames). Frames that are too blurred,
+      dark/bright or with too small a face are not encoded.
+    - roi mode (see GET /capture-profile): files are downscaled frames, faces the matching face
+      crops and boxes where each crop was cut from; liveness uses the frames, recognition the crop.
+    - Idempotency-Key header: a retry with the same frames returns the first result without recognizing again.
+    - X-Auth-Attempt header: the client's attempt number for this login (1 = first try); a
+      successful login records attempt - 1 as its retry count.
     """
     if not files:
         raise HTTPException(status_code=400, detail="At least one image is required")
 
     # Read all images
-    image_bytes_list = []
-    for f in files:
-        ct = getattr(f, "content_type", None) or ""
-        if ct and not ct.startswith("image/"):
-            raise HTTPException(status_code=400, detail="All files must be images")
-        b = await f.read()
-        if not b:
-            raise HTTPException(status_code=400, detail="One or more image files are empty")
-        image_bytes_list.append(b)
+    image_bytes_list = await _read_images(files)
+    crops, parsed_boxes = None, None
+    if faces:
+        if not settings.CAPTURE_ROI_ENABLED:
+            raise HTTPException(status_code=400, detail="The roi upload mode is disabled; send full frames only")
+        crops = await _read_images(faces)
+        if len(crops) != len(image_bytes_list):
+            raise HTTPException(status_code=400, detail="Send one face crop per frame")
+        parsed_boxes = _parse_boxes(boxes, len(image_bytes_list))
+
+    digest = hashlib.sha256()
+    for b in image_bytes_list + (crops or []):
+        digest.update(hashlib.sha256(b).digest())
+    digest.update((boxes or "").encode())
+    return await _idempotent(
+        "authenticate",
+        idempotency_key,
+        digest.hexdigest(),
+        lambda: _authenticate(image_bytes_list, db, crops, parsed_boxes, x_auth_attempt),
+    )
+
+
+class _ThreadCpu:
+    """CPU seconds used by the threadpool calls of one request (time.thread_time in the worker thread)."""
+
+    def __init__(self):
+        self.seconds = 0.0
+
+    async def run(self, func: Callable[..., Any], *args) -> Any:
+        result, seconds = await run_in_threadpool(_thread_cpu, func, *args)
+        self.seconds += seconds
+        return result
+
+
+def _thread_cpu(func: Callable[..., Any], *args) -> Tuple[Any, float]:
+    with profiled_thread():
+        start = time.thread_time()
+        result = func(*args)
+        return result, time.thread_time() - start
+
+
+async def _authenticate(
+    image_bytes_list: list,
+    db: Session,
+    crops: Optional[list] = None,
+    boxes: Optional[list] = None,
+    attempt: Optional[int] = None,
+) -> FaceAuthResponse:
+    """Liveness (for 3+ frames) and recognition for authenticate_face (crops/boxes: roi mode)."""
+    # Encoding effort for this request, lowered while this worker is overloaded
+    quality = QualityController.current()
+    fusion_frames = quality.fusion_frames if len(image_bytes_list) > 1 else 1
+    cpu = _ThreadCpu()
+    response = await _recognize(image_bytes_list, db, crops, boxes, quality, fusion_frames, cpu)
+    record_authentication(response.success, attempt, cpu.seconds, fusion_frames)
+    return response
 
+
+async def _recognize(
+    image_bytes_list: list,
+    db: Session,
+    crops: Optional[list],
+    boxes: Optional[list],
+    quality: QualityLevel,
+    fusion_frames: int,
+    cpu: _ThreadCpu,
+) -> FaceAuthResponse:
     # Single image: no spoof check (backward compatible)
     if len(image_bytes_list) == 1:
-        image_bytes = image_bytes_list[0]
+        face_image = crops[0] if crops else image_bytes_list[0]
     else:
         # Multiple images: run spoof prevention (liveness)
-        from app.utils.spoof_prevention import check_liveness_sequence
+        from app.utils.spoof_prevention import check_liveness_roi, check_liveness_sequence
 
         if len(image_bytes_list) < 3:
             raise HTTPException(
                 status_code=400,
                 detail="For liveness check please provide at least 3 frames (capture a short sequence)."
             )
-        liveness_passed, last_frame_bytes = check_liveness_sequence(image_bytes_list)
-        if not liveness_passed or last_frame_bytes is None:
+        if crops:
+            liveness_passed, ranked_frames, rejection = await cpu.run(
+                check_liveness_roi, image_bytes_list, crops, boxes
+            )
+        else:
+            liveness_passed, ranked_frames, rejection = await cpu.run(check_liveness_sequence, image_bytes_list)
+        if rejection is not None:
+            # Faces were seen but no frame is usable: say why instead of a doomed encode
+            record_match_outcome("low_quality")
+            return FaceAuthResponse(success=False, message=rejection, confidence=0.0, quality=quality.name)
+        if not liveness_passed or not ranked_frames:
+            record_match_outcome("liveness_failed")
             return FaceAuthResponse(
                 success=False,
                 message="Liveness check failed. Please try again with a live face (move slightly or blink).",
                 confidence=0.0,
+                quality=quality.name,
             )
-        image_bytes = last_frame_bytes
+        # Best frame, or the best fusion_frames frames to encode together and fuse
+        face_image = ranked_frames[0] if fusion_frames == 1 else ranked_frames[:fusion_frames]
 
-    # Face authentication
-    success, user, confidence, message = FaceService.authenticate_face(db, image_bytes)
+    # Face authentication (CPU-bound encoding + sync DB: run off the event loop)
+    from app.services.face_service import FaceService
+
+    # Only liveness-checked frames may extend the user's stored encodings
+    try:
+        success, user, confidence, message = await cpu.run(
+            FaceService.authenticate_face, db, face_image, len(image_bytes_list) > 1, quality, bool(crops)
+        )
+    except Exception as e:
+        # Not an outcome of the match (e.g. database down): 5xx, so an Idempotency-Key retry runs again
+        raise HTTPException(status_code=500, detail=f"Error authenticating face: {str(e)}")
 
     if not success:
         return FaceAuthResponse(
             success=False,
             message=message,
             confidence=0.0,
+            quality=quality.name,
         )
 
     return FaceAuthResponse(
@@ -129,17 +391,20 @@ async def authenticate_face(
         username=user.username,
         confidence=confidence,
         message=message,
+        quality=quality.name,
     )
 
 
 @router.post("/punch", response_model=dict)
 async def punch_attendance(
     request: AttendancePunch,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    idempotency_key: Optional[str] = Header(None),
 ):
     """
     Punch in or punch out for attendance.
     Requires user_id and action ("punch_in" or "punch_out").
+    Idempotency-Key header: a retry returns the first response instead of "already punched in".
     """
     if request.action not in ["punch_in", "punch_out"]:
         raise HTTPException(
@@ -147,10 +412,23 @@ async def punch_attendance(
             detail="Action must be 'punch_in' or 'punch_out'"
         )
     
-    if request.action == "punch_in":
-        success, message, attendance = AttendanceService.punch_in(db, request.user_id)
-    else:
-        success, message, attendance = AttendanceService.punch_out(db, request.user_id)
+    request_hash = hashlib.sha256(f"{request.user_id}:{request.action}".encode()).hexdigest()
+    return await _idempotent("punch", idempotency_key, request_hash, lambda: _punch(request, db))
+
+
+async def _punch(request: AttendancePunch, db: AsyncSession) -> dict:
+    try:
+        if settings.PUNCH_BATCHING:
+            # Group commit with other punches of this worker (uses its own session; db stays unused)
+            success, message, attendance = await PunchBatchService.submit(request.user_id, request.action)
+        elif request.action == "punch_in":
+            success, message, attendance = await AttendanceService.punch_in(db, request.user_id)
+        else:
+            success, message, attendance = await AttendanceService.punch_out(db, request.user_id)
+    except Exception as e:
+        # Not a refused punch (e.g. database down): 5xx, so an Idempotency-Key retry runs again
+        action = "in" if request.action == "punch_in" else "out"
+        raise HTTPException(status_code=500, detail=f"Error punching {action}: {str(e)}")
     
     if not success:
         raise HTTPException(status_code=400, detail=message)
@@ -1,70 +1,253 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, HTTPException
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
-from typing import Optional
-from datetime import datetime
-import pandas as pd
+from typing import Iterator, List, Optional
+from datetime import date, datetime
+import csv
 import io
-from app.database import get_db
+import zlib
+from app.database import SessionLocal
 from app.services.attendance_service import AttendanceService
-from app.models.attendance import Attendance
-from app.models.user import User
+from app.utils.profiling import profiled_iter
 
 router = APIRouter()
 
+# Rows fetched per server-side cursor round trip (and written per response chunk)
+EXPORT_BATCH_SIZE = 1000
+
+# Rows per Parquet row group / Arrow record batch
+EXPORT_ROW_GROUP_SIZE = 65536
+
+CSV_COLUMNS = ["user_number", "user_id", "username", "date", "punch_in", "punch_out", "total_duration"]
+
+
+def _iter_export_rows(start_date: Optional[str], end_date: Optional[str]) -> Iterator[tuple]:
+    """
+    Stream projected attendance rows through a server-side cursor.
+    Owns its session so the cursor stays open for as long as the response is being sent.
+    """
+    db = SessionLocal()
+    try:
+        statement = AttendanceService.export_query(start_date, end_date)
+        for row in db.execute(statement.execution_options(yield_per=EXPORT_BATCH_SIZE)):
+            yield row
+    finally:
+        db.close()
+
+
+def _iter_csv(rows: Iterator[tuple]) -> Iterator[str]:
+    """Render rows as CSV text, one chunk per EXPORT_BATCH_SIZE rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(CSV_COLUMNS)
+    pending = 0
+    for user_number, user_id, username, day, punch_in, punch_out, total_duration in rows:
+        writer.writerow([
+            user_number if user_number is not None else "",
+            str(user_id),
+            username,
+            day,
+            punch_in.isoformat() if punch_in else "",
+            punch_out.isoformat() if punch_out else "",
+            total_duration or "00:00:00",
+        ])
+        pending += 1
+        if pending >= EXPORT_BATCH_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            pending = 0
+    yield buffer.getvalue()
+
+
+def _gzip_chunks(chunks: Iterator[str]) -> Iterator[bytes]:
+    """Compress text chunks into a single gzip stream as they are produced."""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class _ChunkSink:
+    """
+    Write-only file object for pyarrow writers that hands out what has been written so far.
+    Keeps a running position so Parquet footer offsets stay correct after draining.
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _require_pyarrow():
+    """Import pyarrow or fail the request with 501 if it is not installed."""
+    try:
+        import pyarrow
+        return pyarrow
+    except ImportError:
+        raise HTTPException(status_code=501, detail="Columnar export requires pyarrow to be installed")
+
+
+def _arrow_schema(pa):
+    return pa.schema([
+        pa.field("user_number", pa.int32()),
+        pa.field("user_id", pa.string(), nullable=False),
+        pa.field("username", pa.dictionary(pa.int32(), pa.string()), nullable=False),
+        pa.field("date", pa.date32(), nullable=False),
+        pa.field("punch_in", pa.timestamp("us", tz="UTC")),
+        pa.field("punch_out", pa.timestamp("us", tz="UTC")),
+        pa.field("duration_seconds", pa.int64()),
+    ])
+
+
+def _iter_record_batches(pa, schema, rows: Iterator[tuple]):
+    """Group rows into typed Arrow record batches of EXPORT_ROW_GROUP_SIZE rows."""
+    columns = [[] for _ in schema.names]
+
+    def build():
+        arrays = [
+            pa.array(values, type=field.type.value_type).dictionary_encode()
+            if pa.types.is_dictionary(field.type)
+            else pa.array(values, type=field.type)
+            for field, values in zip(schema, columns)
+        ]
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    for user_number, user_id, username, day, punch_in, punch_out, _ in rows:
+        columns[0].append(user_number)
+        columns[1].append(str(user_id))
+        columns[2].append(username)
+        columns[3].append(date.fromisoformat(day))
+        columns[4].append(punch_in)
+        columns[5].append(punch_out)
+        # Same whole-second truncation as AttendanceService.calculate_duration
+        columns[6].append(int((punch_out - punch_in).total_seconds()) if punch_in and punch_out else None)
+        if len(columns[0]) >= EXPORT_ROW_GROUP_SIZE:
+            yield build()
+            columns = [[] for _ in schema.names]
+    if columns[0]:
+        yield build()
+
+
+def _iter_parquet(pa, rows: Iterator[tuple]) -> Iterator[bytes]:
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(pa)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        for batch in _iter_record_batches(pa, schema, rows):
+            writer.write_batch(batch, row_group_size=EXPORT_ROW_GROUP_SIZE)
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def _iter_arrow_ipc(pa, rows: Iterator[tuple]) -> Iterator[bytes]:
+    schema = _arrow_schema(pa)
+    sink = _ChunkSink()
+    writer = pa.ipc.new_stream(sink, schema, options=pa.ipc.IpcWriteOptions(compression="zstd"))
+    try:
+        for batch in _iter_record_batches(pa, schema, rows):
+            writer.write_batch(batch)
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
 
 @router.get("/csv")
 def export_attendance_csv(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    db: Session = Depends(get_db)
+    gzip: bool = False,
 ):
     """
     Export attendance data to CSV.
-    Optional query parameters: start_date and end_date (YYYY-MM-DD format)
+    Optional query parameters: start_date and end_date (YYYY-MM-DD format).
+    Set gzip=true to download a compressed .csv.gz instead.
+    Rows are streamed from the database, so memory use does not grow with the export size.
     """
     try:
-        # Get all attendance records
-        query = db.query(Attendance).join(User)
-        
-        # Filter by date range if provided
-        if start_date:
-            query = query.filter(Attendance.date >= start_date)
-        if end_date:
-            query = query.filter(Attendance.date <= end_date)
-        
-        records = query.order_by(Attendance.date.desc(), Attendance.created_at.desc()).all()
-        
-        # Prepare data for CSV
-        data = []
-        for record in records:
-            data.append({
-                "user_number": record.user.user_number if record.user and record.user.user_number is not None else "",
-                "user_id": str(record.user_id),
-                "username": record.user.username,
-                "date": record.date,
-                "punch_in": record.punch_in_time.isoformat() if record.punch_in_time else "",
-                "punch_out": record.punch_out_time.isoformat() if record.punch_out_time else "",
-                "total_duration": record.total_duration or "00:00:00"
-            })
-        
-        # Create DataFrame
-        df = pd.DataFrame(data)
-        
-        # Convert to CSV
-        output = io.StringIO()
-        df.to_csv(output, index=False)
-        output.seek(0)
-        
+        chunks = _iter_csv(_iter_export_rows(start_date, end_date))
+
         # Create filename with timestamp
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"attendance_export_{timestamp}.csv"
-        
+
+        if gzip:
+            return StreamingResponse(
+                profiled_iter(_gzip_chunks(chunks)),
+                media_type="application/gzip",
+                headers={"Content-Disposition": f"attachment; filename={filename}.gz"}
+            )
+
         return StreamingResponse(
-            iter([output.getvalue()]),
+            profiled_iter(chunks),
             media_type="text/csv",
             headers={"Content-Disposition": f"attachment; filename={filename}"}
         )
-    
+
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error exporting CSV: {str(e)}")
+
+
+@router.get("/parquet")
+def export_attendance_parquet(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+):
+    """
+    Export attendance data as Parquet for payroll / BI jobs.
+    Same filters as /csv. Typed columns (date, UTC timestamps, integer duration_seconds,
+    dictionary-encoded username), written one row group at a time.
+    """
+    pa = _require_pyarrow()
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return StreamingResponse(
+        profiled_iter(_iter_parquet(pa, _iter_export_rows(start_date, end_date))),
+        media_type="application/vnd.apache.parquet",
+        headers={"Content-Disposition": f"attachment; filename=attendance_export_{timestamp}.parquet"}
+    )
+
+
+@router.get("/arrow")
+def export_attendance_arrow(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+):
+    """
+    Export attendance data as an Arrow IPC stream (same schema and filters as /parquet).
+    """
+    pa = _require_pyarrow()
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return StreamingResponse(
+        profiled_iter(_iter_arrow_ipc(pa, _iter_export_rows(start_date, end_date))),
+        media_type="application/vnd.apache.arrow.stream",
+        headers={"Content-Disposition": f"attachment; filename=attendance_export_{timestamp}.arrows"}
+    )
@@ -0,0 +1,31 @@
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import FileResponse
+from typing import Optional
+from app.utils.profiling import is_admin, list_profiles, profile_path
+
+router = APIRouter()
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Profiles expose code paths and timings, so they are admin-only"""
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+@router.get("/", dependencies=[Depends(require_admin)])
+def get_profiles():
+    """
+    List stored request profiles (newest first) with their request metadata.
+    A request is profiled when sent with X-Profile: 1 and X-Admin-Token, or when
+    sampled by PROFILING_SAMPLE_RATE; its id is returned in the X-Profile-Id header.
+    """
+    return list_profiles()
+
+
+@router.get("/{profile_id}", dependencies=[Depends(require_admin)])
+def download_profile(profile_id: str):
+    """Download a profile as speedscope JSON (open it at https://www.speedscope.app)"""
+    path = profile_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/json", filename=path.name)
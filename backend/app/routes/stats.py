@@ -0,0 +1,21 @@
+from fastapi import APIRouter, Depends, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import date
+from app.database import get_async_db
+from app.services.stats_service import StatsService
+from app.services.data_version_service import DataVersionService
+from app.utils.conditional import not_modified
+
+router = APIRouter()
+
+
+@router.get("/today")
+async def get_today_stats(request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+    """
+    Dashboard counters for today: total users, attendance records, present, active, punched out, absent.
+    Computed in one query and cached for a few seconds (STATS_CACHE_TTL_SECONDS). Supports If-None-Match.
+    """
+    cached = not_modified(request, response, await DataVersionService.etag(db, "stats-today", date.today().isoformat()))
+    if cached:
+        return cached
+    return await StatsService.get_today_stats(db)
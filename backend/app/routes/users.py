@@ -1,22 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select
 from typing import List
-from app.database import get_db
+from app.database import get_async_db
 from app.models.user import User
 from app.schemas.user import UserResponse
+from app.services.data_version_service import DataVersionService
+from app.utils.conditional import not_modified
 
 router = APIRouter()
 
 
 @router.get("/", response_model=List[UserResponse])
-def get_all_users(db: Session = Depends(get_db)):
-    """Get all registered users"""
-    users = db.query(User).all()
+async def get_all_users(request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+    """Get all registered users (only the UserResponse columns are selected). Supports If-None-Match."""
+    cached = not_modified(request, response, await DataVersionService.etag(db, "users"))
+    if cached:
+        return cached
+    users = (await db.execute(select(User.user_id, User.user_number, User.username, User.created_at))).all()
     return users
 
 
 @router.get("/{user_id}", response_model=UserResponse)
-def get_user(user_id: str, db: Session = Depends(get_db)):
+async def get_user(user_id: str, db: AsyncSession = Depends(get_async_db)):
     """Get a specific user by ID"""
     from uuid import UUID
     try:
@@ -24,14 +30,17 @@ def get_user(user_id: str, db: Session = Depends(get_db)):
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid user ID format")
     
-    user = db.query(User).filter(User.user_id == user_uuid).first()
+    user = (await db.execute(
+        select(User.user_id, User.user_number, User.username, User.created_at)
+        .where(User.user_id == user_uuid)
+    )).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
 
 @router.get("/count/total")
-def get_total_users(db: Session = Depends(get_db)):
+async def get_total_users(db: AsyncSession = Depends(get_async_db)):
     """Get total number of registered users"""
-    count = db.query(User).count()
+    count = await db.scalar(select(func.count(User.user_id)))
     return {"total_users": count}
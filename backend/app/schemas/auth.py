@@ -13,3 +13,4 @@ class FaceAuthResponse(BaseModel):
     username: Optional[str] = None
     confidence: Optional[float] = None
     message: str
+    quality: Optional[str] = None  # Recognition quality level used: full | reduced | minimal
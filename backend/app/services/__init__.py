@@ -1,4 +1,21 @@
-from app.services.face_service import FaceService
-from app.services.attendance_service import AttendanceService
+# Resolved on first access (see app.utils): FaceService pulls in face_recognition/dlib.
+from importlib import import_module
 
-__all__ = ["FaceService", "AttendanceService"]
+_EXPORTS = {
+    "FaceService": "app.services.face_service",
+    "GalleryService": "app.services.gallery_service",
+    "AttendanceService": "app.services.attendance_service",
+    "StatsService": "app.services.stats_service",
+    "DataVersionService": "app.services.data_version_service",
+    "IdempotencyService": "app.services.idempotency_service",
+    "PunchBatchService": "app.services.punch_batch_service",
+    "RegistrationJobService": "app.services.registration_job_service",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(import_module(_EXPORTS[name]), name)
@@ -1,26 +1,17 @@
 from typing import Optional, List, Tuple, Dict, Any
 from datetime import datetime, date, timezone
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import contains_eager
+from sqlalchemy import and_, delete, func, select
+from sqlalchemy.dialects.postgresql import JSON, aggregate_order_by, insert
 from app.models.attendance import Attendance
+from app.models.attendance_daily import AttendanceDaily
 from app.models.user import User
+from app.services.stats_service import StatsService
+from app.services.data_version_service import DataVersionService
 from uuid import UUID
 
 
-def _parse_duration_hhmmss(s: Optional[str]) -> int:
-    """Parse 'HH:MM:SS' to total seconds. Returns 0 if invalid or None."""
-    if not s or not isinstance(s, str):
-        return 0
-    parts = s.strip().split(":")
-    if len(parts) != 3:
-        return 0
-    try:
-        h, m, sec = int(parts[0]), int(parts[1]), int(parts[2])
-        return h * 3600 + m * 60 + sec
-    except ValueError:
-        return 0
-
-
 def _seconds_to_hhmmss(total_seconds: int) -> str:
     """Convert total seconds to 'HH:MM:SS'."""
     total_seconds = max(0, int(total_seconds))
@@ -53,23 +44,19 @@ class AttendanceService:
         return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
     
     @staticmethod
-    def punch_in(db: Session, user_id: UUID) -> Tuple[bool, str, Optional[Attendance]]:
+    async def punch_in(db: AsyncSession, user_id: UUID) -> Tuple[bool, str, Optional[Attendance]]:
         """
         Record punch-in for a user.
-        Returns (success, message, attendance_record)
+        Returns (success, message, attendance_record). Database errors are raised (after a
+        rollback), so callers can tell them from a refused punch.
         """
         try:
             today = date.today().isoformat()
             
             # Block only if there's an open session (punched in but not out). Multiple in/out per day allowed.
-            existing = db.query(Attendance).filter(
-                and_(
-                    Attendance.user_id == user_id,
-                    Attendance.date == today,
-                    Attendance.punch_in_time.isnot(None),
-                    Attendance.punch_out_time.is_(None)
-                )
-            ).first()
+            existing = await db.scalar(
+                AttendanceService._open_session_query(user_id, today).with_only_columns(Attendance.attendance_id)
+            )
             
             if existing:
                 return False, "You have already punched in today. Please punch out first.", None
@@ -82,33 +69,32 @@ class AttendanceService:
             )
             
             db.add(attendance)
-            db.commit()
-            db.refresh(attendance)
+            await db.commit()
+            StatsService.invalidate()
+            await DataVersionService.bump(db)
+            await db.refresh(attendance)
             
             return True, "Punch-in successful", attendance
         
-        except Exception as e:
-            db.rollback()
-            return False, f"Error punching in: {str(e)}", None
+        except Exception:
+            await db.rollback()
+            raise
     
     @staticmethod
-    def punch_out(db: Session, user_id: UUID) -> Tuple[bool, str, Optional[Attendance]]:
+    async def punch_out(db: AsyncSession, user_id: UUID) -> Tuple[bool, str, Optional[Attendance]]:
         """
         Record punch-out for a user.
-        Returns (success, message, attendance_record)
+        Returns (success, message, attendance_record). Database errors are raised (after a
+        rollback), so callers can tell them from a refused punch.
         """
         try:
             today = date.today().isoformat()
             
-            # Find today's punch-in record
-            attendance = db.query(Attendance).filter(
-                and_(
-                    Attendance.user_id == user_id,
-                    Attendance.date == today,
-                    Attendance.punch_in_time.isnot(None),
-                    Attendance.punch_out_time.is_(None)
-                )
-            ).first()
+            # Find today's punch-in record. Locked: a concurrent punch-out (kiosk retry, another
+            # worker) waits here and then finds the session closed, so it is rolled up only once
+            attendance = await db.scalar(
+                AttendanceService._open_session_query(user_id, today).with_for_update()
+            )
             
             if not attendance:
                 return False, "No punch-in found for today. Please punch in first.", None
@@ -119,73 +105,267 @@ class AttendanceService:
                 attendance.punch_in_time,
                 attendance.punch_out_time
             )
+            await AttendanceService._add_session_to_rollup(db, attendance)
             
-            db.commit()
-            db.refresh(attendance)
+            await db.commit()
+            StatsService.invalidate()
+            await DataVersionService.bump(db)
+            await db.refresh(attendance)
             
             return True, "Punch-out successful", attendance
         
-        except Exception as e:
-            db.rollback()
-            return False, f"Error punching out: {str(e)}", None
+        except Exception:
+            await db.rollback()
+            raise
     
     @staticmethod
-    def get_all_attendance(db: Session, limit: int = 100) -> List[Attendance]:
+    def _open_session_query(user_id: UUID, day: str):
+        """Select the user's open session (punched in, not out) for a day. At most one exists."""
+        return select(Attendance).where(
+            and_(
+                Attendance.user_id == user_id,
+                Attendance.date == day,
+                Attendance.punch_in_time.isnot(None),
+                Attendance.punch_out_time.is_(None)
+            )
+        ).limit(1)
+
+    @staticmethod
+    async def _add_session_to_rollup(db: AsyncSession, attendance: Attendance) -> None:
+        """Fold a just-closed session into attendance_daily (caller commits)."""
+        await AttendanceService.upsert_rollup(db, [AttendanceService.rollup_row(attendance)])
+
+    @staticmethod
+    def rollup_row(attendance: Attendance) -> Dict[str, Any]:
+        """attendance_daily contribution of one closed session."""
+        punch_in = attendance.punch_in_time
+        punch_out = attendance.punch_out_time
+        if punch_in.tzinfo is None:
+            punch_in = punch_in.replace(tzinfo=timezone.utc)
+        return {
+            "user_id": attendance.user_id,
+            "date": attendance.date,
+            "session_count": 1,
+            "total_seconds": max(0, int((punch_out - punch_in).total_seconds())),
+            "first_in": punch_in,
+            "last_out": punch_out,
+        }
+
+    @staticmethod
+    async def upsert_rollup(db: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+        """
+        Add rollup_row()-shaped contributions to attendance_daily in one statement. At most one
+        row per (user_id, date): merge sessions of the same day before calling. Caller commits.
+        """
+        stmt = insert(AttendanceDaily).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[AttendanceDaily.user_id, AttendanceDaily.date],
+            set_={
+                "session_count": AttendanceDaily.session_count + stmt.excluded.session_count,
+                "total_seconds": AttendanceDaily.total_seconds + stmt.excluded.total_seconds,
+                "first_in": func.least(AttendanceDaily.first_in, stmt.excluded.first_in),
+                "last_out": func.greatest(AttendanceDaily.last_out, stmt.excluded.last_out),
+                "updated_at": func.now(),
+            },
+        )
+        await db.execute(stmt)
+
+    @staticmethod
+    async def rebuild_daily_rollup(db: AsyncSession, start_date: Optional[str] = None, end_date: Optional[str] = None) -> int:
+        """
+        Recompute attendance_daily from raw attendance rows (all dates, or an inclusive YYYY-MM-DD range).
+        Returns the number of rollup rows written. Caller commits.
+        """
+        delete_stmt = delete(AttendanceDaily)
+        if start_date:
+            delete_stmt = delete_stmt.where(AttendanceDaily.date >= start_date)
+        if end_date:
+            delete_stmt = delete_stmt.where(AttendanceDaily.date <= end_date)
+        await db.execute(delete_stmt)
+
+        closed = and_(Attendance.punch_in_time.isnot(None), Attendance.punch_out_time.isnot(None))
+        grouped = (
+            select(
+                Attendance.user_id,
+                Attendance.date,
+                func.count().label("session_count"),
+                func.sum(
+                    func.floor(func.extract("epoch", Attendance.punch_out_time - Attendance.punch_in_time))
+                ).label("total_seconds"),
+                func.min(Attendance.punch_in_time).label("first_in"),
+                func.max(Attendance.punch_out_time).label("last_out"),
+            )
+            .where(closed)
+            .group_by(Attendance.user_id, Attendance.date)
+        )
+        if start_date:
+            grouped = grouped.where(Attendance.date >= start_date)
+        if end_date:
+            grouped = grouped.where(Attendance.date <= end_date)
+
+        result = await db.execute(
+            insert(AttendanceDaily).from_select(
+                ["user_id", "date", "session_count", "total_seconds", "first_in", "last_out"],
+                grouped,
+            )
+        )
+        return result.rowcount
+
+    @staticmethod
+    async def get_range_report(db: AsyncSession, start_date: str, end_date: str) -> List[Dict[str, Any]]:
+        """
+        Per-user attendance between two dates (inclusive, YYYY-MM-DD), read from attendance_daily.
+        Only completed sessions are counted. Each user gets one entry per day present plus range totals.
+        """
+        rows = (await db.execute(
+            select(
+                User.user_id,
+                User.user_number,
+                User.username,
+                AttendanceDaily.date,
+                AttendanceDaily.session_count,
+                AttendanceDaily.total_seconds,
+                AttendanceDaily.first_in,
+                AttendanceDaily.last_out,
+            )
+            .join(AttendanceDaily, AttendanceDaily.user_id == User.user_id)
+            .where(AttendanceDaily.date >= start_date, AttendanceDaily.date <= end_date)
+            .order_by(User.user_number.asc().nulls_last(), User.user_id, AttendanceDaily.date)
+        )).all()
+        result: List[Dict[str, Any]] = []
+        current: Optional[Dict[str, Any]] = None
+        for row in rows:
+            if current is None or current["user_id"] != row.user_id:
+                if current is not None:
+                    current["total_duration"] = _seconds_to_hhmmss(current.pop("total_seconds"))
+                current = {
+                    "user_id": row.user_id,
+                    "user_number": row.user_number,
+                    "username": row.username,
+                    "days_present": 0,
+                    "session_count": 0,
+                    "total_seconds": 0,
+                    "days": [],
+                }
+                result.append(current)
+            current["days"].append({
+                "date": row.date,
+                "session_count": row.session_count,
+                "total_duration": _seconds_to_hhmmss(row.total_seconds),
+                "first_in": row.first_in,
+                "last_out": row.last_out,
+            })
+            current["days_present"] += 1
+            current["session_count"] += row.session_count
+            current["total_seconds"] += row.total_seconds
+        if current is not None:
+            current["total_duration"] = _seconds_to_hhmmss(current.pop("total_seconds"))
+        return result
+
+    @staticmethod
+    async def get_all_attendance(db: AsyncSession, limit: int = 100) -> List[Attendance]:
         """Get all attendance records with user information"""
-        return db.query(Attendance).join(User).order_by(Attendance.created_at.desc()).limit(limit).all()
+        result = await db.scalars(
+            select(Attendance)
+            .join(Attendance.user)
+            .options(contains_eager(Attendance.user))
+            .order_by(Attendance.created_at.desc())
+            .limit(limit)
+        )
+        return list(result)
     
     @staticmethod
-    def get_user_attendance(db: Session, user_id: UUID, limit: int = 100) -> List[Attendance]:
+    async def get_user_attendance(db: AsyncSession, user_id: UUID, limit: int = 100) -> List[Attendance]:
         """Get attendance records for a specific user"""
-        return db.query(Attendance).filter(
-            Attendance.user_id == user_id
-        ).order_by(Attendance.created_at.desc()).limit(limit).all()
+        result = await db.scalars(
+            select(Attendance)
+            .where(Attendance.user_id == user_id)
+            .order_by(Attendance.created_at.desc())
+            .limit(limit)
+        )
+        return list(result)
     
     @staticmethod
-    def get_today_attendance(db: Session) -> List[Attendance]:
+    def export_query(start_date: Optional[str] = None, end_date: Optional[str] = None):
+        """
+        Projected select for attendance exports (no ORM objects, no face encodings).
+        Optional start_date / end_date (YYYY-MM-DD) bound the range inclusively.
+        """
+        query = select(
+            User.user_number,
+            Attendance.user_id,
+            User.username,
+            Attendance.date,
+            Attendance.punch_in_time,
+            Attendance.punch_out_time,
+            Attendance.total_duration,
+        ).select_from(Attendance).join(User, Attendance.user_id == User.user_id)
+        if start_date:
+            query = query.where(Attendance.date >= start_date)
+        if end_date:
+            query = query.where(Attendance.date <= end_date)
+        return query.order_by(Attendance.date.desc(), Attendance.created_at.desc())
+
+    @staticmethod
+    async def get_today_attendance(db: AsyncSession) -> List[Attendance]:
         """Get all attendance records for today"""
         today = date.today().isoformat()
-        return db.query(Attendance).join(User).filter(
-            Attendance.date == today
-        ).order_by(Attendance.created_at.desc()).all()
+        result = await db.scalars(
+            select(Attendance)
+            .join(Attendance.user)
+            .options(contains_eager(Attendance.user))
+            .where(Attendance.date == today)
+            .order_by(Attendance.created_at.desc())
+        )
+        return list(result)
 
     @staticmethod
-    def get_daily_summary(db: Session, target_date: str) -> List[Dict[str, Any]]:
+    async def get_daily_summary(db: AsyncSession, target_date: str) -> List[Dict[str, Any]]:
         """
         For a given date (YYYY-MM-DD), return per-user summary: sessions and total active duration.
         Total = sum of all session durations (punch_out - punch_in) for that user on that day.
+        Grouping, session lists and totals are computed in one SQL query.
         """
-        records = (
-            db.query(Attendance)
-            .join(User)
-            .filter(Attendance.date == target_date)
-            .order_by(User.user_number, Attendance.punch_in_time)
-            .all()
+        # Whole seconds per session, truncated like calculate_duration; open sessions count as 0
+        session_seconds = func.floor(
+            func.extract("epoch", Attendance.punch_out_time - Attendance.punch_in_time)
         )
-        # Group by user_id
-        by_user: Dict[UUID, Dict[str, Any]] = {}
-        for r in records:
-            u = r.user
-            if r.user_id not in by_user:
-                by_user[r.user_id] = {
-                    "user_id": r.user_id,
-                    "user_number": u.user_number if u else None,
-                    "username": u.username if u else "Unknown",
-                    "sessions": [],
-                    "total_duration_seconds": 0,
-                }
-            sess = {
-                "punch_in_time": r.punch_in_time,
-                "punch_out_time": r.punch_out_time,
-                "duration": r.total_duration or "00:00:00",
+        session = func.json_build_object(
+            "punch_in_time", Attendance.punch_in_time,
+            "punch_out_time", Attendance.punch_out_time,
+            "duration", func.coalesce(Attendance.total_duration, "00:00:00"),
+        )
+        rows = (await db.execute(
+            select(
+                User.user_id,
+                User.user_number,
+                User.username,
+                func.json_agg(aggregate_order_by(session, Attendance.punch_in_time), type_=JSON).label("sessions"),
+                func.coalesce(func.sum(session_seconds), 0).label("total_seconds"),
+            )
+            .join(Attendance, Attendance.user_id == User.user_id)
+            .where(Attendance.date == target_date)
+            .group_by(User.user_id, User.user_number, User.username)
+            .order_by(User.user_number.asc().nulls_last(), User.user_id)
+        )).all()
+
+        def _ts(value: Optional[str]) -> Optional[datetime]:
+            return datetime.fromisoformat(value) if value else None
+
+        return [
+            {
+                "user_id": row.user_id,
+                "user_number": row.user_number,
+                "username": row.username,
+                "sessions": [
+                    {
+                        "punch_in_time": _ts(sess["punch_in_time"]),
+                        "punch_out_time": _ts(sess["punch_out_time"]),
+                        "duration": sess["duration"],
+                    }
+                    for sess in row.sessions
+                ],
+                "total_duration": _seconds_to_hhmmss(row.total_seconds),
             }
-            by_user[r.user_id]["sessions"].append(sess)
-            by_user[r.user_id]["total_duration_seconds"] += _parse_duration_hhmmss(r.total_duration)
-
-        result = []
-        for uid, data in by_user.items():
-            data["total_duration"] = _seconds_to_hhmmss(data["total_duration_seconds"])
-            del data["total_duration_seconds"]
-            result.append(data)
-        result.sort(key=lambda x: (x["user_number"] is None, x["user_number"] or 0))
-        return result
+            for row in rows
+        ]
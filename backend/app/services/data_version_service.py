@@ -0,0 +1,56 @@
+import hashlib
+import logging
+from sqlalchemy import Sequence, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.database import Base
+
+# Bumped after every write that changes what the read endpoints return (punches, registrations).
+# A sequence rather than a counter row: nextval never blocks concurrent writers and is visible
+# to every worker immediately, without waiting for the writer's transaction.
+data_version_seq = Sequence("data_version_seq", metadata=Base.metadata)
+
+_BUMP = text("SELECT nextval('data_version_seq')")
+# last_value stays at the start value until the first nextval (only is_called flips), so count that too
+_CURRENT = text("SELECT last_value + is_called::int FROM data_version_seq")
+
+logger = logging.getLogger(__name__)
+
+
+class DataVersionService:
+    """Global data version used to build ETags for conditional GETs"""
+
+    @staticmethod
+    async def bump(db: AsyncSession) -> None:
+        """
+        Advance the version. Call after the write has committed; a failure is logged, not raised,
+        so a committed write is never reported as failed.
+        """
+        try:
+            await db.execute(_BUMP)
+        except Exception as e:
+            await db.rollback()
+            logger.warning("Write committed but the data version bump failed (%s)", e.__class__.__name__)
+
+    @staticmethod
+    def bump_sync(db: Session) -> None:
+        """bump() for code running on the sync engine (registration, scripts)."""
+        try:
+            db.execute(_BUMP)
+        except Exception as e:
+            db.rollback()
+            logger.warning("Write committed but the data version bump failed (%s)", e.__class__.__name__)
+
+    @staticmethod
+    async def current(db: AsyncSession) -> int:
+        return (await db.execute(_CURRENT)).scalar()
+
+    @staticmethod
+    async def etag(db: AsyncSession, scope: str, *parts) -> str:
+        """
+        Weak ETag for a read endpoint: current data version plus whatever else shapes the
+        response (e.g. the date or limit). Read the version BEFORE querying the data, so a
+        response can never carry a newer version than its content.
+        """
+        key = ":".join([scope, str(await DataVersionService.current(db)), *map(str, parts)])
+        return f'W/"{hashlib.sha1(key.encode()).hexdigest()[:20]}"'
@@ -1,14 +1,21 @@
-from typing import List, Optional, Tuple
+from typing import List, Optional, Tuple, Union
 from uuid import UUID
 import numpy as np
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
-from app.models.user import User
+from app.models.user import TEMPLATE_VERSION_LOCK, User, template_version_seq
 from app.utils.face_recognition_utils import (
     encode_face_image_robust,
-    match_face,
-    check_duplicate_face,
-    encode_to_string
+    encode_face_images,
+    encode_to_string,
+    fuse_encodings,
+    string_to_encoding
 )
+from app.services.gallery_service import GalleryService, GalleryState, match_decision
+from app.services.stats_service import StatsService
+from app.utils.metrics import TEMPLATE_UPDATES, timed, record_match_outcome
+from app.utils.quality import QualityLevel
+from app.services.data_version_service import DataVersionService
 from app.config import settings
 
 
@@ -30,55 +37,80 @@ class FaceService:
             Tuple of (success, message, user_object)
         """
         try:
-            # Validate number of images
-            if len(face_images) < settings.MIN_FACE_IMAGES_REQUIRED:
-                return False, f"At least {settings.MIN_FACE_IMAGES_REQUIRED} face images required", None
-            
-            if len(face_images) > settings.MAX_FACE_IMAGES_REQUIRED:
-                return False, f"Maximum {settings.MAX_FACE_IMAGES_REQUIRED} face images allowed", None
-            
-            # Assign next user_number (small ID 1, 2, 3... in registration order)
-            from sqlalchemy import func
-            next_number = db.query(func.coalesce(func.max(User.user_number), 0)).scalar() + 1
-            
+            success, message, encodings = FaceService.encode_registration_images(face_images)
+            if not success:
+                return False, message, None
+            if FaceService.is_registered_face(GalleryService.current(db), encodings):
+                return False, "This face is already registered. Please use a different person.", None
+            return FaceService.save_registered_user(db, username, encodings, user_id=user_id)
+        except Exception as e:
+            db.rollback()
+            return False, f"Error registering user: {str(e)}", None
+
+    @staticmethod
+    def encode_registration_images(face_images: List[bytes]) -> Tuple[bool, str, List[np.ndarray]]:
+        """
+        Validate the image count and encode every image (the slow part of registration; no DB).
+        Returns (success, error message, encodings).
+        """
+        # Validate number of images
+        if len(face_images) < settings.MIN_FACE_IMAGES_REQUIRED:
+            return False, f"At least {settings.MIN_FACE_IMAGES_REQUIRED} face images required", []
+        
+        if len(face_images) > settings.MAX_FACE_IMAGES_REQUIRED:
+            return False, f"Maximum {settings.MAX_FACE_IMAGES_REQUIRED} face images allowed", []
+        
+        # Encode all face images (robust: try original + enhanced, better encoding)
+        encodings = []
+        for idx, image_bytes in enumerate(face_images):
+            encoding = encode_face_image_robust(image_bytes)
+            if encoding is None:
+                return False, f"Failed to detect face in image {idx + 1}. Please ensure face is clearly visible.", []
+            encodings.append(encoding)
+        return True, "", encodings
+
+    @staticmethod
+    def is_registered_face(gallery: GalleryState, encodings: List[np.ndarray]) -> bool:
+        """
+        Duplicate check (prevent same person registering twice).
+        Require MULTIPLE images to match (not just one) to avoid false rejections from bad angles/lighting
+        """
+        # Count how many of the new encodings match existing users
+        match_count = 0
+        with timed("match"):
+            for encoding in encodings:
+                distances = gallery.user_distances(encoding)
+                if len(distances) and distances.min() <= settings.FACE_DUPLICATE_CHECK_THRESHOLD:
+                    match_count += 1
+        
+        # Only block if MOST images match (e.g. 2+ out of 3, or 3+ out of 4)
+        # This prevents one bad angle/lighting from blocking siblings
+        required_matches = max(2, len(encodings) - 1)  # At least 2, or all-but-one
+        return match_count >= required_matches
+
+    @staticmethod
+    def save_registered_user(
+        db: Session,
+        username: str,
+        encodings: List[np.ndarray],
+        user_id: Optional[UUID] = None
+    ) -> Tuple[bool, str, Optional[User]]:
+        """Insert the user with already-encoded faces (the only step of registration that needs the DB session)."""
+        try:
             # If user_id provided, check it's unique
             if user_id is not None:
-                existing = db.query(User).filter(User.user_id == user_id).first()
+                existing = db.query(User.user_id).filter(User.user_id == user_id).first()
                 if existing:
                     return False, "This user_id is already in use. Choose a different one or leave empty to auto-generate.", None
             
-            # Encode all face images (robust: try original + enhanced, better encoding)
-            encodings = []
-            for idx, image_bytes in enumerate(face_images):
-                encoding = encode_face_image_robust(image_bytes)
-                if encoding is None:
-                    return False, f"Failed to detect face in image {idx + 1}. Please ensure face is clearly visible.", None
-                encodings.append(encoding)
-            
-            # Check for duplicate faces (prevent same person registering twice)
-            # Require MULTIPLE images to match (not just one) to avoid false rejections from bad angles/lighting
-            all_users = db.query(User).all()
-            all_stored_encodings = [user.face_encodings for user in all_users]
-            
-            # Count how many of the new encodings match existing users
-            match_count = 0
-            for encoding in encodings:
-                if check_duplicate_face(encoding, all_stored_encodings, threshold=settings.FACE_DUPLICATE_CHECK_THRESHOLD):
-                    match_count += 1
-            
-            # Only block if MOST images match (e.g. 2+ out of 3, or 3+ out of 4)
-            # This prevents one bad angle/lighting from blocking siblings
-            required_matches = max(2, len(encodings) - 1)  # At least 2, or all-but-one
-            if match_count >= required_matches:
-                return False, "This face is already registered. Please use a different person.", None
-            
-            # Convert encodings to strings for storage
-            encoding_strings = [encode_to_string(enc) for enc in encodings]
+            # Assign next user_number (small ID 1, 2, 3... in registration order)
+            from sqlalchemy import func
+            next_number = db.query(func.coalesce(func.max(User.user_number), 0)).scalar() + 1
             
             # Create user (with optional user_id and auto user_number)
             user = User(
                 username=username,
-                face_encodings=encoding_strings,
+                face_encodings=[encode_to_string(enc) for enc in encodings],
                 user_number=next_number
             )
             if user_id is not None:
@@ -86,6 +118,8 @@ class FaceService:
             
             db.add(user)
             db.commit()
+            StatsService.invalidate()
+            DataVersionService.bump_sync(db)
             db.refresh(user)
             
             return True, f"User registered successfully with {len(encodings)} face images", user
@@ -95,47 +129,131 @@ class FaceService:
             return False, f"Error registering user: {str(e)}", None
     
     @staticmethod
-    def authenticate_face(db: Session, face_image: bytes) -> Tuple[bool, Optional[User], float, str]:
+    def adapt_templates(db: Session, user: User, encoding: np.ndarray) -> bool:
+        """
+        Add a confidently matched encoding to the user's learned encodings, keeping at most
+        FACE_MAX_TEMPLATES_PER_USER in total. When full, drops the learned encoding farthest from
+        the centroid of all of them (or the oldest, per FACE_TEMPLATE_EVICTION); registration
+        encodings always stay. Other workers pick the change up through templates_version.
+
+        The user row is locked before its learned encodings are re-read, so concurrent logins of
+        the same user do not drop each other's encoding. The version is taken under a transaction
+        advisory lock, so templates_version values become visible in commit order and a worker
+        that has seen version N never misses a later-committing lower one.
+        """
+        slots = settings.FACE_MAX_TEMPLATES_PER_USER - len(user.face_encodings)
+        if slots <= 0:
+            return False
+        user = db.get(User, user.user_id, with_for_update=True, populate_existing=True)
+        if user is None:
+            return False
+        adapted = [string_to_encoding(s) for s in user.adapted_encodings or []] + [encoding]
+        TEMPLATE_UPDATES.labels("added").inc()
+        while len(adapted) > slots:
+            if settings.FACE_TEMPLATE_EVICTION == "oldest":
+                adapted.pop(0)
+            else:
+                stored = [string_to_encoding(s) for s in user.face_encodings] + adapted
+                centroid = np.mean(stored, axis=0)
+                adapted.pop(int(np.argmax([np.linalg.norm(e - centroid) for e in adapted])))
+            TEMPLATE_UPDATES.labels("evicted").inc()
+        user.adapted_encodings = [encode_to_string(e) for e in adapted]
+        db.execute(select(func.pg_advisory_xact_lock(TEMPLATE_VERSION_LOCK)))
+        user.templates_version = template_version_seq.next_value()
+        db.commit()
+        return True
+
+    @staticmethod
+    def authenticate_face(
+        db: Session,
+        face_image: Union[bytes, List[bytes]],
+        adapt: bool = False,
+        quality: Optional[QualityLevel] = None,
+        face_crop: bool = False,
+    ) -> Tuple[bool, Optional[User], float, str]:
         """
         Authenticate a face against registered users.
         Uses stricter threshold and rejects ambiguous matches (two users too close).
+        face_image: one image, or several captures of the same face (AUTH_FUSION_FRAMES) that are
+        encoded in one batch and matched as one fused encoding (AUTH_FUSION_METHOD).
+        adapt: the frame passed a liveness check, so a very confident match may be learned
+        (see adapt_templates). Never set it for unverified single images. Fused encodings are
+        never learned: an average of frames is not an observed face and would pull the stored
+        templates toward their centroid.
+        quality: encoding level chosen by QualityController (None = full); only full-quality
+        encodings are learned.
+        face_crop: face_image is a client-side face crop (roi upload mode), so detection skips
+        upsampling.
         
         Returns:
-            Tuple of (success, user_object, confidence_score, message)
+            Tuple of (success, user_object, confidence_score, message). Unexpected errors (e.g.
+            the database is down) are raised, not returned as a failed match.
         """
         try:
-            face_encoding = encode_face_image_robust(face_image)
+            upsample = 0 if face_crop else 1
+            if isinstance(face_image, bytes):
+                face_encoding = encode_face_image_robust(face_image, quality, upsample=upsample)
+            else:
+                encodings = encode_face_images(face_image, quality, upsample=upsample)
+                face_encoding = fuse_encodings(encodings, settings.AUTH_FUSION_METHOD) if encodings else None
             if face_encoding is None:
+                record_match_outcome("no_face")
                 return False, None, 0.0, "No face detected. Ensure your face is clearly visible and well lit."
             
-            users = db.query(User).all()
-            if not users:
+            gallery = GalleryService.current(db)
+            if not gallery.user_ids:
+                record_match_outcome("no_users")
                 return False, None, 0.0, "No users registered in system"
             
             auth_threshold = getattr(settings, "FACE_AUTH_THRESHOLD", settings.FACE_MATCH_THRESHOLD)
             ambiguity_margin = getattr(settings, "FACE_AUTH_AMBIGUITY_MARGIN", 0.08)
             
-            # Get distance to every user (use auth threshold for match)
-            distances = []
-            for user in users:
-                is_match, distance = match_face(face_encoding, user.face_encodings, threshold=auth_threshold)
-                if is_match:
-                    distances.append((distance, user))
+            # Exact distance to every user, or to the candidates of the centroid pre-filter or
+            # int8 first pass (GALLERY_CENTROID_PREFILTER / GALLERY_QUANTIZATION), rescored exactly
+            with timed("match"):
+                candidates, distances = gallery.candidate_distances(
+                    face_encoding,
+                    prefilter=settings.GALLERY_CENTROID_PREFILTER,
+                    rerank=settings.GALLERY_RERANK_CANDIDATES if settings.GALLERY_QUANTIZATION == "int8" else 0,
+                )
+                # Best match within the auth threshold; rejected if the runner-up is too close (ambiguous)
+                best, outcome = match_decision(distances, auth_threshold, ambiguity_margin)
             
-            if not distances:
+            if outcome == "not_recognized":
+                record_match_outcome("not_recognized")
                 return False, None, 0.0, "Face not recognized. Please register first."
             
-            # Sort by distance (best first)
-            distances.sort(key=lambda x: x[0])
-            best_distance, best_user = distances[0]
-            second_best_distance = distances[1][0] if len(distances) > 1 else float("inf")
-            
-            # Reject if two users are too close (ambiguous match)
-            if second_best_distance - best_distance < ambiguity_margin:
+            if outcome == "ambiguous":
+                record_match_outcome("ambiguous")
                 return False, None, 0.0, "Match unclear. Please try again in better lighting or move slightly."
             
+            best_distance = float(distances[best])
+            best_user = db.get(User, UUID(gallery.user_ids[candidates[best]]))
+            if best_user is None:
+                # Deleted since the gallery was loaded
+                GalleryService.invalidate()
+                record_match_outcome("not_recognized")
+                return False, None, 0.0, "Face not recognized. Please register first."
+            
+            # Learn the encoding only if it is very close, clearly nobody else, and adds something
+            runner_up = float(np.partition(distances, 1)[1]) if len(distances) > 1 else float("inf")
+            if (
+                adapt
+                and isinstance(face_image, bytes)
+                and (quality is None or quality.is_full)
+                and settings.FACE_ADAPT_MIN_NOVELTY <= best_distance <= settings.FACE_ADAPT_THRESHOLD
+                and runner_up - best_distance >= settings.FACE_ADAPT_MIN_MARGIN
+            ):
+                try:
+                    FaceService.adapt_templates(db, best_user, face_encoding)
+                except Exception as e:
+                    db.rollback()
+                    print(f"Could not update face templates: {e}")
+            
             confidence = max(0.0, min(1.0, 1.0 - best_distance))
+            record_match_outcome("success")
             return True, best_user, confidence, "Authentication successful"
         
-        except Exception as e:
-            return False, None, 0.0, f"Error authenticating face: {str(e)}"
+        except Exception:
+            record_match_outcome("error")
+            raise
@@ -0,0 +1,606 @@
+"""
+In-memory face gallery backed by an on-disk snapshot.
+
+Instead of loading app_users and parsing every JSON encoding on each authentication, each worker
+holds all encodings as one matrix. At first use it memory-maps the latest snapshot
+(GALLERY_SNAPSHOT_DIR: encodings-<id>.npy + gallery.json index with checksum and user_number
+high-water mark) and applies only users registered since that mark. Every match call applies
+new registrations and changed learned encodings (templates_version above the last one applied)
+the same way, with one indexed query, and every GALLERY_REFRESH_SECONDS the user count is
+compared with the database, rebuilding on deletions.
+
+Snapshots are rewritten by a worker once GALLERY_SNAPSHOT_MIN_NEW_USERS users were added on top
+of the one it loaded, or once that snapshot is GALLERY_SNAPSHOT_MAX_AGE_SECONDS old and any user
+or learned encoding changed since, and by `python -m scripts.build_gallery_snapshot` (run after
+bulk enrollment).
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import numpy as np
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.user import User
+from app.utils.metrics import GALLERY_ENCODINGS, GALLERY_USERS
+
+SNAPSHOT_FORMAT = 2
+INDEX_FILE = "gallery.json"
+# Held by the process writing a snapshot; other writers skip (workers) or wait (scripts)
+LOCK_FILE = "gallery.lock"
+# Rows converted to float32 at a time in the int8 scan (stays in cache; no full-size temporary)
+QUANTIZED_CHUNK_ROWS = 1024
+
+# (user_id, user_number, registration encodings, learned encodings), as read from app_users
+UserRow = Tuple[str, Optional[int], List[np.ndarray], List[np.ndarray]]
+
+
+class _Rows:
+    """
+    Append-only row buffer with spare capacity, shared by successive states: a state only reads
+    its first `length` rows, so appending in place never changes what an older state sees.
+    """
+
+    def __init__(self, data: np.ndarray, sq_norms: np.ndarray, used: int):
+        self.data = data
+        self.sq_norms = sq_norms
+        self.used = used
+
+    @classmethod
+    def of(cls, rows: np.ndarray) -> "_Rows":
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, settings.FACE_ENCODING_DIMENSION)
+        return cls(rows, np.einsum("ij,ij->i", rows, rows), len(rows))
+
+    def append(self, length: int, rows: np.ndarray) -> "_Rows":
+        """Buffer holding this buffer's first `length` rows followed by rows (self if it had room)."""
+        if length == self.used and length + len(rows) <= len(self.data):
+            buffer = self
+        else:
+            capacity = max(64, 2 * (length + len(rows)))
+            buffer = _Rows(np.empty((capacity, self.data.shape[1])), np.empty(capacity), length)
+            buffer.data[:length] = self.data[:length]
+            buffer.sq_norms[:length] = self.sq_norms[:length]
+        buffer.data[length:length + len(rows)] = rows
+        buffer.sq_norms[length:length + len(rows)] = np.einsum("ij,ij->i", rows, rows)
+        buffer.used = length + len(rows)
+        return buffer
+
+
+class GalleryState:
+    """
+    Immutable view of the gallery. Registration encodings of user i are rows starts[i]:starts[i+1]
+    of base + extra; learned (adapted) encodings live in a separate block where row j belongs to
+    user adapted_owners[j] (-1 once replaced). `skipped` counts users without a usable encoding.
+    """
+
+    def __init__(self, base: np.ndarray, extra: np.ndarray, user_ids: List[str],
+                 user_numbers: List[Optional[int]], counts: Sequence[int], high_water: int,
+                 snapshot_users: int, skipped: int = 0, base_sq_norms: Optional[np.ndarray] = None,
+                 adapted: Optional[_Rows] = None, adapted_owners: Optional[np.ndarray] = None,
+                 template_mark: int = 0, centroids: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+                 quantized: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None,
+                 snapshot_mark: int = 0, snapshot_time: Optional[float] = None):
+        self.base = base  # usually a read-only memmap of the snapshot
+        self.extra = extra  # users applied on top of the snapshot
+        # Squared row norms, so a scan is one matrix-vector product (no n x 128 temporaries)
+        self.base_sq_norms = np.einsum("ij,ij->i", base, base) if base_sq_norms is None else base_sq_norms
+        self.extra_sq_norms = np.einsum("ij,ij->i", extra, extra)
+        self.user_ids = user_ids
+        self.user_numbers = user_numbers
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.starts = np.concatenate([[0], np.cumsum(self.counts)[:-1]]).astype(np.int64)
+        self.high_water = high_water
+        self.snapshot_users = snapshot_users
+        self.skipped = skipped
+        self.adapted = adapted if adapted is not None else _Rows.of(np.empty((0, base.shape[1])))
+        self.adapted_owners = np.zeros(0, dtype=np.int64) if adapted_owners is None else adapted_owners
+        self.template_mark = template_mark  # highest app_users.templates_version applied
+        self.snapshot_mark = snapshot_mark  # template_mark of the snapshot under this state
+        self.snapshot_time = time.time() if snapshot_time is None else snapshot_time  # when it was written
+        self._live = np.flatnonzero(self.adapted_owners >= 0)
+        self._centroids = centroids
+        self._quantized = quantized
+        self._positions = None
+
+    @property
+    def user_count(self) -> int:
+        """Users accounted for, to compare with the database row count."""
+        return len(self.user_ids) + self.skipped
+
+    @property
+    def encoding_count(self) -> int:
+        return len(self.base) + len(self.extra) + len(self._live)
+
+    def position(self, user_id: str) -> Optional[int]:
+        if self._positions is None:
+            self._positions = {uid: i for i, uid in enumerate(self.user_ids)}
+        return self._positions.get(user_id)
+
+    def _seed_rows(self, i: int) -> np.ndarray:
+        start, count = int(self.starts[i]), int(self.counts[i])
+        if start < len(self.base):
+            return self.base[start:start + count]
+        start -= len(self.base)
+        return self.extra[start:start + count]
+
+    def _adapted_squared(self, encoding: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        return self.adapted.sq_norms[rows] - 2.0 * (self.adapted.data[rows] @ encoding) + encoding @ encoding
+
+    def user_distances(self, encoding: np.ndarray) -> np.ndarray:
+        """Smallest Euclidean distance from encoding to each user's stored encodings."""
+        if not self.user_ids:
+            return np.empty(0)
+        encoding = np.asarray(encoding, dtype=np.float64)
+        # |a - b|^2 = |a|^2 - 2 a.b + |b|^2
+        parts = [
+            sq_norms - 2.0 * (block @ encoding)
+            for block, sq_norms in ((self.base, self.base_sq_norms), (self.extra, self.extra_sq_norms))
+            if len(block)
+        ]
+        squared = parts[0] if len(parts) == 1 else np.concatenate(parts)
+        squared += encoding @ encoding
+        squared = np.minimum.reduceat(squared, self.starts)
+        if len(self._live):
+            np.minimum.at(squared, self.adapted_owners[self._live], self._adapted_squared(encoding, self._live))
+        np.maximum(squared, 0.0, out=squared)
+        return np.sqrt(squared)
+
+    def centroids(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Mean of each user's stored encodings and its squared norm (computed on first use, then
+        kept up to date by with_users).
+        """
+        if self._centroids is None:
+            sums = np.zeros((len(self.user_ids), self.base.shape[1]))
+            base_users = int(np.searchsorted(self.starts, len(self.base)))
+            if base_users:
+                sums[:base_users] = np.add.reduceat(self.base, self.starts[:base_users])
+            if base_users < len(self.user_ids):
+                sums[base_users:] = np.add.reduceat(self.extra, self.starts[base_users:] - len(self.base))
+            totals = self.counts.astype(np.float64)
+            if len(self._live):
+                owners = self.adapted_owners[self._live]
+                np.add.at(sums, owners, self.adapted.data[self._live])
+                totals += np.bincount(owners, minlength=len(self.user_ids))
+            centroids = sums / totals[:, None]
+            self._centroids = centroids, np.einsum("ij,ij->i", centroids, centroids)
+        return self._centroids
+
+    def quantized(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        int8 copy of the registration encodings (per-dimension scale, 1/8 of the float64 size),
+        the scale, and the exact squared row norms. Computed on first use, then kept up to date.
+        """
+        if self._quantized is None:
+            blocks = [block for block in (self.base, self.extra) if len(block)]
+            scale = np.full(self.base.shape[1], 1e-6)
+            for block in blocks:
+                for i in range(0, len(block), QUANTIZED_CHUNK_ROWS * 64):
+                    np.maximum(scale, np.abs(block[i:i + QUANTIZED_CHUNK_ROWS * 64]).max(axis=0) / 127, out=scale)
+            codes = np.vstack([_quantize(block, scale) for block in blocks]) if blocks else np.empty((0, len(scale)), np.int8)
+            self._quantized = codes, scale, np.concatenate([self.base_sq_norms, self.extra_sq_norms])
+        return self._quantized
+
+    def approximate_user_distances(self, encoding: np.ndarray) -> np.ndarray:
+        """user_distances() from the int8 copy: only the dot products are approximated."""
+        if not self.user_ids:
+            return np.empty(0)
+        encoding = np.asarray(encoding, dtype=np.float64)
+        codes, scale, sq_norms = self.quantized()
+        scaled = (encoding * scale).astype(np.float32)
+        dots = np.empty(len(codes), dtype=np.float32)
+        for i in range(0, len(codes), QUANTIZED_CHUNK_ROWS):
+            np.matmul(codes[i:i + QUANTIZED_CHUNK_ROWS].astype(np.float32), scaled, out=dots[i:i + QUANTIZED_CHUNK_ROWS])
+        squared = np.minimum.reduceat(sq_norms - 2.0 * dots + encoding @ encoding, self.starts)
+        if len(self._live):
+            np.minimum.at(squared, self.adapted_owners[self._live], self._adapted_squared(encoding, self._live))
+        np.maximum(squared, 0.0, out=squared)
+        return np.sqrt(squared)
+
+    def candidate_distances(self, encoding: np.ndarray, prefilter: int = 0, rerank: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (user indexes, exact smallest distance to each) for the users worth checking:
+        - prefilter > 0: the `prefilter` users whose centroid is nearest to encoding
+        - rerank > 0: the `rerank` users nearest in the int8 scan (approximate_user_distances)
+        - otherwise every user (one exact scan)
+        Candidates are always rescored exactly against all their float encodings.
+        """
+        encoding = np.asarray(encoding, dtype=np.float64)
+        if 0 < prefilter < len(self.user_ids):
+            centroids, sq_norms = self.centroids()
+            nearest = np.argpartition(sq_norms - 2.0 * (centroids @ encoding), prefilter)[:prefilter]
+        elif 0 < rerank < len(self.user_ids):
+            nearest = np.argpartition(self.approximate_user_distances(encoding), rerank)[:rerank]
+        else:
+            return np.arange(len(self.user_ids)), self.user_distances(encoding)
+        candidates = np.sort(nearest)
+
+        rows = np.vstack([self._seed_rows(i) for i in candidates])
+        squared = np.minimum.reduceat(
+            np.einsum("ij,ij->i", rows - encoding, rows - encoding),
+            np.concatenate([[0], np.cumsum(self.counts[candidates])[:-1]]),
+        )
+        if len(self._live):
+            owners = self.adapted_owners[self._live]
+            mine = np.isin(owners, candidates)
+            if mine.any():
+                np.minimum.at(squared, np.searchsorted(candidates, owners[mine]),
+                              self._adapted_squared(encoding, self._live[mine]))
+        np.maximum(squared, 0.0, out=squared)
+        return candidates, np.sqrt(squared)
+
+    def with_users(self, rows: List[UserRow], template_mark: Optional[int] = None) -> "GalleryState":
+        """
+        New state with unknown users appended and the learned encodings of known users replaced
+        (in-memory rows; the snapshot part is untouched).
+        """
+        changed = [(self.position(row[0]), row[3]) for row in rows if self.position(row[0]) is not None]
+        rows = [row for row in rows if self.position(row[0]) is None]
+        numbers = [row[1] for row in rows if row[1] is not None]
+        skipped = self.skipped + sum(1 for row in rows if not row[2])
+        rows = [row for row in rows if row[2]]
+        template_mark = self.template_mark if template_mark is None else max(self.template_mark, template_mark)
+        if not rows and not changed and skipped == self.skipped and template_mark == self.template_mark:
+            return self
+
+        extra, user_ids, user_numbers, counts = self.extra, self.user_ids, self.user_numbers, self.counts
+        if rows:
+            new_extra = np.vstack([np.vstack(row[2]) for row in rows])
+            extra = np.vstack([self.extra, new_extra]) if len(self.extra) else new_extra
+            user_ids = self.user_ids + [row[0] for row in rows]
+            user_numbers = self.user_numbers + [row[1] for row in rows]
+            counts = list(self.counts) + [len(row[2]) for row in rows]
+
+        # Learned encodings: retire the rows of changed users, append their new ones and any new user's
+        owners = self.adapted_owners
+        if changed:
+            owners = owners.copy()
+            owners[np.isin(owners, [i for i, _ in changed])] = -1
+        appended = [(i, encodings) for i, encodings in changed]
+        appended += [(len(self.user_ids) + n, row[3]) for n, row in enumerate(rows)]
+        appended = [(i, encodings) for i, encodings in appended if encodings]
+        adapted = self.adapted
+        if appended:
+            adapted = self.adapted.append(len(owners), np.vstack([np.vstack(e) for _, e in appended]))
+            owners = np.concatenate([owners, np.repeat([i for i, _ in appended], [len(e) for _, e in appended])])
+        if len(owners) > 64 and (owners < 0).sum() * 2 > len(owners):
+            live = np.flatnonzero(owners >= 0)
+            adapted, owners = _Rows.of(adapted.data[live]), owners[live]
+
+        quantized = self._quantized
+        if quantized is not None and rows:
+            codes, scale, sq_norms = quantized
+            quantized = (np.vstack([codes, _quantize(new_extra, scale)]), scale,
+                         np.concatenate([sq_norms, np.einsum("ij,ij->i", new_extra, new_extra)]))
+
+        # Keep centroids current if they were computed: updated in place for changed users (only
+        # steers which users get checked, so an older state seeing the new value is harmless)
+        centroids = self._centroids
+        if centroids is not None:
+            matrix, sq_norms = centroids
+            for i, encodings in changed:
+                matrix[i] = np.vstack([self._seed_rows(i)] + list(encodings)).mean(axis=0)
+                sq_norms[i] = matrix[i] @ matrix[i]
+            if rows:
+                new = np.vstack([np.vstack(row[2] + row[3]).mean(axis=0) for row in rows])
+                centroids = np.vstack([matrix, new]), np.concatenate([sq_norms, np.einsum("ij,ij->i", new, new)])
+
+        return GalleryState(
+            self.base,
+            extra,
+            user_ids,
+            user_numbers,
+            counts,
+            max([self.high_water] + numbers),
+            self.snapshot_users,
+            skipped,
+            self.base_sq_norms,
+            adapted,
+            owners,
+            template_mark,
+            centroids,
+            quantized,
+            self.snapshot_mark,
+            self.snapshot_time,
+        )
+
+
+def _quantize(block: np.ndarray, scale: np.ndarray) -> np.ndarray:
+    """int8 codes of block (values beyond the scale, e.g. from later users, are clipped)."""
+    codes = np.empty(block.shape, dtype=np.int8)
+    step = QUANTIZED_CHUNK_ROWS * 64
+    for i in range(0, len(block), step):
+        codes[i:i + step] = np.clip(np.rint(block[i:i + step] / scale), -127, 127)
+    return codes
+
+
+def match_decision(distances: np.ndarray, threshold: float, margin: float) -> Tuple[Optional[int], str]:
+    """
+    Position of the accepted match in distances and the outcome: "success", "not_recognized"
+    (nobody within threshold) or "ambiguous" (runner-up within threshold and margin).
+    """
+    matches = np.flatnonzero(distances <= threshold)
+    if not len(matches):
+        return None, "not_recognized"
+    matches = matches[np.argsort(distances[matches], kind="stable")]
+    if len(matches) > 1 and distances[matches[1]] - distances[matches[0]] < margin:
+        return None, "ambiguous"
+    return int(matches[0]), "success"
+
+
+def _empty_state() -> GalleryState:
+    return GalleryState(np.empty((0, settings.FACE_ENCODING_DIMENSION)), np.empty((0, settings.FACE_ENCODING_DIMENSION)),
+                        [], [], [], 0, 0)
+
+
+def _parse_encodings(encoding_strings: List[str]) -> List[np.ndarray]:
+    encodings = []
+    for encoding_str in encoding_strings or []:
+        try:
+            encoding = np.array(json.loads(encoding_str), dtype=np.float64)
+        except (ValueError, TypeError) as e:
+            print(f"Error parsing stored encoding: {e}")
+            continue
+        if encoding.shape != (settings.FACE_ENCODING_DIMENSION,):
+            print(f"Skipping stored encoding with shape {encoding.shape}")
+            continue
+        encodings.append(encoding)
+    return encodings
+
+
+def _user_rows(db: Session, after_number: Optional[int] = None, after_version: Optional[int] = None):
+    """
+    UserRows in user_number order, optionally only users newer than after_number or whose
+    learned encodings changed after after_version. Ends with the highest templates_version seen.
+    """
+    statement = select(
+        User.user_id, User.user_number, User.face_encodings, User.adapted_encodings, User.templates_version
+    ).order_by(User.user_number.asc().nulls_first(), User.user_id)
+    if after_number is not None:
+        statement = statement.where(or_(User.user_number > after_number, User.templates_version > after_version))
+    rows, mark = [], after_version or 0
+    for user_id, user_number, encoding_strings, adapted_strings, version in db.execute(
+        statement.execution_options(yield_per=1000)
+    ):
+        rows.append((str(user_id), user_number, _parse_encodings(encoding_strings), _parse_encodings(adapted_strings)))
+        mark = max(mark, version or 0)
+    return rows, mark
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _snapshot_dir() -> Path:
+    return Path(settings.GALLERY_SNAPSHOT_DIR)
+
+
+@contextmanager
+def _writer_lock(directory: Path, wait: bool) -> Iterator[bool]:
+    """Exclusive lock of the snapshot directory across processes; yields False if busy and not wait."""
+    with open(directory / LOCK_FILE, "a+b") as handle:
+        try:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | (0 if wait else fcntl.LOCK_NB))
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK if wait else msvcrt.LK_NBLCK, 1)
+        except OSError:
+            if wait:
+                raise
+            yield False
+            return
+        yield True  # released when the handle is closed
+
+
+def write_snapshot(state: GalleryState, wait: bool = False) -> Optional[Path]:
+    """
+    Write state as a new snapshot (matrix file first, then the index, atomically) and drop older
+    matrices. Writers are serialized by a lock file, so one never deletes the matrix of another
+    before its index is in place; returns None without writing if another process holds the
+    lock, unless wait.
+    """
+    directory = _snapshot_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    with _writer_lock(directory, wait) as locked:
+        return _write_snapshot(directory, state) if locked else None
+
+
+def _write_snapshot(directory: Path, state: GalleryState) -> Path:
+    snapshot_id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+    matrix_path = directory / f"encodings-{snapshot_id}.npy"
+    live = state.adapted_owners >= 0
+    parts = [block for block in (state.base, state.extra, state.adapted.data[:len(live)][live]) if len(block)]
+    matrix = np.vstack(parts) if parts else np.empty((0, settings.FACE_ENCODING_DIMENSION))
+    np.save(matrix_path, np.ascontiguousarray(matrix, dtype=np.float64))
+
+    index = {
+        "format": SNAPSHOT_FORMAT,
+        "dimension": settings.FACE_ENCODING_DIMENSION,
+        "matrix_file": matrix_path.name,
+        "sha256": _sha256(matrix_path),
+        "high_water_mark": state.high_water,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "user_ids": state.user_ids,
+        "user_numbers": state.user_numbers,
+        "counts": [int(c) for c in state.counts],
+        "skipped_users": state.skipped,
+        "template_mark": state.template_mark,
+        # Rows after sum(counts) are learned encodings of these user indexes
+        "adapted_owners": [int(i) for i in state.adapted_owners[live]],
+    }
+    tmp = directory / f"{INDEX_FILE}.{snapshot_id}.tmp"
+    tmp.write_text(json.dumps(index))
+    os.replace(tmp, directory / INDEX_FILE)
+
+    for old in directory.glob("encodings-*.npy"):
+        if old != matrix_path:
+            try:
+                old.unlink()
+            except OSError:
+                pass  # still mapped by a process on a platform that forbids it; removed next time
+    return matrix_path
+
+
+def delete_snapshot() -> None:
+    """Remove the snapshot (e.g. after deleting users); workers rebuild from the database."""
+    directory = _snapshot_dir()
+    for path in list(directory.glob("encodings-*.npy")) + [directory / INDEX_FILE]:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+
+def read_snapshot() -> Optional[GalleryState]:
+    """Memory-map the current snapshot, or None if missing, of another format or corrupt."""
+    index_path = _snapshot_dir() / INDEX_FILE
+    try:
+        index = json.loads(index_path.read_text())
+    except (OSError, ValueError):
+        return None
+    if index.get("format") != SNAPSHOT_FORMAT or index.get("dimension") != settings.FACE_ENCODING_DIMENSION:
+        return None
+    matrix_path = _snapshot_dir() / index["matrix_file"]
+    try:
+        if settings.GALLERY_SNAPSHOT_VERIFY and _sha256(matrix_path) != index["sha256"]:
+            print(f"Gallery snapshot {matrix_path.name}: checksum mismatch, ignoring it")
+            return None
+        base = np.load(matrix_path, mmap_mode="r")
+    except (OSError, ValueError) as e:
+        print(f"Gallery snapshot {matrix_path.name}: {e}")
+        return None
+    seed_rows = sum(index["counts"])
+    if len(base) != seed_rows + len(index["adapted_owners"]):
+        return None
+    return GalleryState(
+        base[:seed_rows], np.empty((0, base.shape[1])), index["user_ids"], index["user_numbers"],
+        index["counts"], index["high_water_mark"], len(index["user_ids"]), index["skipped_users"],
+        adapted=_Rows.of(base[seed_rows:]), adapted_owners=np.array(index["adapted_owners"], dtype=np.int64),
+        template_mark=index["template_mark"], snapshot_mark=index["template_mark"],
+        snapshot_time=datetime.fromisoformat(index["created_at"]).timestamp(),
+    )
+
+
+def build_state(db: Session) -> GalleryState:
+    """Full gallery from the database."""
+    rows, mark = _user_rows(db)
+    return _empty_state().with_users(rows, mark)
+
+
+class GalleryService:
+    """Process-wide gallery used by authentication and the registration duplicate check"""
+
+    _state: Optional[GalleryState] = None
+    _lock = threading.Lock()
+    _checked_at = 0.0
+
+    @classmethod
+    def _publish(cls, state: GalleryState) -> GalleryState:
+        # Build the configured search structures now rather than in the first match
+        if settings.GALLERY_QUANTIZATION == "int8":
+            state.quantized()
+        if settings.GALLERY_CENTROID_PREFILTER > 0:
+            state.centroids()
+        cls._state = state
+        GALLERY_USERS.set(len(state.user_ids))
+        GALLERY_ENCODINGS.set(state.encoding_count)
+        return state
+
+    @classmethod
+    def load(cls, db: Session) -> GalleryState:
+        """Snapshot + newer users, or a full rebuild (which is then written as the new snapshot)."""
+        with cls._lock:
+            start = time.perf_counter()
+            state = read_snapshot()
+            source = "snapshot"
+            if state is not None:
+                state = state.with_users(*_user_rows(db, state.high_water, state.template_mark))
+                if state.user_count != db.scalar(select(func.count()).select_from(User)):
+                    state = None  # users were deleted (or numbered out of order) since the snapshot
+            if state is None:
+                source = "database"
+                state = build_state(db)
+                try:
+                    if write_snapshot(state) is not None:
+                        state = read_snapshot() or state
+                except OSError as e:
+                    print(f"Could not write gallery snapshot: {e}")
+            cls._checked_at = time.monotonic()
+            print(
+                f"Gallery loaded from {source}: {len(state.user_ids)} users, {state.encoding_count} encodings "
+                f"in {(time.perf_counter() - start) * 1000:.0f} ms"
+            )
+            return cls._publish(state)
+
+    @staticmethod
+    def _snapshot_due(state: GalleryState) -> bool:
+        """Enough new users on top of the snapshot, or an old snapshot missing any change."""
+        new_users = len(state.user_ids) - state.snapshot_users
+        if new_users >= settings.GALLERY_SNAPSHOT_MIN_NEW_USERS:
+            return True
+        return (
+            settings.GALLERY_SNAPSHOT_MAX_AGE_SECONDS > 0
+            and (new_users > 0 or state.template_mark > state.snapshot_mark)
+            and time.time() - state.snapshot_time >= settings.GALLERY_SNAPSHOT_MAX_AGE_SECONDS
+        )
+
+    @classmethod
+    def current(cls, db: Session) -> GalleryState:
+        """
+        Up-to-date gallery for a match: loads on first use, applies users registered since the
+        last call and, every GALLERY_REFRESH_SECONDS, rebuilds if the user count disagrees.
+        Rewrites the snapshot when _snapshot_due.
+        """
+        state = cls._state
+        if state is None:
+            return cls.load(db)
+
+        changed, mark = _user_rows(db, state.high_water, state.template_mark)
+        if time.monotonic() - cls._checked_at >= settings.GALLERY_REFRESH_SECONDS:
+            cls._checked_at = time.monotonic()
+            new_users = sum(1 for row in changed if state.position(row[0]) is None)
+            if state.user_count + new_users != db.scalar(select(func.count()).select_from(User)):
+                return cls.load(db)
+        if not changed and not cls._snapshot_due(state):
+            return state
+
+        with cls._lock:
+            state = cls._state or state
+            if changed:
+                state = cls._publish(state.with_users(changed, mark))
+            if cls._snapshot_due(state):
+                try:
+                    if write_snapshot(state) is not None:
+                        state = cls._publish(read_snapshot() or state)
+                    else:
+                        state.snapshot_time = time.time()  # another worker is writing one
+                except OSError as e:
+                    state.snapshot_time = time.time()  # retry the age-based rewrite one max age later
+                    print(f"Could not write gallery snapshot: {e}")
+            return state
+
+    @classmethod
+    def invalidate(cls) -> None:
+        """Forget the in-memory gallery (next match reloads). Used when users are deleted."""
+        with cls._lock:
+            cls._state = None
@@ -0,0 +1,88 @@
+import json
+import random
+from datetime import timedelta
+from typing import Any, Optional, Tuple
+from sqlalchemy import and_, delete, func, or_, select
+from sqlalchemy.dialects.postgresql import insert
+from app.database import AsyncSessionLocal
+from app.models.idempotency_key import IdempotencyKey
+from app.utils.cache import TTLCache
+from app.config import settings
+
+# Finished responses already seen by this worker: replays skip the database round trip
+_replays = TTLCache(ttl_seconds=settings.IDEMPOTENCY_TTL_SECONDS, max_entries=settings.IDEMPOTENCY_CACHE_ENTRIES)
+
+# Share of claims that also delete expired rows (keeps the table bounded without a cron job)
+_PURGE_PROBABILITY = 0.01
+
+# (request_hash, status_code, response body)
+StoredResponse = Tuple[str, int, Any]
+
+
+class IdempotencyService:
+    """
+    Stored outcomes of requests sent with an Idempotency-Key header, shared by all workers
+    through the idempotency_keys table. Uses its own short sessions, independent of the
+    request's. A key is claimed before the request runs, so a concurrent retry sees it as
+    in progress instead of executing a second time.
+    """
+
+    @staticmethod
+    async def claim(key: str, request_hash: str) -> Optional[StoredResponse]:
+        """
+        Claim key for a new execution (returns None), or return what is stored for it:
+        the finished response, or (hash, None, None) while the first request is still running.
+        Expired keys and in-progress claims older than IDEMPOTENCY_PENDING_TIMEOUT_SECONDS
+        (the worker died) are claimed again.
+        """
+        stored = _replays.get(key)
+        if stored is not None:
+            return stored
+        async with AsyncSessionLocal() as db:
+            expired = func.now() - timedelta(seconds=settings.IDEMPOTENCY_TTL_SECONDS)
+            abandoned = func.now() - timedelta(seconds=settings.IDEMPOTENCY_PENDING_TIMEOUT_SECONDS)
+            statement = insert(IdempotencyKey).values(key=key, request_hash=request_hash)
+            statement = statement.on_conflict_do_update(
+                index_elements=[IdempotencyKey.key],
+                set_={"request_hash": request_hash, "status_code": None, "response_body": None, "created_at": func.now()},
+                where=or_(
+                    IdempotencyKey.created_at < expired,
+                    and_(IdempotencyKey.status_code.is_(None), IdempotencyKey.created_at < abandoned),
+                ),
+            ).returning(IdempotencyKey.key)
+            claimed = (await db.execute(statement)).scalar() is not None
+            if claimed and random.random() < _PURGE_PROBABILITY:
+                await db.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at < expired))
+            await db.commit()
+            if claimed:
+                return None
+
+            row = (await db.execute(
+                select(IdempotencyKey.request_hash, IdempotencyKey.status_code, IdempotencyKey.response_body)
+                .where(IdempotencyKey.key == key)
+            )).one_or_none()
+        if row is None or row.status_code is None:
+            return (row.request_hash if row else request_hash), None, None
+        stored = row.request_hash, row.status_code, json.loads(row.response_body)
+        _replays.set(key, stored)
+        return stored
+
+    @staticmethod
+    async def complete(key: str, request_hash: str, status_code: int, body: Any) -> None:
+        """Store the response of a claimed key (body must be JSON-serializable)."""
+        _replays.set(key, (request_hash, status_code, body))
+        async with AsyncSessionLocal() as db:
+            row = await db.get(IdempotencyKey, key)
+            if row is not None:
+                row.status_code = status_code
+                row.response_body = json.dumps(body)
+                await db.commit()
+
+    @staticmethod
+    async def release(key: str) -> None:
+        """Drop a claim whose request failed unexpectedly, so a retry executes again."""
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                delete(IdempotencyKey).where(IdempotencyKey.key == key, IdempotencyKey.status_code.is_(None))
+            )
+            await db.commit()
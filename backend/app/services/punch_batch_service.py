@@ -0,0 +1,242 @@
+"""
+Group commit for punches (PUNCH_BATCHING).
+
+At shift change every /auth/punch commits its own transaction, so the database's commit
+latency, not CPU, caps punches per second. With batching on, punches arriving at a worker
+within PUNCH_BATCH_WINDOW_MS are collected and applied in one transaction: one SELECT of the
+users' open sessions, one multi-row INSERT for punch-ins, one UPDATE for punch-outs and one
+attendance_daily upsert, then a single commit. While a batch is being written the next one
+fills up, so batches grow with load on their own.
+
+Each punch still gets its own result, with the same rules and messages as AttendanceService
+(no second punch-in while a session is open, no punch-out without one), applied in arrival
+order, so a punch-in followed by a punch-out of the same user in one batch behaves as if
+they had been sent one after the other. If the batch transaction fails (e.g. an unknown
+user_id violates the foreign key), it is rolled back and every punch of it is replayed
+through AttendanceService on its own, so one bad punch cannot fail its neighbours. Punch-outs
+only close sessions that are still open in the database (UPDATE ... RETURNING), so a session
+closed meanwhile elsewhere is neither counted twice nor reported as closed by this batch.
+"""
+import asyncio
+import contextvars
+import logging
+import uuid
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+from uuid import UUID
+
+from sqlalchemy import and_, case, insert, select, update
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.attendance import Attendance
+from app.services.attendance_service import AttendanceService
+from app.services.data_version_service import DataVersionService
+from app.services.stats_service import StatsService
+from app.utils.metrics import PUNCH_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Same contract as AttendanceService.punch_in / punch_out
+PunchResult = Tuple[bool, str, Optional[Attendance]]
+
+
+class _Punch:
+    __slots__ = ("user_id", "action", "future")
+
+    def __init__(self, user_id: UUID, action: str, future: asyncio.Future):
+        self.user_id = user_id
+        self.action = action
+        self.future = future
+
+
+class PunchBatchService:
+    """Per-worker punch coalescer; at most one batch transaction in flight at a time."""
+
+    _loop: Optional[asyncio.AbstractEventLoop] = None
+    _pending: List[_Punch] = []
+    _timer: Optional[asyncio.TimerHandle] = None
+    _writing = False
+    _tasks: Set[asyncio.Task] = set()
+
+    @classmethod
+    async def submit(cls, user_id: UUID, action: str) -> PunchResult:
+        """Queue a punch ("punch_in" / "punch_out") for the next batch and wait for its result."""
+        loop = asyncio.get_running_loop()
+        if cls._loop is not loop:  # new event loop (tests, reload): forget the old one's state
+            cls._loop, cls._pending, cls._timer, cls._writing = loop, [], None, False
+        punch = _Punch(user_id, action, loop.create_future())
+        cls._pending.append(punch)
+        if not cls._writing:
+            if len(cls._pending) >= settings.PUNCH_BATCH_MAX_SIZE:
+                cls._schedule(0)
+            elif cls._timer is None:
+                cls._schedule(settings.PUNCH_BATCH_WINDOW_MS / 1000)
+        # Shielded: a client hanging up must not cancel a batch other punches are part of
+        return await asyncio.shield(punch.future)
+
+    @classmethod
+    def _schedule(cls, delay: float) -> None:
+        if cls._timer is not None:
+            cls._timer.cancel()
+        # Empty context: the batch's SQL time belongs to no single request's Server-Timing
+        cls._timer = cls._loop.call_later(delay, cls._start_batch, context=contextvars.Context())
+
+    @classmethod
+    def _start_batch(cls) -> None:
+        cls._timer = None
+        if cls._writing or not cls._pending:
+            return
+        batch = cls._pending[:settings.PUNCH_BATCH_MAX_SIZE]
+        cls._pending = cls._pending[len(batch):]
+        cls._writing = True
+        task = cls._loop.create_task(cls._write(batch))
+        cls._tasks.add(task)
+        task.add_done_callback(cls._tasks.discard)
+
+    @classmethod
+    async def _write(cls, batch: List[_Punch]) -> None:
+        try:
+            try:
+                results = await cls._apply_batch(batch)
+            except Exception as e:
+                logger.warning("Punch batch of %d failed (%s); applying its punches one by one", len(batch), e.__class__.__name__)
+                results = []
+                for punch in batch:
+                    try:
+                        results.append(await cls._apply_single(punch))
+                    except Exception as single_error:
+                        results.append(single_error)  # this punch's caller gets the error
+            PUNCH_BATCH_SIZE.observe(len(batch))
+            for punch, result in zip(batch, results):
+                if punch.future.done():
+                    continue
+                if isinstance(result, Exception):
+                    punch.future.set_exception(result)
+                else:
+                    punch.future.set_result(result)
+        except BaseException as e:
+            for punch in batch:
+                if not punch.future.done():
+                    punch.future.set_exception(e)
+            raise
+        finally:
+            cls._writing = False
+            # Punches that arrived meanwhile have waited at least one commit: write them now
+            if cls._pending:
+                cls._schedule(0)
+
+    @staticmethod
+    async def _apply_single(punch: _Punch) -> PunchResult:
+        async with AsyncSessionLocal() as db:
+            if punch.action == "punch_in":
+                return await AttendanceService.punch_in(db, punch.user_id)
+            return await AttendanceService.punch_out(db, punch.user_id)
+
+    @staticmethod
+    async def _apply_batch(batch: List[_Punch]) -> List[PunchResult]:
+        today = date.today().isoformat()
+        now = datetime.now(timezone.utc)
+        async with AsyncSessionLocal() as db:
+            # Columns, not entities: changes go out as the multi-row statements below, not per-row flushes
+            open_rows = (await db.execute(
+                select(Attendance.attendance_id, Attendance.user_id, Attendance.punch_in_time).where(
+                    and_(
+                        Attendance.user_id.in_(list({punch.user_id for punch in batch})),
+                        Attendance.date == today,
+                        Attendance.punch_in_time.isnot(None),
+                        Attendance.punch_out_time.is_(None),
+                    )
+                )
+            )).all()
+            open_sessions: Dict[UUID, Attendance] = {
+                row.user_id: Attendance(
+                    attendance_id=row.attendance_id, user_id=row.user_id, punch_in_time=row.punch_in_time, date=today
+                )
+                for row in open_rows
+            }
+
+            # Apply the punches in arrival order against the open-session state
+            results: List[PunchResult] = []
+            created: List[Attendance] = []
+            closed: List[Attendance] = []
+            closed_by: Dict[UUID, int] = {}  # attendance_id -> index of the punch-out's result
+            for punch in batch:
+                session = open_sessions.get(punch.user_id)
+                if punch.action == "punch_in":
+                    if session is not None:
+                        results.append((False, "You have already punched in today. Please punch out first.", None))
+                        continue
+                    session = Attendance(attendance_id=uuid.uuid4(), user_id=punch.user_id, punch_in_time=now, date=today)
+                    open_sessions[punch.user_id] = session
+                    created.append(session)
+                    results.append((True, "Punch-in successful", session))
+                else:
+                    if session is None:
+                        results.append((False, "No punch-in found for today. Please punch in first.", None))
+                        continue
+                    session.punch_out_time = now
+                    session.total_duration = AttendanceService.calculate_duration(session.punch_in_time, now)
+                    del open_sessions[punch.user_id]
+                    closed.append(session)
+                    closed_by[session.attendance_id] = len(results)
+                    results.append((True, "Punch-out successful", session))
+
+            if not created and not closed:
+                return results
+
+            if created:
+                await db.execute(insert(Attendance).values([
+                    {
+                        "attendance_id": session.attendance_id,
+                        "user_id": session.user_id,
+                        "punch_in_time": session.punch_in_time,
+                        "punch_out_time": session.punch_out_time,
+                        "total_duration": session.total_duration,
+                        "date": session.date,
+                    }
+                    for session in created
+                ]))
+            new_ids = {session.attendance_id for session in created}
+            durations = {s.attendance_id: s.total_duration for s in closed if s.attendance_id not in new_ids}
+            if durations:
+                updated = set((await db.execute(
+                    update(Attendance)
+                    .where(Attendance.attendance_id.in_(durations), Attendance.punch_out_time.is_(None))
+                    .values(punch_out_time=now, total_duration=case(durations, value=Attendance.attendance_id))
+                    .returning(Attendance.attendance_id)
+                )).scalars())
+                # Closed meanwhile by another worker or request: not ours to count or report
+                for attendance_id in set(durations) - updated:
+                    results[closed_by[attendance_id]] = (
+                        False, "No punch-in found for today. Please punch in first.", None
+                    )
+                closed = [s for s in closed if s.attendance_id in new_ids or s.attendance_id in updated]
+            if closed:
+                await AttendanceService.upsert_rollup(db, _merge_rollup_rows(closed))
+
+            await db.commit()
+            # Committed: from here on a failure must not replay the punches through _apply_single
+            try:
+                StatsService.invalidate()
+                await DataVersionService.bump(db)
+            except Exception as e:
+                logger.warning("Punch batch committed but the data version bump failed (%s)", e.__class__.__name__)
+        return results
+
+
+def _merge_rollup_rows(closed: List[Attendance]) -> List[Dict[str, Any]]:
+    """One attendance_daily contribution per (user, date); an upsert may touch each row once."""
+    merged: Dict[Tuple[UUID, str], Dict[str, Any]] = defaultdict(dict)
+    for session in closed:
+        row = AttendanceService.rollup_row(session)
+        entry = merged[row["user_id"], row["date"]]
+        if not entry:
+            entry.update(row)
+            continue
+        entry["session_count"] += row["session_count"]
+        entry["total_seconds"] += row["total_seconds"]
+        entry["first_in"] = min(entry["first_in"], row["first_in"])
+        entry["last_out"] = max(entry["last_out"], row["last_out"])
+    return list(merged.values())
@@ -0,0 +1,153 @@
+"""
+Background registration jobs (REGISTRATION_ASYNC).
+
+POST /auth/register only validates the upload, records a queued job and answers 202; a small
+per-worker thread pool (REGISTRATION_JOB_WORKERS) then encodes the images, runs the duplicate
+check and inserts the user. A DB session is opened only briefly to refresh the gallery and
+for the final insert, never across the seconds of encoding. Job state lives in the
+registration_jobs table, so the status endpoint answers from any worker.
+
+A worker that dies takes its running jobs with it; jobs unfinished after
+REGISTRATION_JOB_TIMEOUT_SECONDS are therefore reported as failed. That is final: a job still
+running somewhere never inserts its user or changes the reported state afterwards.
+"""
+import math
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import List, Optional
+from uuid import UUID
+
+from sqlalchemy import delete, func, update
+
+from app.config import settings
+from app.database import AsyncSessionLocal, SessionLocal
+from app.models.registration_job import RegistrationJob
+from app.utils.metrics import REGISTRATION_JOB_SECONDS, REGISTRATION_JOBS
+
+# Terminal job states
+FINISHED = ("succeeded", "failed")
+
+
+class RegistrationJobService:
+    """Per-worker registration job pool; job rows are shared by all workers"""
+
+    _executor: Optional[ThreadPoolExecutor] = None
+    _pending = 0  # queued + running jobs of this worker
+    _service_seconds = 5.0  # moving average job time, for Retry-After
+    _lock = threading.Lock()
+
+    @classmethod
+    async def submit(
+        cls, username: str, face_images: List[bytes], user_id: Optional[UUID] = None
+    ) -> Optional[RegistrationJob]:
+        """Record a queued job and start it; None if this worker already has REGISTRATION_JOB_MAX_PENDING jobs."""
+        with cls._lock:
+            if cls._pending >= settings.REGISTRATION_JOB_MAX_PENDING:
+                REGISTRATION_JOBS.labels(outcome="rejected").inc()
+                return None
+            cls._pending += 1
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=settings.REGISTRATION_JOB_WORKERS, thread_name_prefix="registration"
+                )
+        try:
+            job = RegistrationJob(job_id=uuid.uuid4(), status="queued", username=username)
+            async with AsyncSessionLocal() as db:
+                # Registrations are rare: dropping expired results here keeps the table small
+                await db.execute(delete(RegistrationJob).where(
+                    RegistrationJob.created_at < func.now() - timedelta(seconds=settings.REGISTRATION_JOB_TTL_SECONDS)
+                ))
+                db.add(job)
+                await db.commit()
+            cls._executor.submit(cls._run, job.job_id, username, face_images, user_id)
+        except BaseException:
+            with cls._lock:
+                cls._pending -= 1
+            raise
+        return job
+
+    @classmethod
+    def retry_after(cls) -> int:
+        """Seconds until this worker's job queue has likely drained, 1..60."""
+        backlog = cls._pending / max(1, settings.REGISTRATION_JOB_WORKERS)
+        return max(1, min(60, math.ceil(backlog * cls._service_seconds)))
+
+    @staticmethod
+    async def get(job_id: UUID) -> Optional[RegistrationJob]:
+        """Current state of a job (from any worker), or None if unknown or expired."""
+        async with AsyncSessionLocal() as db:
+            job = await db.get(RegistrationJob, job_id)
+            if job is None or job.status in FINISHED:
+                return job
+            timeout = func.now() - timedelta(seconds=settings.REGISTRATION_JOB_TIMEOUT_SECONDS)
+            lost = await db.execute(
+                update(RegistrationJob)
+                .where(RegistrationJob.job_id == job_id, RegistrationJob.status.notin_(FINISHED))
+                .where(RegistrationJob.updated_at < timeout)
+                .values(status="failed", message="Registration was interrupted. Please register again.")
+            )
+            if lost.rowcount:
+                await db.commit()
+                await db.refresh(job)
+                REGISTRATION_JOBS.labels(outcome="lost").inc()
+            return job
+
+    @classmethod
+    def _run(cls, job_id: UUID, username: str, face_images: List[bytes], user_id: Optional[UUID]) -> None:
+        # Imported here so workers only load face_recognition/dlib when they process faces
+        from app.services.face_service import FaceService
+        from app.services.gallery_service import GalleryService
+
+        started = time.perf_counter()
+        status, message, user = "failed", "", None
+        try:
+            if not cls._update(job_id, status="running"):
+                status = None  # already reported as failed (timed out in the queue)
+                return
+            success, message, encodings = FaceService.encode_registration_images(face_images)
+            if success:
+                with SessionLocal() as db:
+                    gallery = GalleryService.current(db)
+                if FaceService.is_registered_face(gallery, encodings):
+                    success, message = False, "This face is already registered. Please use a different person."
+            # Re-claim right before the insert: skips it if get() gave up on the job meanwhile, and
+            # restarts the timeout so the job cannot be given up between insert and final update
+            if success and not cls._update(job_id, status="running"):
+                status = None
+                return
+            if success:
+                with SessionLocal() as db:
+                    success, message, user = FaceService.save_registered_user(db, username, encodings, user_id=user_id)
+            status = "succeeded" if success else "failed"
+        except Exception as e:
+            message = f"Error registering user: {str(e)}"
+        finally:
+            seconds = time.perf_counter() - started
+            REGISTRATION_JOB_SECONDS.observe(seconds)
+            if status is not None:
+                REGISTRATION_JOBS.labels(outcome=status).inc()
+            with cls._lock:
+                cls._pending -= 1
+                cls._service_seconds = 0.8 * cls._service_seconds + 0.2 * seconds
+        cls._update(
+            job_id,
+            status=status,
+            message=message,
+            user_id=user.user_id if user else None,
+            user_number=user.user_number if user else None,
+        )
+
+    @staticmethod
+    def _update(job_id: UUID, **values) -> bool:
+        """Update an unfinished job (bumping updated_at); False if it already finished."""
+        with SessionLocal() as db:
+            result = db.execute(
+                update(RegistrationJob)
+                .where(RegistrationJob.job_id == job_id, RegistrationJob.status.notin_(FINISHED))
+                .values(**values)
+            )
+            db.commit()
+            return result.rowcount > 0
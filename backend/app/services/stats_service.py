@@ -0,0 +1,58 @@
+from typing import Any, Dict
+from datetime import date
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, distinct, func, select
+from app.models.attendance import Attendance
+from app.models.user import User
+from app.utils.cache import TTLCache
+from app.config import settings
+
+# Keyed by date, so the counters roll over at midnight without an explicit flush
+_today_stats_cache = TTLCache(ttl_seconds=settings.STATS_CACHE_TTL_SECONDS, max_entries=8)
+
+
+class StatsService:
+    """Service for dashboard counters"""
+
+    @staticmethod
+    def invalidate() -> None:
+        """Drop cached counters. Called after punches and registrations in this worker."""
+        _today_stats_cache.invalidate()
+
+    @staticmethod
+    async def compute_today_stats(db: AsyncSession, target_date: str) -> Dict[str, Any]:
+        """All dashboard counters for a date (YYYY-MM-DD) in one SQL statement."""
+        total_users = select(func.count()).select_from(User).scalar_subquery()
+        row = (await db.execute(
+            select(
+                total_users.label("total_users"),
+                func.count(Attendance.attendance_id).label("records"),
+                func.count(distinct(Attendance.user_id)).label("present"),
+                func.count(Attendance.attendance_id).filter(
+                    and_(Attendance.punch_in_time.isnot(None), Attendance.punch_out_time.is_(None))
+                ).label("active"),
+                func.count(Attendance.attendance_id).filter(
+                    and_(Attendance.punch_in_time.isnot(None), Attendance.punch_out_time.isnot(None))
+                ).label("punched_out"),
+            )
+            .where(Attendance.date == target_date)
+        )).one()
+        return {
+            "date": target_date,
+            "total_users": row.total_users,
+            "today_attendance": row.records,
+            "present": row.present,
+            "active": row.active,
+            "punched_out": row.punched_out,
+            "absent": max(0, row.total_users - row.present),
+        }
+
+    @staticmethod
+    async def get_today_stats(db: AsyncSession) -> Dict[str, Any]:
+        """Today's counters, served from a short-TTL cache that writes invalidate."""
+        today = date.today().isoformat()
+        stats = _today_stats_cache.get(today)
+        if stats is None:
+            stats = await StatsService.compute_today_stats(db, today)
+            _today_stats_cache.set(today, stats)
+        return stats
@@ -0,0 +1,63 @@
+"""
+Worker start-up: the recognition warm-up phase and the start-up time report.
+
+Importing the app does no database work and does not load face_recognition/dlib or cv2, so a
+worker can serve read-only requests right away. The recognition stack is then loaded according
+to WARMUP_MODE: "background" (default, in a thread after the worker is ready), "startup"
+(before the worker accepts requests) or "off" (on the first recognition request).
+"""
+import threading
+import time
+
+from app.config import settings
+from app.utils.metrics import STARTUP_SECONDS
+
+
+def warm_up_recognition() -> float:
+    """
+    Import the recognition stack, run one tiny detection so dlib's models are loaded, and load
+    the face gallery (from its snapshot when there is one).
+    """
+    start = time.perf_counter()
+    import numpy as np
+    import face_recognition
+
+    import app.services.face_service  # noqa: F401
+    import app.utils.spoof_prevention  # noqa: F401
+    from app.database import SessionLocal
+    from app.services.gallery_service import GalleryService
+
+    face_recognition.face_locations(np.zeros((32, 32, 3), dtype=np.uint8))
+    db = SessionLocal()
+    try:
+        GalleryService.load(db)
+    finally:
+        db.close()
+    elapsed = time.perf_counter() - start
+    STARTUP_SECONDS.labels(phase="warmup").set(elapsed)
+    return elapsed
+
+
+def _warm_up_and_report() -> None:
+    try:
+        elapsed = warm_up_recognition()
+        print(f"Recognition warm-up finished in {elapsed * 1000:.0f} ms")
+    except Exception as e:
+        print(f"Recognition warm-up failed (will load on first request): {e}")
+
+
+def on_startup(import_seconds: float, import_started: float) -> None:
+    """Run the configured warm-up and report how long the worker took to become ready."""
+    STARTUP_SECONDS.labels(phase="import").set(import_seconds)
+    mode = settings.WARMUP_MODE
+    if mode == "startup":
+        _warm_up_and_report()
+    elif mode == "background":
+        threading.Thread(target=_warm_up_and_report, name="recognition-warmup", daemon=True).start()
+
+    ready = time.perf_counter() - import_started
+    STARTUP_SECONDS.labels(phase="ready").set(ready)
+    print(
+        f"Worker ready in {ready * 1000:.0f} ms (app import {import_seconds * 1000:.0f} ms, "
+        f"recognition warm-up: {mode})"
+    )
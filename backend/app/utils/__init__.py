@@ -1,21 +1,24 @@
-from app.utils.face_recognition_utils import (
-    encode_face_image,
-    encode_face_image_enhanced,
-    match_face,
-    check_duplicate_face,
-    encode_to_string,
-    string_to_encoding
-)
-from app.utils.spoof_prevention import SpoofPrevention, process_video_frame_for_spoof, check_liveness_sequence
+# Re-exports resolve on first access, so importing a light helper (cache, metrics) does not
+# load face_recognition/dlib and cv2 into read-only workers.
+from importlib import import_module
 
-__all__ = [
-    "encode_face_image",
-    "encode_face_image_enhanced",
-    "match_face",
-    "check_duplicate_face",
-    "encode_to_string",
-    "string_to_encoding",
-    "SpoofPrevention",
-    "process_video_frame_for_spoof",
-    "check_liveness_sequence",
-]
+_EXPORTS = {
+    "encode_face_image": "app.utils.face_recognition_utils",
+    "encode_face_image_enhanced": "app.utils.face_recognition_utils",
+    "match_face": "app.utils.face_recognition_utils",
+    "check_duplicate_face": "app.utils.face_recognition_utils",
+    "encode_to_string": "app.utils.face_recognition_utils",
+    "string_to_encoding": "app.utils.face_recognition_utils",
+    "SpoofPrevention": "app.utils.spoof_prevention",
+    "process_video_frame_for_spoof": "app.utils.spoof_prevention",
+    "check_liveness_sequence": "app.utils.spoof_prevention",
+    "TTLCache": "app.utils.cache",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(import_module(_EXPORTS[name]), name)
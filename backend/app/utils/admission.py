@@ -0,0 +1,182 @@
+"""
+Admission control: per-endpoint-class concurrency and queue limits with fast 503s.
+
+Recognition and registration spend seconds of CPU in dlib per request. Without a limit a burst
+(shift change) fills the threadpool with them, every request slows down together and cheap
+reads and punches wait behind face encoding. Each worker process therefore admits at most N
+requests of a class at a time, queues up to M more (first come, first served), and answers
+anything beyond that, or anything that queued longer than ADMISSION_QUEUE_TIMEOUT_SECONDS,
+with 503 and a Retry-After estimated from recent service times. Classes have separate limits,
+so reads and punches never wait for a recognition slot.
+
+Time spent queued is exported as attendance_admission_queue_seconds and appears as the
+"queue" entry of Server-Timing.
+"""
+import asyncio
+import json
+import math
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from app.config import settings
+from app.utils.metrics import (
+    ADMISSION_IN_FLIGHT,
+    ADMISSION_QUEUE_SECONDS,
+    ADMISSION_QUEUED,
+    ADMISSION_REJECTIONS,
+    current_timings,
+)
+
+# Paths (after API_V1_PREFIX) of the expensive endpoint classes; everything else is "reads"
+_CLASS_PATHS = {
+    "/auth/authenticate": "recognition",
+    "/auth/register": "registration",
+}
+# Never limited: monitoring must answer while the API sheds load
+_EXEMPT_PATHS = {"/metrics", "/health"}
+
+
+class _Limiter:
+    """At most `concurrency` holders, at most `queue_size` waiters; a release hands the slot to the oldest waiter."""
+
+    def __init__(self, name: str, concurrency: int, queue_size: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.active = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.service_seconds = 1.0  # moving average, for Retry-After and recognition quality
+
+    async def acquire(self, timeout: float) -> Optional[str]:
+        """None once admitted, otherwise the rejection reason ("queue_full" or "timeout")."""
+        if self.active < self.concurrency and not self.waiters:
+            self.active += 1
+            return None
+        if len(self.waiters) >= self.queue_size:
+            return "queue_full"
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        ADMISSION_QUEUED.labels(endpoint_class=self.name).inc()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+            return None
+        except asyncio.TimeoutError:
+            if waiter.done():
+                return None  # handed a slot just as the timeout fired
+            waiter.cancel()
+            return "timeout"
+        except asyncio.CancelledError:
+            # Client went away while queued: pass on a slot we were handed meanwhile
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            waiter.cancel()
+            raise
+        finally:
+            ADMISSION_QUEUED.labels(endpoint_class=self.name).dec()
+            try:
+                self.waiters.remove(waiter)
+            except ValueError:
+                pass
+
+    def release(self) -> None:
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)  # the slot moves to the waiter; active is unchanged
+                return
+        self.active -= 1
+
+    def observe(self, seconds: float) -> None:
+        self.service_seconds = 0.8 * self.service_seconds + 0.2 * seconds
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue has likely drained, 1..60."""
+        backlog = (len(self.waiters) + self.active) / max(1, self.concurrency)
+        return max(1, min(60, math.ceil(backlog * self.service_seconds)))
+
+
+# Limiters of this worker by class (set up by AdmissionMiddleware), for pressure()
+_LIMITERS: Dict[str, _Limiter] = {}
+
+
+def pressure(endpoint_class: str) -> Tuple[int, float]:
+    """
+    (requests queued or in flight, average service seconds) for an endpoint class in this
+    worker; (0, 0.0) when the class is not limited.
+    """
+    limiter = _LIMITERS.get(endpoint_class)
+    if limiter is None:
+        return 0, 0.0
+    return limiter.active + len(limiter.waiters), limiter.service_seconds
+
+
+def _limits() -> Dict[str, tuple]:
+    return {
+        "recognition": (settings.ADMISSION_RECOGNITION_CONCURRENCY, settings.ADMISSION_RECOGNITION_QUEUE),
+        "registration": (settings.ADMISSION_REGISTRATION_CONCURRENCY, settings.ADMISSION_REGISTRATION_QUEUE),
+        "reads": (settings.ADMISSION_READS_CONCURRENCY, settings.ADMISSION_READS_QUEUE),
+    }
+
+
+def endpoint_class(path: str) -> Optional[str]:
+    """Admission class of a request path, or None if it is never limited."""
+    if path in _EXEMPT_PATHS or not path.startswith(settings.API_V1_PREFIX):
+        return None
+    return _CLASS_PATHS.get(path[len(settings.API_V1_PREFIX):].rstrip("/"), "reads")
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying the per-class limits (ADMISSION_<CLASS>_CONCURRENCY / _QUEUE; 0 = unlimited)."""
+
+    def __init__(self, app):
+        self.app = app
+        self.limiters = {
+            name: _Limiter(name, concurrency, queue_size)
+            for name, (concurrency, queue_size) in _limits().items()
+            if concurrency > 0
+        }
+        _LIMITERS.update(self.limiters)
+
+    async def _reject(self, send, limiter: _Limiter, reason: str) -> None:
+        ADMISSION_REJECTIONS.labels(endpoint_class=limiter.name, reason=reason).inc()
+        retry_after = limiter.retry_after()
+        body = json.dumps({"detail": f"Server busy, please retry in {retry_after} s."}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        limiter = None
+        if scope["type"] == "http" and scope["method"] != "OPTIONS":
+            limiter = self.limiters.get(endpoint_class(scope["path"]))
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        queued_at = time.perf_counter()
+        reason = await limiter.acquire(settings.ADMISSION_QUEUE_TIMEOUT_SECONDS)
+        waited = time.perf_counter() - queued_at
+        ADMISSION_QUEUE_SECONDS.labels(endpoint_class=limiter.name).observe(waited)
+        timings = current_timings()
+        if timings is not None:
+            timings.add("queue", waited)
+        if reason is not None:
+            await self._reject(send, limiter, reason)
+            return
+
+        ADMISSION_IN_FLIGHT.labels(endpoint_class=limiter.name).inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.observe(time.perf_counter() - started)
+            limiter.release()
+            ADMISSION_IN_FLIGHT.labels(endpoint_class=limiter.name).dec()
@@ -0,0 +1,20 @@
+from typing import Optional
+from fastapi import Request, Response
+
+# Clients must revalidate every time; unchanged data costs a 304 with no body
+CACHE_CONTROL = "no-cache"
+
+
+def not_modified(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """
+    Set ETag headers on the response. If the client's If-None-Match already matches,
+    return a 304 to send instead of the body; otherwise None.
+    """
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = [t.strip() for t in if_none_match.split(",")]
+        if "*" in tags or etag in tags or etag.removeprefix("W/") in tags:
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+    return None
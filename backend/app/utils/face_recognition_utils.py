@@ -1,40 +1,52 @@
+import dlib
 import face_recognition
 import numpy as np
 import cv2
 from typing import List, Tuple, Optional
 import json
 from app.config import settings
+from app.utils.metrics import timed
+from app.utils.quality import QualityLevel
 
 
-def _decode_and_rgb(image_bytes: bytes) -> Optional[tuple]:
-    """Decode image bytes to RGB. Returns (rgb_image, bgr_image) or None."""
+def _decode_and_rgb(image_bytes: bytes, max_side: Optional[int] = None) -> Optional[tuple]:
+    """Decode image bytes to RGB (downscaled so the longest side is at most max_side). Returns (rgb_image, bgr_image) or None."""
     try:
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        if image is None:
-            return None
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        with timed("decode"):
+            nparr = np.frombuffer(image_bytes, np.uint8)
+            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            if image is None:
+                return None
+            if max_side and max(image.shape[:2]) > max_side:
+                scale = max_side / max(image.shape[:2])
+                image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
         return (rgb_image, image)
     except Exception:
         return None
 
 
-def encode_face_image(image_bytes: bytes, num_jitters: int = 1) -> Optional[np.ndarray]:
+def encode_face_image(
+    image_bytes: bytes, num_jitters: int = 1, max_side: Optional[int] = None, upsample: int = 1
+) -> Optional[np.ndarray]:
     """
     Encode a face from image bytes (original image, no preprocessing).
+    upsample: detector upsampling passes (0 is enough for a face crop, where the face is large).
     Returns face encoding (128-dimensional vector) or None if no face found.
     """
     try:
-        decoded = _decode_and_rgb(image_bytes)
+        decoded = _decode_and_rgb(image_bytes, max_side)
         if decoded is None:
             return None
         rgb_image, _ = decoded
-        face_locations = face_recognition.face_locations(rgb_image)
+        with timed("detect"):
+            face_locations = face_recognition.face_locations(rgb_image, number_of_times_to_upsample=upsample)
         if len(face_locations) == 0:
             return None
-        face_encodings = face_recognition.face_encodings(
-            rgb_image, face_locations, num_jitters=num_jitters
-        )
+        with timed("encode"):
+            face_encodings = face_recognition.face_encodings(
+                rgb_image, face_locations, num_jitters=num_jitters
+            )
         if len(face_encodings) == 0:
             return None
         return face_encodings[0]
@@ -43,12 +55,14 @@ def encode_face_image(image_bytes: bytes, num_jitters: int = 1) -> Optional[np.n
         return None
 
 
-def encode_face_image_enhanced(image_bytes: bytes, num_jitters: int = 1) -> Optional[np.ndarray]:
+def encode_face_image_enhanced(
+    image_bytes: bytes, num_jitters: int = 1, max_side: Optional[int] = None, upsample: int = 1
+) -> Optional[np.ndarray]:
     """
     Enhanced face encoding with histogram equalization (helps in poor lighting).
     """
     try:
-        decoded = _decode_and_rgb(image_bytes)
+        decoded = _decode_and_rgb(image_bytes, max_side)
         if decoded is None:
             return None
         _, image = decoded
@@ -56,12 +70,14 @@ def encode_face_image_enhanced(image_bytes: bytes, num_jitters: int = 1) -> Opti
         equalized = cv2.equalizeHist(gray)
         enhanced = cv2.cvtColor(equalized, cv2.COLOR_GRAY2BGR)
         rgb_image = cv2.cvtColor(enhanced, cv2.COLOR_BGR2RGB)
-        face_locations = face_recognition.face_locations(rgb_image)
+        with timed("detect"):
+            face_locations = face_recognition.face_locations(rgb_image, number_of_times_to_upsample=upsample)
         if len(face_locations) == 0:
             return None
-        face_encodings = face_recognition.face_encodings(
-            rgb_image, face_locations, num_jitters=num_jitters
-        )
+        with timed("encode"):
+            face_encodings = face_recognition.face_encodings(
+                rgb_image, face_locations, num_jitters=num_jitters
+            )
         if len(face_encodings) == 0:
             return None
         return face_encodings[0]
@@ -70,16 +86,77 @@ def encode_face_image_enhanced(image_bytes: bytes, num_jitters: int = 1) -> Opti
         return None
 
 
-def encode_face_image_robust(image_bytes: bytes) -> Optional[np.ndarray]:
+def encode_face_image_robust(
+    image_bytes: bytes, quality: Optional[QualityLevel] = None, upsample: int = 1
+) -> Optional[np.ndarray]:
     """
     Try to detect and encode a face: original image first, then enhanced.
     Uses more jitters for stable encoding. Reduces 'no face detected' and wrong-person matches.
+    quality (see app.utils.quality) trades accuracy for speed under load; default is full quality.
     """
-    num_jitters = getattr(settings, "FACE_ENCODING_NUM_JITTERS", 3)
-    encoding = encode_face_image(image_bytes, num_jitters=num_jitters)
-    if encoding is not None:
+    if quality is None:
+        num_jitters, enhanced_fallback, max_side = getattr(settings, "FACE_ENCODING_NUM_JITTERS", 3), True, None
+    else:
+        num_jitters, enhanced_fallback, max_side = quality.num_jitters, quality.enhanced_fallback, quality.max_side
+    encoding = encode_face_image(image_bytes, num_jitters=num_jitters, max_side=max_side, upsample=upsample)
+    if encoding is not None or not enhanced_fallback:
         return encoding
-    return encode_face_image_enhanced(image_bytes, num_jitters=num_jitters)
+    return encode_face_image_enhanced(image_bytes, num_jitters=num_jitters, max_side=max_side, upsample=upsample)
+
+
+def encode_face_images(
+    images: List[bytes], quality: Optional[QualityLevel] = None, upsample: int = 1
+) -> List[np.ndarray]:
+    """
+    Encode several captures of one face with a single batched descriptor call (AUTH_FUSION_FRAMES).
+    Detection and landmarks run per image, with the same enhanced retry and quality level as
+    encode_face_image_robust; images without a face are left out. Returns one encoding per
+    image where a face was found, in input order.
+    """
+    if quality is None:
+        num_jitters, enhanced_fallback, max_side = getattr(settings, "FACE_ENCODING_NUM_JITTERS", 3), True, None
+    else:
+        num_jitters, enhanced_fallback, max_side = quality.num_jitters, quality.enhanced_fallback, quality.max_side
+    batch_images, batch_faces = [], []
+    try:
+        for image_bytes in images:
+            decoded = _decode_and_rgb(image_bytes, max_side)
+            if decoded is None:
+                continue
+            rgb_image, image = decoded
+            with timed("detect"):
+                face_locations = face_recognition.face_locations(rgb_image, number_of_times_to_upsample=upsample)
+                if not face_locations and enhanced_fallback:
+                    equalized = cv2.equalizeHist(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY))
+                    rgb_image = cv2.cvtColor(equalized, cv2.COLOR_GRAY2RGB)
+                    face_locations = face_recognition.face_locations(rgb_image, number_of_times_to_upsample=upsample)
+            if not face_locations:
+                continue
+            with timed("encode"):
+                # Same (5-point) landmarks face_recognition.face_encodings uses, first face only
+                landmarks = face_recognition.api._raw_face_landmarks(rgb_image, face_locations[:1], model="small")
+            faces = dlib.full_object_detections()
+            faces.append(landmarks[0])
+            batch_images.append(rgb_image)
+            batch_faces.append(faces)
+        if not batch_images:
+            return []
+        with timed("encode"):
+            descriptors = face_recognition.api.face_encoder.compute_face_descriptor(
+                batch_images, batch_faces, num_jitters
+            )
+        return [np.array(image_descriptors[0]) for image_descriptors in descriptors]
+    except Exception as e:
+        print(f"Error encoding faces (batch): {e}")
+        return []
+
+
+def fuse_encodings(encodings: List[np.ndarray], method: str = "mean") -> np.ndarray:
+    """One encoding for several captures of the same face: component-wise mean or median."""
+    stacked = np.vstack(encodings)
+    if method == "median":
+        return np.median(stacked, axis=0)
+    return stacked.mean(axis=0)
 
 
 def match_face(face_encoding: np.ndarray, stored_encodings: List[str], threshold: float = None) -> Tuple[bool, float]:
@@ -0,0 +1,107 @@
+"""
+Cheap quality score for the captured frames of one authentication.
+
+Liveness already decodes every frame and finds the face with a Haar cascade; scoring that
+face region (Laplacian sharpness, brightness, face size, position) costs well under a
+millisecond per frame. Recognition then runs on the best frame instead of the last one, and
+frames that dlib would certainly fail on (too blurred, too dark or bright, face too small)
+are never encoded. A request whose frames all fail gets the reason back, so the user can fix
+it on the retry.
+"""
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app.config import settings
+from app.utils.metrics import FRAME_QUALITY_REJECTIONS
+
+# Face regions are compared at this size, so sharpness does not depend on the face's size
+_SHARPNESS_SIDE = 96
+
+# Shown to the user when every frame of a request was rejected for this reason
+REJECTION_MESSAGES = {
+    "blurred": "Image too blurred. Please hold still for a moment and try again.",
+    "too_dark": "Too dark. Please face the light or turn on more light and try again.",
+    "too_bright": "Too bright. Please avoid direct light on your face and try again.",
+    "face_too_small": "Face too small. Please move closer to the camera and try again.",
+}
+
+
+class FrameQuality:
+    """Quality of the face region of one frame"""
+
+    def __init__(self, sharpness: float, brightness: float, face_size: int, offset: float):
+        self.sharpness = sharpness  # variance of the Laplacian, face scaled to _SHARPNESS_SIDE
+        self.brightness = brightness  # mean gray level of the face, 0..255
+        self.face_size = face_size  # face width in pixels of the image recognition runs on
+        self.offset = offset  # face center distance from the image center, 0 (centered) .. 1 (corner)
+
+    @property
+    def rejection(self) -> Optional[str]:
+        """Why recognition would certainly fail on this frame, or None."""
+        if self.face_size < settings.FRAME_MIN_FACE_SIZE:
+            return "face_too_small"
+        if self.brightness < settings.FRAME_MIN_BRIGHTNESS:
+            return "too_dark"
+        if self.brightness > settings.FRAME_MAX_BRIGHTNESS:
+            return "too_bright"
+        if self.sharpness < settings.FRAME_MIN_SHARPNESS:
+            return "blurred"
+        return None
+
+    @property
+    def score(self) -> float:
+        """0..1, higher is better; only used to rank the frames of one request."""
+        sharpness = min(1.0, self.sharpness / (4 * settings.FRAME_MIN_SHARPNESS))
+        exposure = 1.0 - min(1.0, abs(self.brightness - 128.0) / 128.0)
+        size = min(1.0, self.face_size / 120.0)
+        return 0.4 * sharpness + 0.2 * exposure + 0.25 * size + 0.15 * (1.0 - self.offset)
+
+
+def assess_frame(gray: np.ndarray, face: Tuple[int, int, int, int]) -> FrameQuality:
+    """Quality of the face (x, y, width, height) in a grayscale image."""
+    height, width = gray.shape[:2]
+    x, y, w, h = face
+    x0, y0 = max(0, x), max(0, y)
+    region = gray[y0:min(height, y + h), x0:min(width, x + w)]
+    if region.size == 0:
+        return FrameQuality(0.0, 0.0, 0, 1.0)
+    interpolation = cv2.INTER_AREA if region.shape[1] > _SHARPNESS_SIDE else cv2.INTER_LINEAR
+    scaled = cv2.resize(region, (_SHARPNESS_SIDE, _SHARPNESS_SIDE), interpolation=interpolation)
+    sharpness = float(cv2.Laplacian(scaled, cv2.CV_64F).var())
+    dx = (x + w / 2) / width - 0.5
+    dy = (y + h / 2) / height - 0.5
+    offset = min(1.0, float(np.hypot(dx, dy)) / np.hypot(0.5, 0.5))
+    return FrameQuality(sharpness, float(region.mean()), int(w), offset)
+
+
+class BestFrame:
+    """Ranks the frames of a sequence that pass the quality gate (FRAME_QUALITY_GATE)."""
+
+    def __init__(self):
+        self._accepted: List[Tuple[float, int, bytes]] = []  # (score, arrival, frame or crop)
+        self._rejected_score = -1.0
+        self.rejection: Optional[str] = None  # reason of the best rejected frame, if none was acceptable
+
+    def offer(self, data: bytes, quality: FrameQuality) -> None:
+        rejection = quality.rejection if settings.FRAME_QUALITY_GATE else None
+        score = quality.score
+        if rejection is not None:
+            FRAME_QUALITY_REJECTIONS.labels(reason=rejection).inc()
+            if score > self._rejected_score:
+                self._rejected_score, self.rejection = score, rejection
+        else:
+            self._accepted.append((score, len(self._accepted), data))
+
+    @property
+    def ranked(self) -> List[bytes]:
+        """Acceptable frames, best first (earlier frame first on equal scores)."""
+        return [data for _, _, data in sorted(self._accepted, key=lambda item: (-item[0], item[1]))]
+
+    @property
+    def message(self) -> Optional[str]:
+        """User-facing reason when frames with a face were seen but none was acceptable."""
+        if self._accepted or self.rejection is None:
+            return None
+        return REJECTION_MESSAGES[self.rejection]
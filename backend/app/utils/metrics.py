@@ -0,0 +1,319 @@
+"""
+Prometheus metrics and per-request stage timings.
+
+Stage timers (decode, detect, encode, match, liveness, db) feed both the Prometheus
+histograms exposed at /metrics and the Server-Timing header of the current response.
+"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Type
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+_STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+STAGE_SECONDS = Histogram(
+    "attendance_stage_seconds",
+    "Time spent in a recognition pipeline stage",
+    ["stage"],
+    buckets=_STAGE_BUCKETS,
+)
+DB_SECONDS = Histogram(
+    "attendance_db_seconds",
+    "Time spent executing SQL per request, by route",
+    ["route"],
+    buckets=_STAGE_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "attendance_request_seconds",
+    "Request latency by route",
+    ["route", "method"],
+    buckets=_STAGE_BUCKETS,
+)
+MATCH_OUTCOMES = Counter(
+    "attendance_face_match_outcomes_total",
+    "Face authentication outcomes",
+    ["outcome"],
+)
+FRAME_QUALITY_REJECTIONS = Counter(
+    "attendance_frame_quality_rejections_total",
+    "Captured frames not used for recognition because of their quality",
+    ["reason"],
+)
+AUTH_RETRIES = Histogram(
+    "attendance_auth_retries_per_login",
+    "Failed authentication attempts before a successful login (X-Auth-Attempt - 1)",
+    buckets=(0, 1, 2, 3, 5, 8, 13),
+)
+AUTH_ATTEMPTS = Counter(
+    "attendance_auth_attempts_total",
+    "Authentications by client attempt (first, retry, unknown = no X-Auth-Attempt), result and fused frames",
+    ["attempt", "result", "fusion_frames"],
+)
+AUTH_CPU_SECONDS = Counter(
+    "attendance_auth_cpu_seconds_total",
+    "CPU time of the liveness and recognition threads of authentications, by fused frames",
+    ["fusion_frames"],
+)
+IDEMPOTENCY_REQUESTS = Counter(
+    "attendance_idempotency_requests_total",
+    "Requests with an Idempotency-Key (executed, replayed, in_progress, mismatch)",
+    ["endpoint", "result"],
+)
+REGISTRATION_JOBS = Counter(
+    "attendance_registration_jobs_total",
+    "Background registration jobs by outcome (succeeded, failed, rejected, lost)",
+    ["outcome"],
+)
+REGISTRATION_JOB_SECONDS = Histogram(
+    "attendance_registration_job_seconds",
+    "Time a background registration job spent encoding, checking and inserting",
+    buckets=_STAGE_BUCKETS,
+)
+PUNCH_BATCH_SIZE = Histogram(
+    "attendance_punch_batch_size",
+    "Punches applied per group-commit transaction (PUNCH_BATCHING)",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+TEMPLATE_UPDATES = Counter(
+    "attendance_face_template_updates_total",
+    "Learned face encodings added to or evicted from users' templates",
+    ["action"],
+)
+GALLERY_USERS = Gauge(
+    "attendance_gallery_users",
+    "Registered users scanned by the last authentication",
+    multiprocess_mode="max",
+)
+GALLERY_ENCODINGS = Gauge(
+    "attendance_gallery_encodings",
+    "Stored face encodings scanned by the last authentication",
+    multiprocess_mode="max",
+)
+POOL_CHECKOUTS = Counter(
+    "attendance_db_pool_checkouts_total",
+    "Connections checked out of the SQLAlchemy pool",
+    ["engine"],
+)
+POOL_WAITS = Counter(
+    "attendance_db_pool_waits_total",
+    "Checkouts that found every pooled connection busy",
+    ["engine"],
+)
+POOL_CHECKOUT_SECONDS = Histogram(
+    "attendance_db_pool_checkout_seconds",
+    "Time spent getting a connection from the SQLAlchemy pool (blocked waiting, or opening one)",
+    ["engine"],
+    buckets=_STAGE_BUCKETS,
+)
+STARTUP_SECONDS = Gauge(
+    "attendance_startup_seconds",
+    "Worker start-up time by phase (import, ready, warmup)",
+    ["phase"],
+    multiprocess_mode="max",
+)
+RECOGNITION_QUALITY = Gauge(
+    "attendance_recognition_quality_level",
+    "Recognition quality level in use (0 = full, 1 = reduced, 2 = minimal)",
+    multiprocess_mode="max",
+)
+RECOGNITION_QUALITY_REQUESTS = Counter(
+    "attendance_recognition_quality_requests_total",
+    "Authentications by the quality level they ran at",
+    ["level"],
+)
+ADMISSION_QUEUE_SECONDS = Histogram(
+    "attendance_admission_queue_seconds",
+    "Time a request waited for an admission slot (rejected ones included)",
+    ["endpoint_class"],
+    buckets=_STAGE_BUCKETS,
+)
+ADMISSION_REJECTIONS = Counter(
+    "attendance_admission_rejections_total",
+    "Requests answered 503 by admission control",
+    ["endpoint_class", "reason"],
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    "attendance_admission_in_flight",
+    "Admitted requests being processed",
+    ["endpoint_class"],
+    multiprocess_mode="livesum",
+)
+ADMISSION_QUEUED = Gauge(
+    "attendance_admission_queued",
+    "Requests waiting for an admission slot",
+    ["endpoint_class"],
+    multiprocess_mode="livesum",
+)
+
+
+class RequestTimings:
+    """Accumulated seconds per stage for one request."""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def server_timing(self, total: Optional[float] = None) -> str:
+        parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages.items()]
+        if total is not None:
+            parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+
+# Holds a mutable RequestTimings, so worker threads (run_in_threadpool copies the context)
+# add to the same object the middleware reads.
+_current_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current_timings.get()
+
+
+@contextmanager
+def timed(stage: str):
+    """Time a block: observe the stage histogram and add it to the current request's Server-Timing."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage=stage).observe(elapsed)
+        timings = _current_timings.get()
+        if timings is not None:
+            timings.add(stage, elapsed)
+
+
+def record_match_outcome(outcome: str) -> None:
+    MATCH_OUTCOMES.labels(outcome=outcome).inc()
+
+
+def record_authentication(success: bool, attempt: Optional[int], cpu_seconds: float, fusion_frames: int) -> None:
+    """
+    Per-authentication counters. First-attempt success rate is
+    attempts{attempt="first",result="success"} / attempts{attempt="first"}; CPU per successful
+    login is cpu_seconds_total / attempts{result="success"} (both per fusion_frames).
+    """
+    frames = str(fusion_frames)
+    AUTH_CPU_SECONDS.labels(fusion_frames=frames).inc(cpu_seconds)
+    if attempt is None or attempt < 1:
+        kind = "unknown"
+    else:
+        kind = "first" if attempt == 1 else "retry"
+    AUTH_ATTEMPTS.labels(attempt=kind, result="success" if success else "failure", fusion_frames=frames).inc()
+    if success and kind != "unknown":
+        AUTH_RETRIES.observe(attempt - 1)
+
+
+def metered_pool(pool_class: Type[QueuePool], name: str) -> Type[QueuePool]:
+    """
+    pool_class (QueuePool or AsyncAdaptedQueuePool) that records checkouts, checkouts that had
+    to wait for a connection to be returned, and the time spent getting one, as engine=name.
+    Pass it as poolclass; the engine keeps it when the pool is disposed and recreated.
+    """
+
+    class MeteredPool(pool_class):
+        def _do_get(self):
+            # Same condition QueuePool waits on: no idle connection and no overflow left
+            waits = self.checkedin() == 0 and 0 <= self._max_overflow <= self.overflow()
+            start = time.perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                POOL_CHECKOUTS.labels(engine=name).inc()
+                if waits:
+                    POOL_WAITS.labels(engine=name).inc()
+                POOL_CHECKOUT_SECONDS.labels(engine=name).observe(time.perf_counter() - start)
+
+    MeteredPool.__name__ = f"Metered{pool_class.__name__}"
+    return MeteredPool
+
+
+def instrument_engine(engine: Engine, name: str) -> None:
+    """Attach SQL timing metrics to a (sync) engine (pool metrics: metered_pool)."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        timings = _current_timings.get()
+        if timings is not None:
+            timings.add("db", elapsed)
+
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: gives each request a RequestTimings, adds the Server-Timing header
+    and records request and per-route DB time.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths: Optional[Dict] = None
+
+    def _route_label(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._route_paths is None:
+            root = scope.get("app")
+            self._route_paths = {
+                getattr(route, "endpoint", None): getattr(route, "path", "")
+                for route in getattr(root, "routes", [])
+            }
+        return self._route_paths.get(endpoint, getattr(endpoint, "__name__", "unknown"))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current_timings.set(timings)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                header = timings.server_timing(total=time.perf_counter() - start)
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"server-timing", header.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_timings.reset(token)
+            route = self._route_label(scope)
+            REQUEST_SECONDS.labels(route=route, method=scope["method"]).observe(time.perf_counter() - start)
+            DB_SECONDS.labels(route=route).observe(timings.stages.get("db", 0.0))
+
+
+def metrics_payload() -> bytes:
+    """Render metrics; aggregates all gunicorn workers when PROMETHEUS_MULTIPROC_DIR is set."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
+
+
+METRICS_CONTENT_TYPE = CONTENT_TYPE_LATEST
@@ -0,0 +1,271 @@
+"""
+Opt-in per-request profiling.
+
+A request is profiled when an admin asks for it (X-Profile header plus X-Admin-Token), or when it
+is picked by PROFILING_SAMPLE_RATE. A background thread samples the stacks of the threads running
+the request: the event-loop thread, plus threadpool threads while they run the request's work
+(profiled_thread / profiled_iter tag them, so other requests' threadpool work is left out). The
+result is saved as speedscope JSON in a bounded on-disk ring (PROFILING_DIR, newest
+PROFILING_MAX_FILES kept).
+
+Only one request is profiled at a time per worker; others run unprofiled, so overhead stays bounded.
+"""
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple, TypeVar
+
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+
+PROFILE_SUFFIX = ".speedscope.json"
+META_SUFFIX = ".meta.json"
+
+# Leaf frames in these modules mean the thread is parked, not working
+_IDLE_MODULES = ("threading.py", "selectors.py", "queue.py", "base_events.py")
+
+_busy = threading.Lock()
+
+T = TypeVar("T")
+
+
+class StackSampler:
+    """Samples the stacks of the tagged threads every interval_seconds until stopped."""
+
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self.frames: List[Dict] = []
+        self._frame_index: Dict[Tuple[str, str, int], int] = {}
+        self.samples: Dict[int, List[List[int]]] = {}
+        self._threads: Set[int] = set()
+        self._threads_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self.started_at = 0.0
+        self.duration = 0.0
+
+    def start(self) -> None:
+        self.started_at = time.perf_counter()
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started_at
+
+    def tag(self, thread_id: int) -> bool:
+        """Sample thread_id from now on; False if it already was."""
+        with self._threads_lock:
+            if thread_id in self._threads:
+                return False
+            self._threads.add(thread_id)
+            return True
+
+    def untag(self, thread_id: int) -> None:
+        with self._threads_lock:
+            self._threads.discard(thread_id)
+
+    def _frame_id(self, code) -> int:
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        index = self._frame_index.get(key)
+        if index is None:
+            index = len(self.frames)
+            self._frame_index[key] = index
+            self.frames.append({"name": code.co_name, "file": code.co_filename, "line": code.co_firstlineno})
+        return index
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            with self._threads_lock:
+                threads = set(self._threads)
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id not in threads or frame.f_code.co_filename.endswith(_IDLE_MODULES):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._frame_id(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+                self.samples.setdefault(thread_id, []).append(stack)
+
+    def to_speedscope(self, name: str) -> Dict:
+        thread_names = {t.ident: t.name for t in threading.enumerate()}
+        profiles = [
+            {
+                "type": "sampled",
+                "name": thread_names.get(thread_id, f"thread {thread_id}"),
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": self.duration,
+                "samples": stacks,
+                "weights": [self.interval_seconds] * len(stacks),
+            }
+            for thread_id, stacks in sorted(self.samples.items(), key=lambda item: -len(item[1]))
+        ]
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "attendance-system request profiler",
+            "shared": {"frames": self.frames},
+            "profiles": profiles,
+        }
+
+
+# Sampler of the request being profiled; copied into the threadpool calls the request makes
+_active: ContextVar[Optional[StackSampler]] = ContextVar("profiling_sampler", default=None)
+
+
+@contextmanager
+def profiled_thread():
+    """Include the current (threadpool) thread in the request's profile while the block runs."""
+    sampler = _active.get()
+    if sampler is None:
+        yield
+        return
+    thread_id = threading.get_ident()
+    tagged = sampler.tag(thread_id)
+    try:
+        yield
+    finally:
+        if tagged:
+            sampler.untag(thread_id)
+
+
+def profiled_call(func: Callable[..., T], *args, **kwargs) -> T:
+    """func(*args, **kwargs) under profiled_thread, for run_in_threadpool."""
+    with profiled_thread():
+        return func(*args, **kwargs)
+
+
+def profiled_iter(items: Iterator[T]) -> Iterator[T]:
+    """
+    Wraps a sync generator streamed by a response: each item is produced in whichever threadpool
+    thread Starlette picks, so every step is tagged separately.
+    """
+    items = iter(items)
+    done = object()
+    while True:
+        with profiled_thread():
+            item = next(items, done)
+        if item is done:
+            return
+        yield item
+
+
+def _profile_dir() -> Path:
+    return Path(settings.PROFILING_DIR)
+
+
+def is_admin(token: Optional[str]) -> bool:
+    """True when profiling admin access is configured and the token matches it."""
+    expected = settings.PROFILING_ADMIN_TOKEN
+    return bool(expected) and token is not None and hmac.compare_digest(token.encode(), expected.encode())
+
+
+def _save(profile_id: str, document: Dict, metadata: Dict) -> None:
+    directory = _profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / f"{profile_id}{PROFILE_SUFFIX}").write_text(json.dumps(document))
+    (directory / f"{profile_id}{META_SUFFIX}").write_text(json.dumps(metadata))
+    # Keep the ring bounded: drop the oldest profiles
+    metas = sorted(directory.glob(f"*{META_SUFFIX}"), key=lambda p: p.stat().st_mtime)
+    for meta in metas[:max(0, len(metas) - settings.PROFILING_MAX_FILES)]:
+        stale_id = meta.name[: -len(META_SUFFIX)]
+        meta.unlink(missing_ok=True)
+        (directory / f"{stale_id}{PROFILE_SUFFIX}").unlink(missing_ok=True)
+
+
+def list_profiles() -> List[Dict]:
+    """Metadata of stored profiles, newest first."""
+    directory = _profile_dir()
+    if not directory.exists():
+        return []
+    metas = sorted(directory.glob(f"*{META_SUFFIX}"), key=lambda p: p.stat().st_mtime, reverse=True)
+    result = []
+    for meta in metas:
+        try:
+            result.append(json.loads(meta.read_text()))
+        except (OSError, ValueError):
+            continue
+    return result
+
+
+def profile_path(profile_id: str) -> Optional[Path]:
+    """Path of a stored profile, or None (ids are validated to stay inside PROFILING_DIR)."""
+    try:
+        uuid.UUID(profile_id)
+    except ValueError:
+        return None
+    path = _profile_dir() / f"{profile_id}{PROFILE_SUFFIX}"
+    return path if path.exists() else None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that runs selected requests under StackSampler."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def _wants_profile(self, scope) -> Optional[str]:
+        headers = dict(scope.get("headers") or [])
+        if b"x-profile" in headers and is_admin(headers.get(b"x-admin-token", b"").decode("latin-1")):
+            return "requested"
+        if settings.PROFILING_SAMPLE_RATE > 0 and random.random() < settings.PROFILING_SAMPLE_RATE:
+            return "sampled"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(f"{settings.API_V1_PREFIX}/admin/profiles"):
+            await self.app(scope, receive, send)
+            return
+        reason = self._wants_profile(scope)
+        if reason is None or not _busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = str(uuid.uuid4())
+        status = {"code": None}
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        sampler = StackSampler(settings.PROFILING_INTERVAL_MS / 1000.0)
+        sampler.tag(threading.get_ident())  # the event-loop thread
+        token = _active.set(sampler)
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            sampler.stop()
+            _active.reset(token)
+            _busy.release()
+            name = f"{scope['method']} {scope['path']}"
+            metadata = {
+                "id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "status": status["code"],
+                "reason": reason,
+                "duration_ms": round(sampler.duration * 1000, 1),
+                "samples": sum(len(stacks) for stacks in sampler.samples.values()),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "pid": os.getpid(),
+            }
+            try:
+                await run_in_threadpool(_save, profile_id, sampler.to_speedscope(name), metadata)
+            except OSError as e:
+                print(f"Error saving request profile: {e}")
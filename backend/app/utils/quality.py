@@ -0,0 +1,91 @@
+"""
+Load-adaptive recognition quality.
+
+Under a burst, answering a little less precisely beats timing out. Before each authentication
+the controller looks at this worker's recognition backlog (admitted + queued requests, from
+admission control) and the recent recognition service time, and picks a level:
+
+- full:    FACE_ENCODING_NUM_JITTERS jitters, enhanced (equalized) retry when no face is found,
+           AUTH_FUSION_FRAMES frames fused
+- reduced: 1 jitter, enhanced retry, images downscaled to QUALITY_REDUCED_MAX_SIDE for detection,
+           best frame only
+- minimal: 1 jitter, no enhanced retry, images downscaled to QUALITY_MINIMAL_MAX_SIDE, best frame only
+
+It degrades as soon as a threshold is crossed and recovers one level at a time, once pressure
+is below half the thresholds and the level has held for QUALITY_RESTORE_SECONDS. Registration
+always uses full quality (its encodings are stored), and only full-quality matches may adapt
+templates. The level is exported as attendance_recognition_quality_level and returned as
+`quality` in the authentication response.
+"""
+import threading
+import time
+from typing import List, Optional
+
+from app.config import settings
+from app.utils.admission import pressure
+from app.utils.metrics import RECOGNITION_QUALITY, RECOGNITION_QUALITY_REQUESTS
+
+
+class QualityLevel:
+    """Encoding parameters of one quality level"""
+
+    def __init__(
+        self, name: str, num_jitters: int, enhanced_fallback: bool, max_side: Optional[int], fusion_frames: int = 1
+    ):
+        self.name = name
+        self.num_jitters = num_jitters
+        self.enhanced_fallback = enhanced_fallback
+        self.max_side = max_side  # longest image side used for detection/encoding (None = as sent)
+        self.fusion_frames = fusion_frames  # liveness frames encoded and fused for recognition
+
+    @property
+    def is_full(self) -> bool:
+        return self.name == "full"
+
+
+def quality_levels() -> List[QualityLevel]:
+    return [
+        QualityLevel("full", settings.FACE_ENCODING_NUM_JITTERS, True, None, max(1, settings.AUTH_FUSION_FRAMES)),
+        QualityLevel("reduced", 1, True, settings.QUALITY_REDUCED_MAX_SIDE),
+        QualityLevel("minimal", 1, False, settings.QUALITY_MINIMAL_MAX_SIDE),
+    ]
+
+
+def _pressure_level(backlog: int, latency: float, factor: float) -> int:
+    """Level the load calls for, with thresholds scaled by factor."""
+    if backlog >= settings.QUALITY_MINIMAL_BACKLOG * factor or latency >= settings.QUALITY_MINIMAL_LATENCY_SECONDS * factor:
+        return 2
+    if backlog >= settings.QUALITY_REDUCE_BACKLOG * factor or latency >= settings.QUALITY_REDUCE_LATENCY_SECONDS * factor:
+        return 1
+    return 0
+
+
+class QualityController:
+    """Per-worker recognition quality level (QUALITY_ADAPTIVE=false pins it to full)"""
+
+    _level = 0
+    _changed_at = 0.0
+    _lock = threading.Lock()
+
+    @classmethod
+    def current(cls) -> QualityLevel:
+        """Level for the authentication about to run (call once per request)."""
+        levels = quality_levels()
+        if settings.QUALITY_ADAPTIVE:
+            backlog, latency = pressure("recognition")
+            with cls._lock:
+                now = time.monotonic()
+                target = _pressure_level(backlog, latency, 1.0)
+                if target > cls._level:
+                    cls._level, cls._changed_at = target, now
+                elif (
+                    _pressure_level(backlog, latency, 0.5) < cls._level
+                    and now - cls._changed_at >= settings.QUALITY_RESTORE_SECONDS
+                ):
+                    cls._level, cls._changed_at = cls._level - 1, now
+                level = cls._level
+        else:
+            level = 0
+        RECOGNITION_QUALITY.set(level)
+        RECOGNITION_QUALITY_REQUESTS.labels(level=levels[level].name).inc()
+        return levels[level]
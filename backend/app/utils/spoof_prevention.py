@@ -2,6 +2,8 @@ import cv2
 import numpy as np
 from typing import List, Tuple, Optional
 from app.config import settings
+from app.utils.frame_quality import BestFrame, assess_frame
+from app.utils.metrics import timed
 
 
 class SpoofPrevention:
@@ -101,7 +103,9 @@ class SpoofPrevention:
         
         return normalized_movement > settings.HEAD_MOVEMENT_THRESHOLD
     
-    def verify_liveness(self, frame: np.ndarray, face_location: Tuple[int, int, int, int]) -> Tuple[bool, str]:
+    def verify_liveness(
+        self, frame: np.ndarray, face_location: Tuple[int, int, int, int], face_image: Optional[np.ndarray] = None
+    ) -> Tuple[bool, str]:
         """
         Verify liveness using multiple frames and movement detection.
         This is a simplified version - in production, use more sophisticated methods.
@@ -109,6 +113,7 @@ class SpoofPrevention:
         Args:
             frame: Current video frame
             face_location: Face location tuple (top, right, bottom, left)
+            face_image: Face region at a higher resolution than the frame (roi upload mode), for blink detection
         
         Returns:
             Tuple of (is_live, message)
@@ -126,7 +131,8 @@ class SpoofPrevention:
         
         # Extract face region
         top, right, bottom, left = face_location
-        face_image = frame[top:bottom, left:right]
+        if face_image is None:
+            face_image = frame[top:bottom, left:right]
         
         if face_image.size == 0:
             return False, "Invalid face region"
@@ -186,18 +192,27 @@ def process_video_frame_for_spoof(frame_bytes: bytes) -> Tuple[bool, str, Option
         return False, f"Error processing frame: {e}", None
 
 
-def check_liveness_sequence(frame_bytes_list: List[bytes]) -> Tuple[bool, Optional[bytes]]:
+def check_liveness_sequence(frame_bytes_list: List[bytes]) -> Tuple[bool, List[bytes], Optional[str]]:
     """
     Run spoof prevention over a sequence of video frames.
-    Returns (liveness_passed, last_frame_bytes_for_face_match).
-    Caller should use last_frame_bytes for face recognition only if liveness_passed is True.
+    Returns (liveness_passed, frames_for_face_match, rejection_message).
+    The frames for face match are ranked best first (see frame_quality); the list is empty
+    when no frame showed a face or every face frame failed the quality gate, and
+    rejection_message then says why in the latter case.
+    Caller should use the frames for face recognition only if liveness_passed is True.
     """
     if not frame_bytes_list or len(frame_bytes_list) < 2:
-        return False, frame_bytes_list[-1] if frame_bytes_list else None
+        return False, frame_bytes_list[-1:], None
 
+    with timed("liveness"):
+        return _run_liveness(frame_bytes_list)
+
+
+def _run_liveness(frame_bytes_list: List[bytes]) -> Tuple[bool, List[bytes], Optional[str]]:
+    """Body of check_liveness_sequence (timed as the "liveness" stage)."""
     spoof = SpoofPrevention()
     liveness_passed = False
-    last_valid_bytes = None
+    best = BestFrame()
     face_cascade = cv2.CascadeClassifier(
         cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
     )
@@ -213,9 +228,92 @@ def check_liveness_sequence(frame_bytes_list: List[bytes]) -> Tuple[bool, Option
             continue
         x, y, w, h = faces[0]
         face_location = (y, x + w, y + h, x)
-        last_valid_bytes = image_bytes
+        best.offer(image_bytes, assess_frame(gray, (x, y, w, h)))
         is_live, _ = spoof.verify_liveness(frame, face_location)
         if is_live:
             liveness_passed = True
 
-    return liveness_passed, last_valid_bytes
+    return liveness_passed, best.ranked, best.message
+
+
+def check_liveness_roi(
+    frame_bytes_list: List[bytes], crop_bytes_list: List[bytes], boxes: List[Tuple[int, int, int, int]]
+) -> Tuple[bool, List[bytes], Optional[str]]:
+    """
+    Liveness for the roi upload mode. Each capture is a downscaled frame, a face crop and the
+    box (x, y, width, height in frame pixels) the client cut the crop from. The box is only a
+    hint: the face is detected again in the frame (movement uses the server's position), and
+    a capture counts only if that face lies inside the box and the crop matches the frame
+    region, so a crop cannot come from another picture than the frame.
+    Returns (liveness_passed, verified crops for face match best first, rejection_message), as
+    check_liveness_sequence; crops are scored with the detected face mapped into them.
+    """
+    if not frame_bytes_list or len(frame_bytes_list) < 2:
+        return False, [], None
+
+    with timed("liveness"):
+        return _run_liveness_roi(frame_bytes_list, crop_bytes_list, boxes)
+
+
+def _run_liveness_roi(
+    frame_bytes_list: List[bytes], crop_bytes_list: List[bytes], boxes: List[Tuple[int, int, int, int]]
+) -> Tuple[bool, List[bytes], Optional[str]]:
+    """Body of check_liveness_roi (timed as the "liveness" stage)."""
+    spoof = SpoofPrevention()
+    liveness_passed = False
+    best = BestFrame()
+    face_cascade = cv2.CascadeClassifier(
+        cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+    )
+
+    for frame_bytes, crop_bytes, box in zip(frame_bytes_list, crop_bytes_list, boxes):
+        frame = cv2.imdecode(np.frombuffer(frame_bytes, np.uint8), cv2.IMREAD_COLOR)
+        crop = cv2.imdecode(np.frombuffer(crop_bytes, np.uint8), cv2.IMREAD_COLOR)
+        if frame is None or crop is None:
+            continue
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        gray_crop = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        face = _face_in_box(face_cascade.detectMultiScale(gray, 1.1, 4), box)
+        if face is None or not _crop_matches_frame(gray, gray_crop, box):
+            continue
+        x, y, w, h = face
+        face_location = (y, x + w, y + h, x)
+        # Same face in crop pixels, where recognition will look for it
+        bx, by, bw, _ = box
+        scale = gray_crop.shape[1] / bw
+        crop_face = (round((x - bx) * scale), round((y - by) * scale), round(w * scale), round(h * scale))
+        best.offer(crop_bytes, assess_frame(gray_crop, crop_face))
+        is_live, _ = spoof.verify_liveness(frame, face_location, face_image=crop)
+        if is_live:
+            liveness_passed = True
+
+    return liveness_passed, best.ranked, best.message
+
+
+def _face_in_box(faces, box: Tuple[int, int, int, int]) -> Optional[Tuple[int, int, int, int]]:
+    """Detected face (x, y, w, h) whose center is inside the client's box, closest to its center."""
+    bx, by, bw, bh = box
+    best, best_distance = None, None
+    for x, y, w, h in faces:
+        cx, cy = x + w / 2, y + h / 2
+        if not (bx <= cx <= bx + bw and by <= cy <= by + bh) or w < 0.3 * bw:
+            continue
+        distance = (cx - bx - bw / 2) ** 2 + (cy - by - bh / 2) ** 2
+        if best is None or distance < best_distance:
+            best, best_distance = (int(x), int(y), int(w), int(h)), distance
+    return best
+
+
+def _crop_matches_frame(gray_frame: np.ndarray, gray_crop: np.ndarray, box: Tuple[int, int, int, int]) -> bool:
+    """Zero-normalized correlation between the crop (scaled down to the box) and the frame region."""
+    x, y, w, h = box
+    if w < 8 or h < 8 or x < 0 or y < 0 or x + w > gray_frame.shape[1] or y + h > gray_frame.shape[0]:
+        return False
+    region = gray_frame[y:y + h, x:x + w].astype(np.float32)
+    scaled = cv2.resize(gray_crop, (w, h), interpolation=cv2.INTER_AREA).astype(np.float32)
+    region -= region.mean()
+    scaled -= scaled.mean()
+    norm = float(np.sqrt((region ** 2).sum() * (scaled ** 2).sum()))
+    if norm < 1e-6:
+        return False  # flat region: nothing to compare
+    return float((region * scaled).sum()) / norm >= settings.CAPTURE_ROI_MIN_CORRELATION
@@ -0,0 +1,176 @@
+"""
+First-attempt success rate and CPU per successful login: best frame vs fused top-k frames
+(AUTH_FUSION_FRAMES).
+
+Two parts, combined per k:
+
+- CPU per attempt, measured: liveness over SPOOF_CHECK_FRAMES frames, then encoding of the
+  best frame (k=1, today's path) or one batched encode of the best k frames and their fusion,
+  plus the gallery match. Uses generated frames, or real photos with --images DIR.
+- Login outcomes, simulated in encoding space (there are no real enrolled faces here): every
+  attempt shares a pose/lighting offset (--session-noise) and each frame adds its own noise
+  (--frame-noise, --bad-frame-noise for a share of poor frames the quality gate lets through).
+  Frames are ranked by a noisy view of their quality, the top k are fused (AUTH_FUSION_METHOD)
+  and matched with the same accept/ambiguity rule as authenticate_face against a synthetic
+  gallery that includes look-alike users. Failed attempts are retried up to --max-attempts.
+
+CPU per successful login = CPU per attempt x attempts / successful logins. The simulated
+numbers depend on the noise model; compare k values under the same settings.
+
+Run from the backend folder:
+
+    python -m benchmarks.auth_fusion
+    python -m benchmarks.auth_fusion --fusion 1 3 5 --method median --logins 5000
+    python -m benchmarks.auth_fusion --images ~/captures   # real frames for the CPU part
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+backend_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_root))
+
+import numpy as np
+
+from app.config import settings
+from app.services.gallery_service import GalleryState, match_decision
+from app.utils.face_recognition_utils import encode_face_image_robust, encode_face_images, fuse_encodings
+from app.utils.spoof_prevention import check_liveness_sequence
+from benchmarks.synthetic import nearby_encoding, random_encodings, synthetic_frames
+
+
+def _gallery(rng: np.random.Generator, users: int, per_user: int, lookalikes: float) -> GalleryState:
+    """Synthetic gallery where a share of users has a look-alike (sibling) enrolled as well."""
+    people = random_encodings(rng, users)
+    twins = rng.choice(users, int(users * lookalikes) * 2, replace=False).reshape(-1, 2)
+    for original, twin in twins:
+        # Just outside the registration duplicate check
+        people[twin] = nearby_encoding(rng, people[original], settings.FACE_DUPLICATE_CHECK_THRESHOLD + 0.1)
+    rows = np.vstack([[nearby_encoding(rng, person, 0.2) for _ in range(per_user)] for person in people])
+    return GalleryState(
+        rows, np.empty((0, rows.shape[1])), [str(i) for i in range(users)], list(range(1, users + 1)),
+        [per_user] * users, users, users,
+    ), people
+
+
+def _noise(rng: np.random.Generator, distance: float) -> np.ndarray:
+    direction = rng.normal(size=settings.FACE_ENCODING_DIMENSION)
+    return direction / np.linalg.norm(direction) * distance
+
+
+def _attempt(rng: np.random.Generator, person: np.ndarray, k: int, args) -> np.ndarray:
+    """Probe encoding of one login attempt: best frame (k=1) or the fused best k frames."""
+    session = person + _noise(rng, args.session_noise)
+    bad = rng.random(args.frames) < args.bad_frames
+    distances = np.where(bad, args.bad_frame_noise, args.frame_noise) * rng.uniform(0.7, 1.3, args.frames)
+    frames = [session + _noise(rng, d) for d in distances]
+    # The quality score sees bad frames only roughly
+    ranking = np.argsort(distances + rng.normal(0.0, args.ranking_noise, args.frames))
+    return fuse_encodings([frames[i] for i in ranking[:k]], args.method)
+
+
+def _simulate(rng, state: GalleryState, people: np.ndarray, k: int, args) -> dict:
+    threshold, margin = settings.FACE_AUTH_THRESHOLD, settings.FACE_AUTH_AMBIGUITY_MARGIN
+    first_success = attempts = successes = false_accepts = 0
+    outcomes = {}
+    for _ in range(args.logins):
+        user = int(rng.integers(len(people)))
+        for attempt in range(1, args.max_attempts + 1):
+            attempts += 1
+            candidates, distances = state.candidate_distances(_attempt(rng, people[user], k, args))
+            best, outcome = match_decision(distances, threshold, margin)
+            if outcome == "success" and int(candidates[best]) != user:
+                outcome = "wrong_user"
+                false_accepts += 1
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            if outcome in ("success", "wrong_user"):
+                successes += outcome == "success"
+                first_success += attempt == 1 and outcome == "success"
+                break
+    return {
+        "first_success": first_success / args.logins,
+        "attempts_per_login": attempts / max(1, successes),
+        "successes": successes,
+        "attempts": attempts,
+        "false_accepts": false_accepts,
+        "outcomes": outcomes,
+    }
+
+
+def _load_frames(rng: np.random.Generator, images: Optional[Path]) -> List[bytes]:
+    if images is None:
+        return synthetic_frames(rng, settings.SPOOF_CHECK_FRAMES, quality=92, motion=30)
+    paths = sorted(p for p in images.iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    if len(paths) < 3:
+        raise SystemExit(f"Need at least 3 .jpg/.png images in {images}")
+    return [p.read_bytes() for p in paths[:settings.SPOOF_CHECK_FRAMES]]
+
+
+def _cpu_per_attempt(frames: List[bytes], state: GalleryState, k: int, method: str, repeats: int) -> float:
+    """Median CPU seconds of liveness + encode (+ fusion) + match for one attempt."""
+    samples = []
+    for _ in range(repeats):
+        start = time.process_time()
+        _, ranked, _ = check_liveness_sequence(frames)
+        ranked = ranked or frames[-1:]
+        if k == 1:
+            encoding = encode_face_image_robust(ranked[0])
+        else:
+            encodings = encode_face_images(ranked[:k])
+            encoding = fuse_encodings(encodings, method) if encodings else None
+        if encoding is not None:
+            match_decision(state.candidate_distances(encoding)[1],
+                           settings.FACE_AUTH_THRESHOLD, settings.FACE_AUTH_AMBIGUITY_MARGIN)
+        samples.append(time.process_time() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Best frame vs fused top-k frames: first-attempt success and CPU.")
+    parser.add_argument("--fusion", type=int, nargs="+", default=[1, 2, 3, 5], help="Frames fused (1 = best frame).")
+    parser.add_argument("--method", choices=["mean", "median"], default=settings.AUTH_FUSION_METHOD)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--per-user", type=int, default=3, help="Stored encodings per user.")
+    parser.add_argument("--lookalikes", type=float, default=0.05, help="Share of users with an enrolled look-alike.")
+    parser.add_argument("--logins", type=int, default=2000)
+    parser.add_argument("--max-attempts", type=int, default=5)
+    parser.add_argument("--frames", type=int, default=settings.SPOOF_CHECK_FRAMES)
+    parser.add_argument("--session-noise", type=float, default=0.2, help="Offset shared by an attempt's frames.")
+    parser.add_argument("--frame-noise", type=float, default=0.35, help="Per-frame noise of a good frame.")
+    parser.add_argument("--bad-frame-noise", type=float, default=0.6, help="Per-frame noise of a poor frame.")
+    parser.add_argument("--bad-frames", type=float, default=0.2, help="Share of poor frames passing the gate.")
+    parser.add_argument("--ranking-noise", type=float, default=0.1, help="Error of the quality ranking.")
+    parser.add_argument("--images", type=Path, help="Directory of real frames for the CPU part.")
+    parser.add_argument("--cpu-repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    state, people = _gallery(rng, args.users, args.per_user, args.lookalikes)
+    frames = _load_frames(rng, args.images)
+    source = "images" if args.images else "synthetic"
+    print(
+        f"{args.users} users ({args.lookalikes:.0%} with look-alikes), {args.logins} logins, "
+        f"{args.frames} frames, fusion={args.method}, CPU on {len(frames)} {source} frames"
+    )
+    print(
+        f"{'k':>3} {'1st-try ok':>10} {'tries/login':>11} {'wrong user':>10} "
+        f"{'CPU/attempt':>11} {'CPU/login':>10}  outcomes"
+    )
+    for k in args.fusion:
+        k = min(k, args.frames)
+        result = _simulate(np.random.default_rng(args.seed + k), state, people, k, args)
+        cpu = _cpu_per_attempt(frames, state, k, args.method, args.cpu_repeats)
+        per_login = cpu * result["attempts"] / max(1, result["successes"])
+        outcomes = ", ".join(f"{name}={count}" for name, count in sorted(result["outcomes"].items()))
+        print(
+            f"{k:>3} {result['first_success']:>10.1%} {result['attempts_per_login']:>11.2f} "
+            f"{result['false_accepts']:>10} {cpu * 1000:>9.0f}ms {per_login * 1000:>8.0f}ms  {outcomes}"
+        )
+
+
+if __name__ == "__main__":
+    main()
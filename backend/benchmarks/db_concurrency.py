@@ -0,0 +1,143 @@
+"""
+Concurrency benchmark for the async database layer.
+
+Fires concurrent punch and listing requests at the API and reports throughput and latency
+per concurrency level. By default the app runs in-process on a single event loop (one worker,
+no network), against the database in DATABASE_URL; pass --url to hit a running server instead.
+
+In-process, punches run once per --punch-batching mode (default: the per-request commit path,
+then PUNCH_BATCHING group commit) and the report adds database commits per second and
+punches per commit, counted on the app's async engine.
+
+Run from the backend folder against a local Postgres that has some registered users:
+
+    python -m benchmarks.db_concurrency
+    python -m benchmarks.db_concurrency --concurrency 1 16 64 --requests 2000
+    python -m benchmarks.db_concurrency --punch-batching on --concurrency 64 --requests 5000
+    python -m benchmarks.db_concurrency --url http://localhost:8000
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+backend_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_root))
+
+import httpx
+from sqlalchemy import event, select
+
+from app.config import settings
+from app.database import AsyncSessionLocal, async_engine
+from app.models.user import User
+
+
+class CommitCounter:
+    """Transactions committed through the app's async engine (in-process runs only)."""
+
+    def __init__(self):
+        self.commits = 0
+        event.listen(async_engine.sync_engine, "commit", self._on_commit)
+
+    def _on_commit(self, conn):
+        self.commits += 1
+
+
+async def _load_user_ids(limit: int):
+    async with AsyncSessionLocal() as db:
+        return [str(uid) for uid in await db.scalars(select(User.user_id).limit(limit))]
+
+
+async def _run(client: httpx.AsyncClient, concurrency: int, total: int, make_request):
+    """Run `total` requests with at most `concurrency` in flight. Returns (elapsed, latencies, errors)."""
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            response = await make_request(client, i)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 500:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start, latencies, errors
+
+
+def _report(name: str, concurrency: int, elapsed: float, latencies, errors: int, commits: Optional[int] = None):
+    latencies = sorted(latencies)
+    p = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+    line = (
+        f"{name:<14} c={concurrency:<4} {len(latencies) / elapsed:8.1f} req/s  "
+        f"p50={p(0.50):7.1f}ms  p95={p(0.95):7.1f}ms  p99={p(0.99):7.1f}ms  "
+        f"mean={statistics.mean(latencies) * 1000:7.1f}ms  errors={errors}"
+    )
+    if commits is not None:
+        line += f"  commits={commits / elapsed:7.1f}/s ({len(latencies) / max(1, commits):.1f} punches/commit)"
+    print(line)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Async DB layer concurrency benchmark.")
+    parser.add_argument("--url", help="Base URL of a running server. Default: run the app in-process.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per scenario and concurrency level.")
+    parser.add_argument("--users", type=int, default=500, help="Distinct users to punch in/out.")
+    parser.add_argument(
+        "--punch-batching", choices=["off", "on"], nargs="+", default=["off", "on"],
+        help="PUNCH_BATCHING modes to run the punch scenario in (in-process only).",
+    )
+    args = parser.parse_args()
+
+    user_ids = await _load_user_ids(args.users)
+    if not user_ids:
+        print("No users in the database. Register some (or run scripts.generate_fixtures) first.")
+        return
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+        counter = None
+        modes = [None]  # whatever the server is configured with
+    else:
+        from app.main import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+        counter = CommitCounter()
+        modes = args.punch_batching
+
+    prefix = settings.API_V1_PREFIX
+    # Each user alternates punch_in / punch_out, so every request is a real write
+    actions = {}
+
+    async def punch(client, i):
+        user_id = user_ids[i % len(user_ids)]
+        action = "punch_out" if actions.get(user_id) == "punch_in" else "punch_in"
+        actions[user_id] = action
+        return await client.post(f"{prefix}/auth/punch", json={"user_id": user_id, "action": action})
+
+    async def listing(client, i):
+        return await client.get(f"{prefix}/attendance/", params={"limit": 100})
+
+    async with client:
+        for mode in modes:
+            if mode is not None:
+                settings.PUNCH_BATCHING = mode == "on"
+            name = "punch" if mode is None else f"punch batch={mode}"
+            for concurrency in args.concurrency:
+                commits_before = counter.commits if counter else 0
+                elapsed, latencies, errors = await _run(client, concurrency, args.requests, punch)
+                commits = counter.commits - commits_before if counter else None
+                _report(name, concurrency, elapsed, latencies, errors, commits)
+        for concurrency in args.concurrency:
+            elapsed, latencies, errors = await _run(client, concurrency, args.requests, listing)
+            _report("listing", concurrency, elapsed, latencies, errors)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
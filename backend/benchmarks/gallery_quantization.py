@@ -0,0 +1,118 @@
+"""
+Accuracy parity and cost of the int8 gallery scan (GALLERY_QUANTIZATION=int8).
+
+Builds synthetic galleries, then authenticates probes two ways: one exact float64 scan, and
+the int8 first pass followed by an exact rerank of the best GALLERY_RERANK_CANDIDATES users.
+Both go through the same accept/ambiguity rule as authenticate_face, so "parity" is the share
+of probes with the same outcome and the same user. Probes are genuine captures at 0.2-0.55
+from a stored encoding (around the 0.5 threshold) and impostors.
+
+Run from the backend folder:
+
+    python -m benchmarks.gallery_quantization
+    python -m benchmarks.gallery_quantization --users 100000 --probes 5000 --rerank 16
+
+Exits with status 1 if parity is below --min-parity (default: every decision identical).
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+backend_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_root))
+
+import numpy as np
+
+from app.config import settings
+from app.services.gallery_service import GalleryState, match_decision
+from benchmarks.synthetic import nearby_encoding, random_encodings
+
+
+def _gallery(rng: np.random.Generator, users: int, per_user: int) -> GalleryState:
+    people = random_encodings(rng, users)
+    rows = np.vstack([[nearby_encoding(rng, person, 0.2) for _ in range(per_user)] for person in people])
+    return GalleryState(
+        rows, np.empty((0, rows.shape[1])), [str(i) for i in range(users)], list(range(1, users + 1)),
+        [per_user] * users, users, users,
+    )
+
+
+def _probes(rng: np.random.Generator, state: GalleryState, count: int) -> np.ndarray:
+    """Three quarters genuine captures of random users, one quarter impostors."""
+    genuine = count * 3 // 4
+    owners = rng.integers(0, len(state.user_ids), genuine)
+    probes = [
+        nearby_encoding(rng, state.base[state.starts[user] + rng.integers(state.counts[user])], rng.uniform(0.2, 0.55))
+        for user in owners
+    ]
+    return np.vstack(probes + list(random_encodings(rng, count - genuine)))
+
+
+def _p50_ms(run, probes: np.ndarray) -> float:
+    times = []
+    for probe in probes:
+        start = time.perf_counter()
+        run(probe)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parity and cost of the int8 gallery scan with exact rerank.")
+    parser.add_argument("--users", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--per-user", type=int, default=3, help="Stored encodings per user.")
+    parser.add_argument("--probes", type=int, default=2000)
+    parser.add_argument("--rerank", type=int, default=settings.GALLERY_RERANK_CANDIDATES)
+    parser.add_argument("--timed-probes", type=int, default=100, help="Probes used for the latency figures.")
+    parser.add_argument("--min-parity", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    threshold, margin = settings.FACE_AUTH_THRESHOLD, settings.FACE_AUTH_AMBIGUITY_MARGIN
+    worst = 1.0
+    print(
+        f"{'users':>8} {'float64':>9} {'int8':>8} {'exact p50':>10} {'int8 p50':>9} "
+        f"{'approx err':>11} {'top-1':>7} {'parity':>8}  outcomes (exact)"
+    )
+    for users in args.users:
+        state = _gallery(rng, users, args.per_user)
+        probes = _probes(rng, state, args.probes)
+        codes, _, _ = state.quantized()
+
+        def exact(probe):
+            return match_decision(state.user_distances(probe), threshold, margin)
+
+        def quantized(probe):
+            candidates, distances = state.candidate_distances(probe, rerank=args.rerank)
+            best, outcome = match_decision(distances, threshold, margin)
+            return (None if best is None else int(candidates[best])), outcome
+
+        same, top1, error, outcomes = 0, 0, 0.0, {}
+        for probe in probes:
+            full = state.user_distances(probe)
+            approximate = state.approximate_user_distances(probe)
+            error = max(error, float(np.abs(approximate - full).max()))
+            top1 += int(approximate.argmin() == full.argmin())
+            expected = exact(probe)
+            same += int(quantized(probe) == expected)
+            outcomes[expected[1]] = outcomes.get(expected[1], 0) + 1
+
+        timed = probes[:args.timed_probes]
+        parity = same / len(probes)
+        worst = min(worst, parity)
+        print(
+            f"{users:>8} {state.base.nbytes / 2**20:>7.1f}MB {codes.nbytes / 2**20:>6.1f}MB "
+            f"{_p50_ms(exact, timed):>8.2f}ms {_p50_ms(quantized, timed):>7.2f}ms {error:>11.4f} "
+            f"{top1 / len(probes):>7.2%} {parity:>8.2%}  "
+            + ", ".join(f"{k}={v}" for k, v in sorted(outcomes.items()))
+        )
+
+    if worst < args.min_parity:
+        print(f"\nParity {worst:.2%} below --min-parity {args.min_parity:.2%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
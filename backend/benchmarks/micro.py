@@ -0,0 +1,310 @@
+"""
+Microbenchmarks for the recognition and attendance hot paths.
+
+Cases:
+  match_face             per-user JSON scan (the pre-gallery authenticate path; synthetic 128-d galleries)
+  check_duplicate_face   the same scan for registration duplicates (no duplicate: worst case)
+  gallery_user_distances the in-memory GalleryState scan authenticate_face now uses, same galleries
+  encode_face_image_robust / check_liveness_sequence   on generated frames (or --images DIR)
+  get_daily_summary      against Postgres seeded inside a transaction that is rolled back
+
+Each case reports its latency distribution plus peak traced memory and net allocated blocks
+per call, and is compared with a stored baseline: a slowdown or memory growth beyond
+--tolerance prints REGRESSION and exits with status 1. Without a baseline the results are only
+printed, unless --check is given (as in CI): then a missing baseline, or a case the baseline
+does not cover, also exits with status 1.
+
+Run from the backend folder:
+
+    python -m benchmarks.micro                        # compare with benchmarks/micro_baseline.json
+    python -m benchmarks.micro --save-baseline        # record a new baseline on this machine
+    python -m benchmarks.micro --check                # CI: fail if the baseline is missing or incomplete
+    python -m benchmarks.micro --only match_face --gallery-sizes 100 1000
+    python -m benchmarks.micro --images ~/faces       # use real face photos for encode/liveness
+
+Baselines are machine-specific: record and compare on the same host. The committed
+micro_baseline.json is the reference (1 vCPU Xeon, Python 3.11, local Postgres 'fixtures_test'
+database); a CI runner of another size records its own with --save-baseline and commits it.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+backend_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_root))
+
+import numpy as np
+
+from app.config import settings
+from app.utils.face_recognition_utils import check_duplicate_face, encode_face_image_robust, match_face
+from app.services.gallery_service import GalleryState
+from app.utils.spoof_prevention import check_liveness_sequence
+from benchmarks.synthetic import random_encodings, random_gallery, synthetic_frames
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "micro_baseline.json"
+# Users checked exactly after the centroid pre-filter (GALLERY_CENTROID_PREFILTER)
+CENTROID_PREFILTER = 50
+
+# Differences below these are noise, whatever the relative change
+MIN_LATENCY_DELTA_MS = 0.2
+MIN_MEMORY_DELTA_KIB = 64
+
+
+class Case:
+    """One benchmarked call: `run` is invoked repeatedly; `close` releases its fixtures."""
+
+    def __init__(self, name: str, run: Callable[[], object], close: Optional[Callable[[], None]] = None):
+        self.name = name
+        self.run = run
+        self.close = close
+
+
+def _measure(case: Case, max_iterations: int, max_seconds: float) -> Dict[str, float]:
+    """Latency percentiles (ms) over up to max_iterations calls, then one traced call for memory."""
+    case.run()  # warm-up (imports, caches, lazy model loading)
+    latencies = []
+    deadline = time.perf_counter() + max_seconds
+    while len(latencies) < max_iterations and (len(latencies) < 3 or time.perf_counter() < deadline):
+        start = time.perf_counter()
+        case.run()
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    try:
+        blocks_before = sys.getallocatedblocks()
+        case.run()
+        blocks_after = sys.getallocatedblocks()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    latencies.sort()
+    pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+    return {
+        "n": len(latencies),
+        "min_ms": latencies[0],
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "mean_ms": statistics.mean(latencies),
+        "peak_kib": peak / 1024,
+        "net_blocks": blocks_after - blocks_before,
+    }
+
+
+def _gallery_cases(rng: np.random.Generator, sizes: List[int]) -> List[Case]:
+    cases = []
+    for size in sizes:
+        gallery = random_gallery(rng, size)
+        probe = random_encodings(rng, 1)[0]
+
+        def scan(gallery=gallery, probe=probe):
+            for stored in gallery:
+                match_face(probe, stored, settings.FACE_AUTH_THRESHOLD)
+
+        cases.append(Case(f"match_face[gallery={size}]", scan))
+        cases.append(Case(
+            f"check_duplicate_face[gallery={size}]",
+            lambda gallery=gallery, probe=probe: check_duplicate_face(probe, gallery, settings.FACE_DUPLICATE_CHECK_THRESHOLD),
+        ))
+        state = GalleryState(
+            np.array([json.loads(s) for stored in gallery for s in stored]),
+            np.empty((0, probe.shape[0])),
+            [str(i) for i in range(size)], list(range(1, size + 1)),
+            [len(stored) for stored in gallery], size, size,
+        )
+        cases.append(Case(f"gallery_user_distances[gallery={size}]", lambda state=state, probe=probe: state.user_distances(probe)))
+        if size > CENTROID_PREFILTER:
+            state.centroids()
+            cases.append(Case(
+                f"gallery_centroid_prefilter[gallery={size},top={CENTROID_PREFILTER}]",
+                lambda state=state, probe=probe: state.candidate_distances(probe, prefilter=CENTROID_PREFILTER),
+            ))
+        if size > settings.GALLERY_RERANK_CANDIDATES:
+            state.quantized()
+            cases.append(Case(
+                f"gallery_int8_rerank[gallery={size},top={settings.GALLERY_RERANK_CANDIDATES}]",
+                lambda state=state, probe=probe: state.candidate_distances(probe, rerank=settings.GALLERY_RERANK_CANDIDATES),
+            ))
+    return cases
+
+
+def _load_frames(rng: np.random.Generator, images: Optional[Path]) -> List[bytes]:
+    if images is None:
+        return synthetic_frames(rng, settings.SPOOF_CHECK_FRAMES)
+    paths = sorted(p for p in images.iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    if not paths:
+        raise SystemExit(f"No .jpg/.png images in {images}")
+    return [p.read_bytes() for p in paths[:max(2, settings.SPOOF_CHECK_FRAMES)]]
+
+
+def _frame_cases(frames: List[bytes], source: str) -> List[Case]:
+    return [
+        Case(f"encode_face_image_robust[{source}]", lambda: encode_face_image_robust(frames[-1])),
+        Case(f"check_liveness_sequence[{source},frames={len(frames)}]", lambda: check_liveness_sequence(frames)),
+    ]
+
+
+def _summary_cases(rng: np.random.Generator, sizes: List[int]) -> List[Case]:
+    """
+    get_daily_summary over `size` users with 1-3 sessions each on one day. All rows are inserted
+    in an open transaction that is rolled back in close(), so the database is left untouched.
+    """
+    try:
+        from sqlalchemy import insert, text
+        from app.database import AsyncSessionLocal
+        from app.models.attendance import Attendance
+        from app.models.user import User
+        from app.services.attendance_service import AttendanceService
+    except ImportError as e:
+        print(f"Skipping get_daily_summary: {e}")
+        return []
+
+    loop = asyncio.new_event_loop()
+    day = "2000-01-03"  # far from real data
+    cases = []
+    for size in sizes:
+        db = AsyncSessionLocal()
+        try:
+            loop.run_until_complete(db.execute(text("SELECT 1")))
+        except Exception as e:
+            loop.run_until_complete(db.close())
+            print(f"Skipping get_daily_summary: database unavailable ({e.__class__.__name__})")
+            break
+
+        user_ids = [uuid.uuid4() for _ in range(size)]
+        encodings = random_encodings(rng, size)
+        day_start = datetime(2000, 1, 3, 8, tzinfo=timezone.utc)
+        sessions = []
+        for user_id in user_ids:
+            start = day_start + timedelta(minutes=int(rng.integers(0, 90)))
+            for _ in range(int(rng.integers(1, 4))):
+                end = start + timedelta(minutes=int(rng.integers(30, 180)))
+                sessions.append({
+                    "attendance_id": uuid.uuid4(), "user_id": user_id, "date": day,
+                    "punch_in_time": start, "punch_out_time": end,
+                    "total_duration": str(end - start).zfill(8),
+                })
+                start = end + timedelta(minutes=int(rng.integers(5, 60)))
+
+        async def seed(db=db, user_ids=user_ids, encodings=encodings, sessions=sessions):
+            await db.execute(insert(User), [
+                {"user_id": user_id, "username": f"bench_{i}", "face_encodings": [json.dumps(e.tolist())]}
+                for i, (user_id, e) in enumerate(zip(user_ids, encodings))
+            ])
+            await db.execute(insert(Attendance), sessions)
+
+        loop.run_until_complete(seed())
+
+        def run(db=db):
+            return loop.run_until_complete(AttendanceService.get_daily_summary(db, day))
+
+        def close(db=db):
+            loop.run_until_complete(db.rollback())
+            loop.run_until_complete(db.close())
+
+        cases.append(Case(f"get_daily_summary[users={size}]", run, close))
+    return cases
+
+
+def _compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        limit = 1 + tolerance
+        if result["p50_ms"] > base["p50_ms"] * limit and result["p50_ms"] - base["p50_ms"] > MIN_LATENCY_DELTA_MS:
+            regressions.append(f"{name}: p50 {base['p50_ms']:.2f}ms -> {result['p50_ms']:.2f}ms")
+        if result["peak_kib"] > base["peak_kib"] * limit and result["peak_kib"] - base["peak_kib"] > MIN_MEMORY_DELTA_KIB:
+            regressions.append(f"{name}: peak memory {base['peak_kib']:.0f}KiB -> {result['peak_kib']:.0f}KiB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recognition and attendance microbenchmarks.")
+    parser.add_argument("--only", nargs="+", help="Run cases whose name starts with one of these.")
+    parser.add_argument("--gallery-sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--summary-sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--images", type=Path, help="Folder of face photos to use instead of generated frames.")
+    parser.add_argument("--iterations", type=int, default=200, help="Max timed calls per case.")
+    parser.add_argument("--max-seconds", type=float, default=5.0, help="Time budget per case (at least 3 calls).")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Write results as the new baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown/memory growth.")
+    parser.add_argument("--check", action="store_true",
+                        help="Exit 1 when the baseline is missing or lacks a case that ran (for CI).")
+    args = parser.parse_args()
+    if args.check and not args.save_baseline and not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; record one on this host with --save-baseline.")
+        sys.exit(1)
+
+    rng = np.random.default_rng(args.seed)
+    wanted = lambda name: not args.only or any(name.startswith(prefix) for prefix in args.only)
+
+    frame_source = "photos" if args.images else "generated"
+    groups = [
+        (("match_face", "check_duplicate_face", "gallery_user_distances", "gallery_centroid_prefilter",
+          "gallery_int8_rerank"), lambda: _gallery_cases(rng, args.gallery_sizes)),
+        (("encode_face_image_robust", "check_liveness_sequence"), lambda: _frame_cases(_load_frames(rng, args.images), frame_source)),
+        (("get_daily_summary",), lambda: _summary_cases(rng, args.summary_sizes)),
+    ]
+    cases: List[Case] = []
+    for names, build in groups:
+        if any(wanted(name) for name in names):
+            cases.extend(build())
+
+    results = {}
+    print(f"{'case':<52} {'n':>5} {'p50':>10} {'p95':>10} {'p99':>10} {'peak':>10} {'blocks':>8}")
+    for case in cases:
+        name = case.name
+        if not wanted(name):
+            if case.close:
+                case.close()
+            continue
+        try:
+            result = _measure(case, args.iterations, args.max_seconds)
+        finally:
+            if case.close:
+                case.close()
+        results[name] = result
+        print(
+            f"{name:<52} {result['n']:>5} {result['p50_ms']:>8.2f}ms {result['p95_ms']:>8.2f}ms "
+            f"{result['p99_ms']:>8.2f}ms {result['peak_kib']:>7.0f}KiB {result['net_blocks']:>8}"
+        )
+
+    if args.save_baseline:
+        baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+        baseline.update(results)
+        args.baseline.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one.")
+        return
+    baseline = json.loads(args.baseline.read_text())
+    regressions = _compare(results, baseline, args.tolerance)
+    missing = [name for name in results if name not in baseline]
+    if missing:
+        print(f"\nNot in {args.baseline.name} (not compared): {', '.join(missing)}")
+    if regressions:
+        print(f"\nREGRESSION (> {args.tolerance:.0%} vs {args.baseline.name}):")
+        for line in regressions:
+            print(f"  {line}")
+    if regressions or (missing and args.check):
+        sys.exit(1)
+    print(f"\nNo regressions vs {args.baseline.name} (tolerance {args.tolerance:.0%}).")
+
+
+if __name__ == "__main__":
+    main()
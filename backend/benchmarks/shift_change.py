@@ -0,0 +1,235 @@
+"""
+Shift-change load test: a few hundred people reach the kiosks within the same minute.
+
+Each simulated employee runs the kiosk flow against a running server: a multi-frame
+POST /auth/authenticate (liveness + recognition) followed by POST /auth/punch. Meanwhile a few
+dashboard clients poll /stats/today and /attendance/today with If-None-Match, like open browser tabs.
+
+The enrolled population is whatever is in the server's database (see scripts.generate_fixtures).
+Synthetic encodings cannot match a camera frame, so when authentication does not return a user
+the employee punches with their assigned user_id; frame decoding and the liveness check still run
+in full. Pass --images with real frames of an enrolled person to exercise recognition too.
+
+Reports throughput, p50/p95/p99 latency and error rates per request type, plus DB pool
+saturation (pool waits / checkout time) and admission queueing/shedding from /metrics. Requests
+shed with 503 are retried after Retry-After (--max-retries), as the kiosk does. Start the server with the worker
+configuration under test first, then run from the backend folder:
+
+    gunicorn app.main:app -w 4 -k uvicorn.workers.UvicornWorker --bind 0.0.0.0:8000
+    python -m benchmarks.shift_change --employees 300 --window 60 --label "4 workers"
+    python -m benchmarks.shift_change --action punch_out   # clear the punches for a rerun
+
+With several workers set PROMETHEUS_MULTIPROC_DIR on the server so /metrics covers all of them.
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+backend_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_root))
+
+import httpx
+import numpy as np
+
+from app.config import settings
+from benchmarks.synthetic import synthetic_frames
+
+
+class Recorder:
+    """Latencies and status counts per request type."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.retries = 0
+
+    async def call(self, kind: str, request) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            response = await request
+        except httpx.HTTPError as e:
+            self.statuses[kind][e.__class__.__name__] += 1
+            return None
+        self.latencies[kind].append(time.perf_counter() - start)
+        self.statuses[kind][str(response.status_code)] += 1
+        return response
+
+    def report(self, elapsed: float) -> None:
+        print(f"\n{'request':<14} {'count':>6} {'req/s':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'4xx':>6} {'5xx':>6} {'failed':>7}")
+        for kind in sorted(self.statuses):
+            statuses = self.statuses[kind]
+            latencies = sorted(self.latencies[kind]) or [0.0]
+            pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+            count = sum(statuses.values())
+            client_errors = sum(n for s, n in statuses.items() if s.startswith("4"))
+            server_errors = sum(n for s, n in statuses.items() if s.startswith("5"))
+            failed = sum(n for s, n in statuses.items() if not s.isdigit())
+            print(
+                f"{kind:<14} {count:>6} {count / elapsed:>8.1f} {pick(0.50):>7.0f}ms {pick(0.95):>7.0f}ms "
+                f"{pick(0.99):>7.0f}ms {client_errors:>6} {server_errors:>6} {failed:>7}"
+            )
+
+
+async def _scrape(client: httpx.AsyncClient) -> Dict[tuple, float]:
+    """Flattened /metrics samples: (name, sorted label items) -> value. Empty if unavailable."""
+    from prometheus_client.parser import text_string_to_metric_families
+
+    try:
+        response = await client.get("/metrics")
+        response.raise_for_status()
+    except httpx.HTTPError:
+        return {}
+    samples = {}
+    for family in text_string_to_metric_families(response.text):
+        for sample in family.samples:
+            samples[(sample.name, tuple(sorted(sample.labels.items())))] = sample.value
+    return samples
+
+
+def _report_pool(before: Dict[tuple, float], after: Dict[tuple, float]) -> None:
+    if not after:
+        print("\n/metrics unavailable: no DB pool figures.")
+        return
+    delta = lambda name, labels: after.get((name, labels), 0.0) - before.get((name, labels), 0.0)
+    print(f"\n{'db pool':<14} {'checkouts':>10} {'waits':>8} {'wait %':>7} {'avg checkout':>13}")
+    for engine in ("sync", "async"):
+        labels = (("engine", engine),)
+        checkouts = delta("attendance_db_pool_checkouts_total", labels)
+        waits = delta("attendance_db_pool_waits_total", labels)
+        seconds = delta("attendance_db_pool_checkout_seconds_sum", labels)
+        if checkouts:
+            print(f"{engine:<14} {checkouts:>10.0f} {waits:>8.0f} {waits / checkouts:>6.1%} {seconds / checkouts * 1000:>11.1f}ms")
+
+    outcomes = {
+        dict(labels)["outcome"]: after[(name, labels)] - before.get((name, labels), 0.0)
+        for (name, labels) in after
+        if name == "attendance_face_match_outcomes_total"
+    }
+    outcomes = {k: int(v) for k, v in outcomes.items() if v}
+    if outcomes:
+        print("match outcomes: " + ", ".join(f"{k}={v}" for k, v in sorted(outcomes.items())))
+    levels = {
+        dict(labels)["level"]: int(after[(name, labels)] - before.get((name, labels), 0.0))
+        for (name, labels) in after
+        if name == "attendance_recognition_quality_requests_total"
+    }
+    if any(levels.values()):
+        print("recognition quality: " + ", ".join(f"{k}={v}" for k, v in sorted(levels.items()) if v))
+
+    print(f"\n{'admission':<14} {'requests':>9} {'avg queue':>10} {'shed':>6}")
+    for endpoint_class in ("recognition", "registration", "reads"):
+        labels = (("endpoint_class", endpoint_class),)
+        count = delta("attendance_admission_queue_seconds_count", labels)
+        shed = sum(
+            after[(name, l)] - before.get((name, l), 0.0)
+            for (name, l) in after
+            if name == "attendance_admission_rejections_total" and dict(l)["endpoint_class"] == endpoint_class
+        )
+        if count:
+            print(f"{endpoint_class:<14} {count:>9.0f} {delta('attendance_admission_queue_seconds_sum', labels) / count * 1000:>8.0f}ms {shed:>6.0f}")
+
+
+def _load_frames(images: Optional[Path], rng: np.random.Generator) -> List[bytes]:
+    if images is None:
+        return synthetic_frames(rng, settings.SPOOF_CHECK_FRAMES)
+    paths = sorted(p for p in images.iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    if len(paths) < 3:
+        raise SystemExit(f"Need at least 3 .jpg/.png frames in {images}")
+    return [p.read_bytes() for p in paths[:settings.SPOOF_CHECK_FRAMES]]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Shift-change load test for the kiosk flow.")
+    parser.add_argument("--url", default="http://localhost:8000", help="Base URL of the running server.")
+    parser.add_argument("--employees", type=int, default=300, help="People arriving during the window.")
+    parser.add_argument("--window", type=float, default=60.0, help="Seconds over which arrivals are spread.")
+    parser.add_argument("--kiosks", type=int, default=0, help="Max concurrent kiosk flows (0 = unlimited).")
+    parser.add_argument("--dashboards", type=int, default=5, help="Dashboard clients polling in parallel.")
+    parser.add_argument("--poll-interval", type=float, default=5.0, help="Seconds between dashboard polls.")
+    parser.add_argument("--action", choices=["punch_in", "punch_out"], default="punch_in")
+    parser.add_argument("--images", type=Path, help="Folder of frames to upload instead of generated ones.")
+    parser.add_argument("--max-retries", type=int, default=3, help="Authenticate retries after a 503 (honouring Retry-After).")
+    parser.add_argument("--label", default="", help="Worker configuration under test, printed with the report.")
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    random.seed(args.seed)
+    frames = _load_frames(args.images, rng)
+    prefix = settings.API_V1_PREFIX
+    recorder = Recorder()
+    kiosk_slots = asyncio.Semaphore(args.kiosks) if args.kiosks else None
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=120) as client:
+        users = (await client.get(f"{prefix}/users/")).json()
+        if not users:
+            print("No users on the server. Register some (or run scripts.generate_fixtures) first.")
+            return
+        population = [u["user_id"] for u in random.sample(users, min(args.employees, len(users)))]
+        metrics_before = await _scrape(client)
+        done = asyncio.Event()
+
+        async def employee(user_id: str, arrival: float):
+            await asyncio.sleep(arrival)
+            if kiosk_slots:
+                await kiosk_slots.acquire()
+            try:
+                files = [("files", (f"frame_{i}.jpg", data, "image/jpeg")) for i, data in enumerate(frames)]
+                for attempt in range(args.max_retries + 1):
+                    response = await recorder.call("authenticate", client.post(f"{prefix}/auth/authenticate", files=files))
+                    if response is None or response.status_code != 503 or attempt == args.max_retries:
+                        break
+                    # Shed by admission control: wait as told, like the kiosk app
+                    recorder.retries += 1
+                    await asyncio.sleep(float(response.headers.get("retry-after", 1)))
+                if response is not None and response.status_code == 200 and response.json().get("success"):
+                    user_id = response.json()["user_id"]
+                await recorder.call("punch", client.post(
+                    f"{prefix}/auth/punch", json={"user_id": user_id, "action": args.action}
+                ))
+            finally:
+                if kiosk_slots:
+                    kiosk_slots.release()
+
+        async def dashboard():
+            etags: Dict[str, str] = {}
+            await asyncio.sleep(random.uniform(0, args.poll_interval))
+            while not done.is_set():
+                for path, kind in (("/stats/today", "stats"), ("/attendance/today", "today_list")):
+                    headers = {"If-None-Match": etags[path]} if path in etags else {}
+                    response = await recorder.call(kind, client.get(f"{prefix}{path}", headers=headers))
+                    if response is not None and "etag" in response.headers:
+                        etags[path] = response.headers["etag"]
+                try:
+                    await asyncio.wait_for(done.wait(), args.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+        print(
+            f"Shift change{f' [{args.label}]' if args.label else ''}: {len(population)} employees over "
+            f"{args.window:.0f}s, {len(frames)} frames each, {args.dashboards} dashboards -> {args.url}"
+        )
+        start = time.perf_counter()
+        pollers = [asyncio.create_task(dashboard()) for _ in range(args.dashboards)]
+        await asyncio.gather(*(
+            employee(user_id, random.uniform(0, args.window)) for user_id in population
+        ))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await asyncio.gather(*pollers)
+        metrics_after = await _scrape(client)
+
+    print(f"Completed in {elapsed:.1f}s ({len(population) / elapsed:.1f} employees/s)")
+    recorder.report(elapsed)
+    if recorder.retries:
+        print(f"authenticate retried {recorder.retries} times after 503 (Retry-After)")
+    _report_pool(metrics_before, metrics_after)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
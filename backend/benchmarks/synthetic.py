@@ -0,0 +1,70 @@
+"""
+Synthetic data shared by the benchmarks: face encodings, galleries and camera frames.
+
+Random encodings are drawn so that their norms and pairwise distances look like dlib's
+(about 1.0 and 1.4), i.e. unrelated people never match at the configured thresholds.
+"""
+import json
+from typing import List
+
+import cv2
+import numpy as np
+
+ENCODING_DIMENSION = 128
+# Per-component spread giving unit-ish norms like real 128-d dlib encodings
+ENCODING_SCALE = 0.09
+
+
+def random_encodings(rng: np.random.Generator, count: int) -> np.ndarray:
+    """count x 128 float64 encodings of unrelated people."""
+    return rng.normal(0.0, ENCODING_SCALE, size=(count, ENCODING_DIMENSION))
+
+
+def nearby_encoding(rng: np.random.Generator, encoding: np.ndarray, distance: float = 0.3) -> np.ndarray:
+    """Another capture of the same person: encoding moved by `distance` in a random direction."""
+    direction = rng.normal(size=encoding.shape)
+    return encoding + direction / np.linalg.norm(direction) * distance
+
+
+def encoding_string(encoding: np.ndarray) -> str:
+    """Same storage format as face_recognition_utils.encode_to_string."""
+    return json.dumps(encoding.tolist())
+
+
+def random_gallery(rng: np.random.Generator, users: int, per_user: int = 3) -> List[List[str]]:
+    """Stored encodings per user, as they come out of User.face_encodings."""
+    base = random_encodings(rng, users)
+    return [
+        [encoding_string(nearby_encoding(rng, person, 0.2)) for _ in range(per_user)]
+        for person in base
+    ]
+
+
+def synthetic_frames(
+    rng: np.random.Generator,
+    count: int = 5,
+    width: int = 640,
+    height: int = 480,
+    quality: int = 85,
+    motion: int = 6,
+) -> List[bytes]:
+    """
+    JPEG frames of a drawn, slowly moving face-like shape on a noisy background, as a kiosk
+    camera would send them. Enough to exercise decode, detection and the liveness loop;
+    dlib will usually find no face in them, so recognition benchmarks measure the no-face path
+    unless real photos are supplied. motion: horizontal shift per frame in pixels (about 24
+    at 640x480 passes the head-movement check).
+    """
+    frames = []
+    background = rng.integers(60, 120, size=(height, width, 3), dtype=np.uint8)
+    for i in range(count):
+        frame = background.copy()
+        cx, cy = width // 2 + i * motion, height // 2 + (i % 2) * 4
+        axes = (width // 8, height // 5)
+        cv2.ellipse(frame, (cx, cy), axes, 0, 0, 360, (150, 180, 220), -1)
+        for dx in (-axes[0] // 2, axes[0] // 2):
+            cv2.circle(frame, (cx + dx, cy - axes[1] // 4), axes[0] // 7, (40, 30, 30), -1)
+        cv2.ellipse(frame, (cx, cy + axes[1] // 2), (axes[0] // 3, axes[1] // 10), 0, 0, 180, (60, 60, 150), -1)
+        ok, data = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        frames.append(data.tobytes())
+    return frames
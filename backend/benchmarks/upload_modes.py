@@ -0,0 +1,137 @@
+"""
+Bandwidth and server latency of the two /auth/authenticate upload modes.
+
+full: what FaceAuth.js sends without a face detector, SPOOF_CHECK_FRAMES camera frames as
+      JPEG (quality 92).
+roi:  the capture-profile mode, per frame a downscaled frame (CAPTURE_FRAME_MAX_SIDE) plus a
+      CAPTURE_ROI_SIZE face crop and its box. The client's face detector is stood in for by
+      OpenCV's Haar cascade on the full frame.
+
+Both modes send the same synthetic captures to the app in-process (database in DATABASE_URL,
+one request at a time) and report request size, latency and the Server-Timing stages.
+Synthetic faces are not enrolled, so successful runs end in "not recognized" after a full
+encode + match.
+
+Run from the backend folder:
+
+    python -m benchmarks.upload_modes
+    python -m benchmarks.upload_modes --requests 50 --frames 1
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+backend_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_root))
+
+import cv2
+import httpx
+import numpy as np
+
+from app.config import settings
+from benchmarks.synthetic import synthetic_frames
+
+_CASCADE = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+
+
+def _jpeg(image: np.ndarray, quality: float) -> bytes:
+    return cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, int(quality * 100)])[1].tobytes()
+
+
+def roi_capture(frame_bytes: bytes) -> Tuple[bytes, bytes, List[int]]:
+    """(downscaled frame, face crop, box in downscaled pixels), as FaceAuth.js builds them."""
+    frame = cv2.imdecode(np.frombuffer(frame_bytes, np.uint8), cv2.IMREAD_COLOR)
+    height, width = frame.shape[:2]
+    faces = _CASCADE.detectMultiScale(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), 1.1, 4)
+    if len(faces) == 0:
+        raise SystemExit("No face found in a synthetic frame; the stand-in detector needs a visible face")
+    x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+    # Square crop around the face with CAPTURE_ROI_MARGIN per side, kept inside the frame
+    side = min(int(max(w, h) * (1 + 2 * settings.CAPTURE_ROI_MARGIN)), width, height)
+    cx, cy = x + w // 2, y + h // 2
+    left = min(max(0, cx - side // 2), width - side)
+    top = min(max(0, cy - side // 2), height - side)
+    crop = cv2.resize(
+        frame[top:top + side, left:left + side], (settings.CAPTURE_ROI_SIZE,) * 2, interpolation=cv2.INTER_AREA
+    )
+    scale = min(1.0, settings.CAPTURE_FRAME_MAX_SIDE / max(width, height))
+    small = cv2.resize(frame, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+    box = [round(left * scale), round(top * scale), round(side * scale), round(side * scale)]
+    return _jpeg(small, settings.CAPTURE_JPEG_QUALITY), _jpeg(crop, settings.CAPTURE_JPEG_QUALITY), box
+
+
+def _server_timing(header: str) -> Dict[str, float]:
+    stages = {}
+    for entry in filter(None, (part.strip() for part in header.split(","))):
+        name, _, duration = entry.partition(";dur=")
+        if duration:
+            stages[name] = float(duration)
+    return stages
+
+
+async def _measure(client: httpx.AsyncClient, requests: List[dict]) -> dict:
+    latencies, sizes, stages, messages = [], [], defaultdict(list), defaultdict(int)
+    for request in requests:
+        built = client.build_request("POST", f"{settings.API_V1_PREFIX}/auth/authenticate", **request)
+        body = built.read()
+        start = time.perf_counter()
+        response = await client.send(built)
+        latencies.append(time.perf_counter() - start)
+        sizes.append(len(body))
+        for name, duration in _server_timing(response.headers.get("server-timing", "")).items():
+            stages[name].append(duration)
+        messages[response.json().get("message") or response.json().get("detail")] += 1
+    return {"latencies": sorted(latencies), "sizes": sizes, "stages": stages, "messages": messages}
+
+
+def _report(mode: str, result: dict) -> None:
+    latencies = result["latencies"]
+    p = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+    stages = "  ".join(
+        f"{name}={statistics.median(values):.1f}" for name, values in result["stages"].items() if name != "total"
+    )
+    print(
+        f"{mode:<5} {statistics.mean(result['sizes']) / 1024:8.1f} KiB/request  "
+        f"p50={p(0.5):7.1f}ms  p95={p(0.95):7.1f}ms  stages(ms, p50): {stages}"
+    )
+    for message, count in result["messages"].items():
+        print(f"      {count:>4} x {message}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Bandwidth and latency of the full vs roi upload modes.")
+    parser.add_argument("--requests", type=int, default=20, help="Authentications per mode.")
+    parser.add_argument("--frames", type=int, default=settings.SPOOF_CHECK_FRAMES, help="Frames per request.")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    captures = [
+        synthetic_frames(rng, args.frames, quality=92, motion=30) for _ in range(args.requests)
+    ]
+    full = [{"files": [("files", (f"frame_{i}.jpg", f, "image/jpeg")) for i, f in enumerate(frames)]} for frames in captures]
+    roi = []
+    for frames in captures:
+        small, crops, boxes = zip(*(roi_capture(frame) for frame in frames))
+        roi.append({
+            "files": [("files", (f"frame_{i}.jpg", f, "image/jpeg")) for i, f in enumerate(small)]
+            + [("faces", (f"face_{i}.jpg", c, "image/jpeg")) for i, c in enumerate(crops)],
+            "data": {"boxes": json.dumps(boxes)},
+        })
+
+    from app.main import app
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        await _measure(client, full[:1])  # load models and the gallery outside the measurement
+        for mode, requests in (("full", full), ("roi", roi)):
+            _report(mode, await _measure(client, requests))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
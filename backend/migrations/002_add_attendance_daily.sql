@@ -0,0 +1,24 @@
+-- Run this once to add the attendance_daily rollup table (per user, per day, completed sessions).
+-- New deployments get the table from `python -m scripts.migrate`; this file is for existing databases.
+
+-- 1. Create the rollup table
+CREATE TABLE IF NOT EXISTS attendance_daily (
+  user_id UUID NOT NULL REFERENCES app_users(user_id),
+  date VARCHAR(10) NOT NULL,
+  session_count INTEGER NOT NULL DEFAULT 0,
+  total_seconds INTEGER NOT NULL DEFAULT 0,
+  first_in TIMESTAMP WITH TIME ZONE,
+  last_out TIMESTAMP WITH TIME ZONE,
+  updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+  PRIMARY KEY (user_id, date)
+);
+CREATE INDEX IF NOT EXISTS ix_attendance_daily_date ON attendance_daily (date);
+
+-- 2. Backfill from existing attendance (same as: python -m scripts.rebuild_attendance_daily)
+INSERT INTO attendance_daily (user_id, date, session_count, total_seconds, first_in, last_out)
+SELECT user_id, date, count(*), sum(floor(extract(epoch FROM punch_out_time - punch_in_time))),
+       min(punch_in_time), max(punch_out_time)
+FROM attendance
+WHERE punch_in_time IS NOT NULL AND punch_out_time IS NOT NULL
+GROUP BY user_id, date
+ON CONFLICT (user_id, date) DO NOTHING;
@@ -0,0 +1,8 @@
+-- Adaptive face templates: encodings learned from confident logins, kept next to the
+-- registration encodings. Same as: python -m scripts.migrate
+
+CREATE SEQUENCE IF NOT EXISTS template_version_seq;
+
+ALTER TABLE app_users ADD COLUMN IF NOT EXISTS adapted_encodings TEXT[] NOT NULL DEFAULT '{}';
+ALTER TABLE app_users ADD COLUMN IF NOT EXISTS templates_version BIGINT;
+CREATE INDEX IF NOT EXISTS ix_app_users_templates_version ON app_users (templates_version);
@@ -0,0 +1,11 @@
+-- Stored responses for requests sent with an Idempotency-Key header (punch, authenticate).
+-- Same as: python -m scripts.migrate
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+  key VARCHAR(300) PRIMARY KEY,            -- "<endpoint>:<client key>"
+  request_hash VARCHAR(64) NOT NULL,       -- sha256 of the request body
+  status_code INTEGER,                     -- NULL while the first request is running
+  response_body TEXT,                      -- JSON
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS ix_idempotency_keys_created_at ON idempotency_keys (created_at);
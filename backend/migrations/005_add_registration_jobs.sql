@@ -0,0 +1,14 @@
+-- Background registration jobs (POST /auth/register answers 202 + job id).
+-- Same as: python -m scripts.migrate
+
+CREATE TABLE IF NOT EXISTS registration_jobs (
+  job_id UUID PRIMARY KEY,
+  status VARCHAR(20) NOT NULL,             -- queued | running | succeeded | failed
+  username VARCHAR(100) NOT NULL,
+  message TEXT,
+  user_id UUID,                            -- the registered user once succeeded
+  user_number INTEGER,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS ix_registration_jobs_created_at ON registration_jobs (created_at);
@@ -0,0 +1,47 @@
+"""
+Rebuild the on-disk face gallery snapshot from the database.
+
+Workers memory-map this snapshot at startup and only load users registered after it, so run
+this after bulk enrollment or imports (or periodically from cron) to keep worker boot fast.
+
+Run from the backend folder WITH THE VENV ACTIVE:
+
+    python -m scripts.build_gallery_snapshot
+"""
+import sys
+import time
+from pathlib import Path
+
+# Ensure backend/app is on path when run as python -m scripts.build_gallery_snapshot
+backend_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_root))
+
+try:
+    from app.database import SessionLocal
+    from app.services.gallery_service import build_state, write_snapshot
+except ModuleNotFoundError as e:
+    print("Error: Dependencies not found. Run this script using the backend venv:")
+    print("  .\\venv\\Scripts\\python.exe -m scripts.build_gallery_snapshot")
+    print("Or activate the venv first: .\\venv\\Scripts\\activate")
+    sys.exit(1)
+
+
+def main():
+    start = time.perf_counter()
+    db = SessionLocal()
+    try:
+        state = build_state(db)
+        path = write_snapshot(state, wait=True)
+        print(
+            f"Wrote {path.name}: {len(state.user_ids)} users, {state.encoding_count} encodings, "
+            f"high-water user_number {state.high_water} ({time.perf_counter() - start:.1f}s)."
+        )
+    except Exception as e:
+        print(f"Error: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Bulk-load synthetic users and attendance history for performance work at production scale.
+
+Users get random but well-formed face encodings (3 per user, 128-d, same JSON format as
+registration), so recognition, duplicate checks and exports see realistic row sizes. Attendance
+is generated per working day with a configurable number of closed sessions per person. Rows are
+streamed into Postgres with COPY, then the attendance_daily rollup is rebuilt for the range.
+
+Adds to what is already in the database (user numbers continue after the current maximum);
+use scripts.reset_users first for a clean slate.
+
+Run from the backend folder WITH THE VENV ACTIVE:
+
+    python -m scripts.generate_fixtures                                   # 50k users, 1 year, 2 sessions/day
+    python -m scripts.generate_fixtures --users 1000 --days 30 --sessions-per-day 3
+    python -m scripts.generate_fixtures --users 0 --days 90               # only more attendance for existing users
+"""
+import argparse
+import asyncio
+import csv
+import io
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+# Ensure backend/app is on path when run as python -m scripts.generate_fixtures
+backend_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_root))
+
+try:
+    import numpy as np
+    from sqlalchemy import func, select
+
+    from app.database import AsyncSessionLocal, SessionLocal, engine
+    from app.models.user import User
+    from app.services.attendance_service import AttendanceService, _seconds_to_hhmmss
+    from app.services.data_version_service import DataVersionService
+    from app.services.gallery_service import build_state, write_snapshot
+    from benchmarks.synthetic import random_gallery
+    from scripts.migrate import migrate
+except ModuleNotFoundError as e:
+    print("Error: Dependencies not found. Run this script using the backend venv:")
+    print("  .\\venv\\Scripts\\python.exe -m scripts.generate_fixtures")
+    print("Or activate the venv first: .\\venv\\Scripts\\activate")
+    sys.exit(1)
+
+FIRST_NAMES = [
+    "Aarav", "Aisha", "Ana", "Ben", "Chen", "Diego", "Elena", "Fatima", "Grace", "Hiro",
+    "Ivan", "Jia", "Kofi", "Lena", "Maya", "Noah", "Omar", "Priya", "Rahul", "Sara",
+    "Tomas", "Uma", "Wei", "Yusuf", "Zoe",
+]
+LAST_NAMES = [
+    "Ali", "Brown", "Costa", "Das", "Evans", "Garcia", "Gupta", "Ivanova", "Kim", "Kumar",
+    "Lee", "Mensah", "Nguyen", "Okafor", "Patel", "Rossi", "Sato", "Schmidt", "Silva", "Singh",
+]
+
+# Rows per COPY chunk sent to the server
+COPY_BATCH_ROWS = 100_000
+
+
+def _uuids(rng: np.random.Generator, count: int):
+    """count random version-4 UUID strings (much faster than uuid.uuid4() in a loop)."""
+    raw = rng.integers(0, 256, size=(count, 16), dtype=np.uint8)
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+    hex_all = raw.tobytes().hex()
+    for i in range(0, len(hex_all), 32):
+        h = hex_all[i:i + 32]
+        yield f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+def _copy(raw_connection, table: str, columns, batches) -> int:
+    """COPY batches (lists of tuples) into table, sending about COPY_BATCH_ROWS rows per COPY. Returns rows copied."""
+    statement = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    cursor = raw_connection.cursor()
+    # Timestamps are generated without an offset: read them as UTC
+    cursor.execute("SET TIME ZONE 'UTC'")
+    total = 0
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    pending = 0
+
+    def send():
+        buffer.seek(0)
+        cursor.copy_expert(statement, buffer)
+
+    for batch in batches:
+        pending += len(batch)
+        writer.writerows(batch)
+        if pending >= COPY_BATCH_ROWS:
+            send()
+            total += pending
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            pending = 0
+    if pending:
+        send()
+        total += pending
+    cursor.close()
+    return total
+
+
+def _user_rows(rng, count: int, first_number: int, encodings_per_user: int, user_ids):
+    """Batches of (user_id, user_number, username, face_encodings array literal)."""
+    chunk = 10_000
+    for start in range(0, count, chunk):
+        gallery = random_gallery(rng, min(chunk, count - start), encodings_per_user)
+        batch = []
+        for offset, encodings in enumerate(gallery):
+            number = first_number + start + offset
+            username = f"{FIRST_NAMES[number % len(FIRST_NAMES)]} {LAST_NAMES[(number // len(FIRST_NAMES)) % len(LAST_NAMES)]} {number}"
+            # Postgres text[] literal; encodings contain no quotes or backslashes
+            array_literal = "{" + ",".join(f'"{e}"' for e in encodings) + "}"
+            batch.append((user_ids[start + offset], number, username, array_literal))
+        yield batch
+
+
+def _attendance_rows(rng, user_ids, days, sessions_per_day: int, attendance_rate: float):
+    """
+    One batch of closed sessions per working day: first punch-in around 08:00-10:00 UTC,
+    1-5 hour sessions with 10-60 minute breaks. Timestamps are computed with numpy per day.
+    """
+    user_ids = np.array(user_ids, dtype=object)
+    durations = {}
+    for day in days:
+        present = np.flatnonzero(rng.random(len(user_ids)) < attendance_rate)
+        if not len(present):
+            continue
+        lengths = rng.integers(3600, 5 * 3600, size=(len(present), sessions_per_day))
+        breaks = rng.integers(10 * 60, 60 * 60, size=(len(present), sessions_per_day))
+        first_in = rng.integers(8 * 3600, 10 * 3600, size=(len(present), 1))
+        # Seconds since midnight of each punch-in: first_in, then previous end + break
+        offsets = first_in + np.hstack([
+            np.zeros((len(present), 1), dtype=np.int64),
+            np.cumsum(lengths + breaks, axis=1)[:, :-1],
+        ])
+        midnight = np.datetime64(day.isoformat(), "s")
+        punch_in = np.datetime_as_string(midnight + offsets.ravel().astype("timedelta64[s]"), unit="s")
+        punch_out = np.datetime_as_string(midnight + (offsets + lengths).ravel().astype("timedelta64[s]"), unit="s")
+        total = [durations.get(n) or durations.setdefault(n, _seconds_to_hhmmss(n)) for n in lengths.ravel().tolist()]
+        n_rows = len(punch_in)
+        yield list(zip(
+            _uuids(rng, n_rows),
+            np.repeat(user_ids[present], sessions_per_day).tolist(),
+            punch_in.tolist(),
+            punch_out.tolist(),
+            total,
+            [day.isoformat()] * n_rows,
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load synthetic users and attendance with COPY.")
+    parser.add_argument("--users", type=int, default=50_000, help="New users to create.")
+    parser.add_argument("--days", type=int, default=365, help="Days of history, ending yesterday.")
+    parser.add_argument("--sessions-per-day", type=int, default=2, help="Closed sessions per person per working day.")
+    parser.add_argument("--attendance-rate", type=float, default=0.9, help="Share of users present on a working day.")
+    parser.add_argument("--encodings-per-user", type=int, default=3)
+    parser.add_argument("--include-weekends", action="store_true", help="Also generate attendance on Sat/Sun.")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    migrate()
+
+    db = SessionLocal()
+    try:
+        first_number = (db.scalar(select(func.max(User.user_number))) or 0) + 1
+        existing_ids = [str(uid) for uid in db.scalars(select(User.user_id))]
+    finally:
+        db.close()
+
+    start = time.perf_counter()
+    raw = engine.raw_connection()
+    try:
+        new_ids = list(_uuids(rng, args.users))
+        copied_users = _copy(
+            raw, "app_users", ["user_id", "user_number", "username", "face_encodings"],
+            _user_rows(rng, args.users, first_number, args.encodings_per_user, new_ids),
+        )
+        raw.commit()
+        print(f"Users: {copied_users} copied in {time.perf_counter() - start:.1f}s")
+
+        user_ids = existing_ids + new_ids
+        end_day = date.today() - timedelta(days=1)
+        days = [end_day - timedelta(days=n) for n in range(args.days - 1, -1, -1)]
+        if not args.include_weekends:
+            days = [d for d in days if d.weekday() < 5]
+        copied_rows = 0
+        if user_ids and days:
+            attendance_start = time.perf_counter()
+            copied_rows = _copy(
+                raw, "attendance",
+                ["attendance_id", "user_id", "punch_in_time", "punch_out_time", "total_duration", "date"],
+                _attendance_rows(rng, user_ids, days, args.sessions_per_day, args.attendance_rate),
+            )
+            raw.commit()
+            print(f"Attendance: {copied_rows} rows over {len(days)} days copied in {time.perf_counter() - attendance_start:.1f}s")
+
+        cursor = raw.cursor()
+        cursor.execute("ANALYZE app_users")
+        cursor.execute("ANALYZE attendance")
+        raw.commit()
+        cursor.close()
+    except Exception as e:
+        raw.rollback()
+        print(f"Error: {e}")
+        raise
+    finally:
+        raw.close()
+
+    if copied_rows:
+        async def rebuild():
+            async with AsyncSessionLocal() as session:
+                written = await AttendanceService.rebuild_daily_rollup(session, days[0].isoformat(), days[-1].isoformat())
+                await session.commit()
+                return written
+
+        rollup_start = time.perf_counter()
+        written = asyncio.run(rebuild())
+        print(f"attendance_daily: {written} user-day rows rebuilt in {time.perf_counter() - rollup_start:.1f}s")
+
+    db = SessionLocal()
+    try:
+        DataVersionService.bump_sync(db)
+        if copied_users:
+            snapshot_start = time.perf_counter()
+            snapshot = write_snapshot(build_state(db), wait=True)
+            print(f"Gallery snapshot {snapshot.name} written in {time.perf_counter() - snapshot_start:.1f}s")
+    finally:
+        db.close()
+    print(f"Done in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
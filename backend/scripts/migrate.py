@@ -0,0 +1,82 @@
+"""
+Create or upgrade the database schema.
+
+The API no longer touches the schema when it starts; run this once per deploy (Procfile
+release phase, container entrypoint, start.sh) before starting the workers. Safe to re-run.
+An empty attendance_daily next to existing attendance rows is backfilled from them.
+
+Run from the backend folder WITH THE VENV ACTIVE:
+
+    python -m scripts.migrate
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# Ensure backend/app is on path when run as python -m scripts.migrate
+backend_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_root))
+
+try:
+    from sqlalchemy import exists, select, text
+
+    import app.models  # noqa: F401  (registers every table on Base.metadata)
+    import app.services.data_version_service  # noqa: F401  (registers data_version_seq)
+    from app.database import AsyncSessionLocal, Base, engine
+    from app.models.attendance import Attendance
+    from app.models.attendance_daily import AttendanceDaily
+    from app.services.attendance_service import AttendanceService
+except ModuleNotFoundError as e:
+    print("Error: Dependencies not found. Run this script using the backend venv:")
+    print("  .\\venv\\Scripts\\python.exe -m scripts.migrate")
+    print("Or activate the venv first: .\\venv\\Scripts\\activate")
+    sys.exit(1)
+
+
+def migrate(bind=engine) -> None:
+    """Create missing tables/sequences and apply in-place column upgrades."""
+    Base.metadata.create_all(bind=bind)
+    # Ensure user_number column exists (for DBs created before it was added)
+    with bind.begin() as conn:
+        conn.execute(text("ALTER TABLE app_users ADD COLUMN IF NOT EXISTS user_number INTEGER UNIQUE"))
+        # Adaptive face templates (see migrations/003_add_adaptive_templates.sql)
+        conn.execute(text("ALTER TABLE app_users ADD COLUMN IF NOT EXISTS adapted_encodings TEXT[] NOT NULL DEFAULT '{}'"))
+        conn.execute(text("ALTER TABLE app_users ADD COLUMN IF NOT EXISTS templates_version BIGINT"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_app_users_templates_version ON app_users (templates_version)"))
+    backfill_daily_rollup(bind)
+
+
+def backfill_daily_rollup(bind=engine) -> None:
+    """
+    Fill attendance_daily from raw attendance when it is empty but attendance is not (the table
+    was just added to an existing database), so /attendance/report covers earlier days too.
+    """
+    with bind.connect() as conn:
+        needed = conn.scalar(select(~exists(select(AttendanceDaily.user_id)) & exists(select(Attendance.attendance_id))))
+    if not needed:
+        return
+
+    async def rebuild() -> int:
+        async with AsyncSessionLocal() as db:
+            written = await AttendanceService.rebuild_daily_rollup(db)
+            await db.commit()
+            return written
+
+    start = time.perf_counter()
+    written = asyncio.run(rebuild())
+    print(f"attendance_daily backfilled: {written} user-day row(s) in {time.perf_counter() - start:.1f}s.")
+
+
+def main():
+    start = time.perf_counter()
+    try:
+        migrate()
+    except Exception as e:
+        print(f"Error: {e}")
+        raise
+    print(f"Schema up to date ({time.perf_counter() - start:.1f}s).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Backfill or rebuild the attendance_daily rollup table from raw attendance rows.
+
+punch_out keeps attendance_daily up to date on its own; run this once after upgrading
+(to backfill history), after bulk imports, or whenever raw rows were edited by hand.
+
+Run from the backend folder WITH THE VENV ACTIVE:
+
+    python -m scripts.rebuild_attendance_daily
+    python -m scripts.rebuild_attendance_daily --start-date 2024-01-01 --end-date 2024-01-31
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+# Ensure backend/app is on path when run as python -m scripts.rebuild_attendance_daily
+backend_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_root))
+
+try:
+    from app.database import AsyncSessionLocal, engine
+    from app.models.attendance_daily import AttendanceDaily
+    from app.services.attendance_service import AttendanceService
+except ModuleNotFoundError as e:
+    print("Error: Dependencies not found. Run this script using the backend venv:")
+    print("  .\\venv\\Scripts\\python.exe -m scripts.rebuild_attendance_daily")
+    print("Or activate the venv first: .\\venv\\Scripts\\activate")
+    sys.exit(1)
+
+
+async def rebuild(start_date, end_date):
+    async with AsyncSessionLocal() as db:
+        try:
+            written = await AttendanceService.rebuild_daily_rollup(db, start_date, end_date)
+            await db.commit()
+            print(f"Rebuilt attendance_daily: {written} user-day row(s).")
+        except Exception as e:
+            await db.rollback()
+            print(f"Error: {e}")
+            raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the attendance_daily rollup table.")
+    parser.add_argument("--start-date", help="First date to rebuild (YYYY-MM-DD). Default: all dates.")
+    parser.add_argument("--end-date", help="Last date to rebuild (YYYY-MM-DD). Default: all dates.")
+    args = parser.parse_args()
+
+    # Create the table if this database predates it
+    AttendanceDaily.__table__.create(bind=engine, checkfirst=True)
+
+    asyncio.run(rebuild(args.start_date, args.end_date))
+
+
+if __name__ == "__main__":
+    main()
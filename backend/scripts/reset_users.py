@@ -20,7 +20,10 @@ sys.path.insert(0, str(backend_root))
 try:
     from app.database import SessionLocal
     from app.models.attendance import Attendance
+    from app.models.attendance_daily import AttendanceDaily
     from app.models.user import User
+    from app.services.data_version_service import DataVersionService
+    from app.services.gallery_service import delete_snapshot
 except ModuleNotFoundError as e:
     print("Error: Dependencies not found. Run this script using the backend venv:")
     print("  .\\venv\\Scripts\\python.exe -m scripts.reset_users")
@@ -31,9 +34,12 @@ except ModuleNotFoundError as e:
 def main():
     db = SessionLocal()
     try:
+        db.query(AttendanceDaily).delete()
         deleted_attendance = db.query(Attendance).delete()
         deleted_users = db.query(User).delete()
         db.commit()
+        DataVersionService.bump_sync(db)
+        delete_snapshot()
         print(f"Deleted {deleted_attendance} attendance record(s) and {deleted_users} user(s).")
         print("You can register again; new users will get User ID 1, 2, 3...")
     except Exception as e:
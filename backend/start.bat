@@ -14,6 +14,10 @@ REM Install dependencies
 echo Installing dependencies...
 pip install -r requirements.txt
 
+REM Create/upgrade the database schema
+echo Migrating database...
+python -m scripts.migrate
+
 REM Run the application
 echo Starting server...
 uvicorn app.main:app --reload --host 0.0.0.0 --port 8000
@@ -16,6 +16,10 @@ source venv/bin/activate
 echo "Installing dependencies..."
 pip install -r requirements.txt
 
+# Create/upgrade the database schema
+echo "Migrating database..."
+python -m scripts.migrate
+
 # Run the application
 echo "Starting server..."
 uvicorn app.main:app --reload --host 0.0.0.0 --port 8000
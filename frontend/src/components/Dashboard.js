@@ -1,10 +1,10 @@
 import React, { useMemo, useState, useEffect } from 'react';
-import { getTotalUsers, getTodayAttendance, exportAttendanceCSV, getUserAttendanceByNumber, getAttendanceByDate, getUsers, getDailySummary } from '../services/api';
+import { getTodayStats, getTodayAttendance, exportAttendanceCSV, getUserAttendanceByNumber, getAttendanceByDate, getUsers, getDailySummary } from '../services/api';
 import AttendanceTable from './AttendanceTable';
 
 const Dashboard = () => {
-  const [totalUsers, setTotalUsers] = useState(0);
-  const [allUsers, setAllUsers] = useState([]);
+  const [stats, setStats] = useState(null);
+  const [allUsers, setAllUsers] = useState(null); // loaded only when the Absent list is shown
   const [todayAttendance, setTodayAttendance] = useState([]);
   const [todayFilter, setTodayFilter] = useState('all'); // all | active | punched_out | absent
   const [lookupUserNumber, setLookupUserNumber] = useState('');
@@ -25,14 +25,13 @@ const Dashboard = () => {
     try {
       setLoading(true);
       setError(null);
-      const [usersRes, attendanceRes, allUsersRes] = await Promise.all([
-        getTotalUsers(),
+      const [statsRes, attendanceRes] = await Promise.all([
+        getTodayStats(),
         getTodayAttendance(),
-        getUsers(),
       ]);
-      setTotalUsers(usersRes.data.total_users);
+      setStats(statsRes.data);
       setTodayAttendance(attendanceRes.data);
-      setAllUsers(allUsersRes.data || []);
+      setAllUsers(null);
     } catch (err) {
       const msg = err.response?.status === 500
         ? 'Server error. Ensure the backend is running and the database has the latest schema.'
@@ -46,6 +45,16 @@ const Dashboard = () => {
     }
   };
 
+  useEffect(() => {
+    if (todayFilter !== 'absent' || allUsers !== null) return;
+    getUsers()
+      .then((res) => setAllUsers(res.data || []))
+      .catch((err) => {
+        setAllUsers([]);
+        console.error(err);
+      });
+  }, [todayFilter, allUsers]);
+
   const todayKey = useMemo(() => new Date().toISOString().split('T')[0], []);
 
   const activeToday = useMemo(
@@ -186,21 +195,21 @@ const Dashboard = () => {
 
       <div className="stats-grid">
         <div className="stat-card">
-          <h3>{totalUsers}</h3>
+          <h3>{stats?.total_users ?? 0}</h3>
           <p>Total Users</p>
         </div>
         <div className="stat-card">
-          <h3>{todayAttendance.length}</h3>
+          <h3>{stats?.today_attendance ?? 0}</h3>
           <p>Today's Attendance</p>
         </div>
         <div className="stat-card">
           <h3>
-            {activeToday.length}
+            {stats?.active ?? 0}
           </h3>
           <p>Currently Active</p>
         </div>
         <div className="stat-card">
-          <h3>{absentToday.length}</h3>
+          <h3>{stats?.absent ?? 0}</h3>
           <p>Absent Today</p>
         </div>
       </div>
@@ -227,7 +236,7 @@ const Dashboard = () => {
             Punched Out ({punchedOutToday.length})
           </button>
           <button className={`btn ${todayFilter === 'absent' ? 'btn-primary' : 'btn-secondary'}`} onClick={() => setTodayFilter('absent')}>
-            Absent ({absentToday.length})
+            Absent ({stats?.absent ?? 0})
           </button>
         </div>
         <AttendanceTable
@@ -1,9 +1,15 @@
 import React, { useState, useRef, useEffect } from 'react';
-import { authenticateFace, punchAttendance } from '../services/api';
+import { authenticateFace, getCaptureProfile, punchAttendance } from '../services/api';
 
 const SPOOF_FRAME_COUNT = 5;
 const SPOOF_FRAME_INTERVAL_MS = 400;
 
+// roi upload mode (downscaled frame + face crop per capture) needs the browser's face detector
+const faceDetectorSupported = typeof window !== 'undefined' && 'FaceDetector' in window;
+
+const toJpeg = (canvas, quality) =>
+  new Promise((resolve) => canvas.toBlob((blob) => resolve(blob), 'image/jpeg', quality));
+
 const FaceAuth = ({ onSuccess }) => {
   const [stream, setStream] = useState(null);
   const [capturedFrames, setCapturedFrames] = useState([]);
@@ -11,8 +17,21 @@ const FaceAuth = ({ onSuccess }) => {
   const [authResult, setAuthResult] = useState(null);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
+  const [captureProfile, setCaptureProfile] = useState(null); // set when the roi mode is used
   const videoRef = useRef(null);
   const canvasRef = useRef(null);
+  const detectorRef = useRef(null);
+  const attemptRef = useRef(0); // authentication attempts since the last successful login
+
+  // Ask the server for the roi mode resolution; without it (or a face detector) send full frames
+  useEffect(() => {
+    if (!faceDetectorSupported) return;
+    getCaptureProfile()
+      .then((response) => {
+        if (response.data.modes?.includes('roi')) setCaptureProfile(response.data);
+      })
+      .catch(() => {});
+  }, []);
 
   // Attach stream to video element after it's in the DOM (ref is set)
   useEffect(() => {
@@ -74,6 +93,49 @@ const FaceAuth = ({ onSuccess }) => {
     });
   };
 
+  // One roi capture: { frame, face, box } or null when no face is in view.
+  // Both images are cut from the same drawn video frame, so the server can match them up.
+  const captureRoiFrame = async () => {
+    const video = videoRef.current;
+    const width = video.videoWidth;
+    const height = video.videoHeight;
+    const full = canvasRef.current;
+    full.width = width;
+    full.height = height;
+    full.getContext('2d').drawImage(video, 0, 0);
+
+    if (!detectorRef.current) {
+      detectorRef.current = new window.FaceDetector({ fastMode: true, maxDetectedFaces: 1 });
+    }
+    const faces = await detectorRef.current.detect(full);
+    if (!faces.length) return null;
+
+    // Square crop around the face with roi_margin per side, kept inside the frame
+    const { x, y, width: w, height: h } = faces[0].boundingBox;
+    const side = Math.min(Math.round(Math.max(w, h) * (1 + 2 * captureProfile.roi_margin)), width, height);
+    const left = Math.min(Math.max(0, Math.round(x + w / 2 - side / 2)), width - side);
+    const top = Math.min(Math.max(0, Math.round(y + h / 2 - side / 2)), height - side);
+
+    const scale = Math.min(1, captureProfile.frame_max_side / Math.max(width, height));
+    const small = document.createElement('canvas');
+    small.width = Math.round(width * scale);
+    small.height = Math.round(height * scale);
+    small.getContext('2d').drawImage(full, 0, 0, small.width, small.height);
+
+    const crop = document.createElement('canvas');
+    crop.width = captureProfile.roi_size;
+    crop.height = captureProfile.roi_size;
+    crop.getContext('2d').drawImage(full, left, top, side, side, 0, 0, crop.width, crop.height);
+
+    const [frame, face] = await Promise.all([
+      toJpeg(small, captureProfile.jpeg_quality),
+      toJpeg(crop, captureProfile.jpeg_quality),
+    ]);
+    if (!frame || !face) return null;
+    const box = [left, top, side, side].map((v) => Math.round(v * scale));
+    return { frame, face, box };
+  };
+
   const captureAndAuthenticate = async () => {
     if (!videoRef.current || !canvasRef.current) {
       setError('Camera not ready');
@@ -84,14 +146,34 @@ const FaceAuth = ({ onSuccess }) => {
     setCapturedFrames([]);
 
     const frames = [];
+    let roi = captureProfile ? { faces: [], boxes: [] } : null;
 
     // Capture SPOOF_FRAME_COUNT frames with short delay (allows natural movement)
     for (let i = 0; i < SPOOF_FRAME_COUNT; i++) {
       setCapturingStep(i + 1);
-      const blob = await captureSingleFrame();
-      if (blob) {
-        frames.push(blob);
-        setCapturedFrames([...frames]);
+      if (roi) {
+        try {
+          const capture = await captureRoiFrame();
+          if (capture) {
+            frames.push(capture.frame);
+            roi.faces.push(capture.face);
+            roi.boxes.push(capture.box);
+            setCapturedFrames([...frames]);
+          }
+        } catch (err) {
+          // Face detector present but unusable here: full frames from now on
+          console.warn('Face detector unavailable, sending full frames', err);
+          setCaptureProfile(null);
+          roi = null;
+          frames.length = 0;
+        }
+      }
+      if (!roi) {
+        const blob = await captureSingleFrame();
+        if (blob) {
+          frames.push(blob);
+          setCapturedFrames([...frames]);
+        }
       }
       if (i < SPOOF_FRAME_COUNT - 1) {
         await new Promise((r) => setTimeout(r, SPOOF_FRAME_INTERVAL_MS));
@@ -108,9 +190,11 @@ const FaceAuth = ({ onSuccess }) => {
     try {
       setLoading(true);
       setError(null);
-      const response = await authenticateFace(frames);
+      attemptRef.current += 1;
+      const response = await authenticateFace(frames, roi, attemptRef.current);
 
       if (response.data.success) {
+        attemptRef.current = 0;
         setAuthResult(response.data);
       } else {
         setError(response.data.message || 'Authentication failed');
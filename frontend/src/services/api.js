@@ -9,45 +9,107 @@ const api = axios.create({
   },
 });
 
+const newIdempotencyKey = () => {
+  if (window.crypto?.randomUUID) return window.crypto.randomUUID();
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}-${Math.random().toString(36).slice(2)}`;
+};
+
+// The server sheds face requests with 503 + Retry-After when busy (e.g. shift change):
+// wait as told and try again a few times before surfacing the error.
+// With idempotent = true the request carries an Idempotency-Key (the same on every attempt),
+// so it is also retried when the response was lost (network error) or the first attempt is
+// still running (409): the server executes it at most once and replays the stored result.
+const withRetryAfter = async (request, retries = 2, idempotent = false) => {
+  const headers = idempotent ? { 'Idempotency-Key': newIdempotencyKey() } : {};
+  for (let attempt = 0; ; attempt += 1) {
+    try {
+      return await request(headers);
+    } catch (err) {
+      const status = err.response?.status;
+      const retryAfter = Number(err.response?.headers?.['retry-after']) || (idempotent && !err.response ? 1 : 0);
+      const retryable = status === 503 || (idempotent && (status === 409 || !err.response));
+      if (!retryable || attempt >= retries || !retryAfter) throw err;
+      await new Promise((resolve) => setTimeout(resolve, Math.min(retryAfter, 10) * 1000));
+    }
+  }
+};
+
 // User APIs
 export const getUsers = () => api.get('/users/');
 export const getUser = (userId) => api.get(`/users/${userId}`);
 export const getTotalUsers = () => api.get('/users/count/total');
-export const registerUser = (username, files) => {
+// Registration is accepted with 202 + job id and encoded in the background: poll the job and
+// resolve like the synchronous API did ({ data: { user_id, user_number, username, ... } }).
+const waitForRegistrationJob = async (jobId, intervalMs = 1000, timeoutMs = 300000) => {
+  const path = `/auth/register/jobs/${jobId}`;
+  const deadline = Date.now() + timeoutMs;
+  for (;;) {
+    const response = await api.get(path);
+    if (response.data.status === 'succeeded') return response;
+    if (response.data.status === 'failed') {
+      const error = new Error(response.data.message);
+      error.response = { ...response, status: 400, data: { detail: response.data.message } };
+      throw error;
+    }
+    if (Date.now() > deadline) {
+      const detail = 'Registration is taking too long. Please check the user list later.';
+      const error = new Error(detail);
+      error.response = { status: 408, data: { detail } };
+      throw error;
+    }
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+};
+
+export const registerUser = async (username, files) => {
   const formData = new FormData();
   formData.append('username', username);
   files.forEach((file, index) => {
     const name = file.name || `capture_${index + 1}.jpg`;
     formData.append('files', file, name);
   });
-  return api.post('/auth/register', formData, {
+  const response = await withRetryAfter(() => api.post('/auth/register', formData, {
     headers: {
       'Content-Type': 'multipart/form-data',
     },
-  });
+  }));
+  // 200: server runs with REGISTRATION_ASYNC=false and answered with the user directly
+  if (response.status !== 202) return response;
+  return waitForRegistrationJob(response.data.job_id);
 };
 
 // Authentication APIs
-// Pass a single file (no spoof) or an array of 3+ files (spoof/liveness check then face match)
-export const authenticateFace = (fileOrFiles) => {
+// Upload modes and roi capture resolution offered by the server
+export const getCaptureProfile = () => api.get('/auth/capture-profile');
+
+// Pass a single file (no spoof) or an array of 3+ files (spoof/liveness check then face match).
+// roi mode: files are downscaled frames and roi = { faces: [crop per frame], boxes: [[x, y, w, h] per frame] }
+// attempt: 1 for the first try of a login, +1 per retry (the server reports retries per successful login)
+export const authenticateFace = (fileOrFiles, roi = null, attempt = null) => {
   const formData = new FormData();
   const files = Array.isArray(fileOrFiles) ? fileOrFiles : [fileOrFiles];
   files.forEach((file, index) => {
     const name = file.name || `frame_${index + 1}.jpg`;
     formData.append('files', file, name);
   });
-  return api.post('/auth/authenticate', formData, {
+  if (roi) {
+    roi.faces.forEach((face, index) => formData.append('faces', face, `face_${index + 1}.jpg`));
+    formData.append('boxes', JSON.stringify(roi.boxes));
+  }
+  return withRetryAfter((idempotencyHeaders) => api.post('/auth/authenticate', formData, {
     headers: {
       'Content-Type': 'multipart/form-data',
+      ...(attempt ? { 'X-Auth-Attempt': String(attempt) } : {}),
+      ...idempotencyHeaders,
     },
-  });
+  }), 2, true);
 };
 
 export const punchAttendance = (userId, action) => {
-  return api.post('/auth/punch', {
+  return withRetryAfter((idempotencyHeaders) => api.post('/auth/punch', {
     user_id: userId,
     action: action, // 'punch_in' or 'punch_out'
-  });
+  }, { headers: idempotencyHeaders }), 2, true);
 };
 
 // Attendance APIs
@@ -70,6 +132,9 @@ export const getAttendanceByDate = (date, limit = 500) => {
 export const getDailySummary = (date) =>
   api.get(`/attendance/daily-summary?date=${encodeURIComponent(date)}`);
 
+// Dashboard stats (all counters in one cached call)
+export const getTodayStats = () => api.get('/stats/today');
+
 // Export APIs
 export const exportAttendanceCSV = (startDate, endDate) => {
   const params = new URLSearchParams();